@@ -0,0 +1,220 @@
+"""
+Persistent cache of probed kit information.
+
+Reading kit name, target device and extension information requires talking to each kit, while these values almost
+never change for a given kit.  The cache stores them on disk in the user cache directory, keyed by USB vendor ID,
+product ID and serial number, so that a warm scan only needs to enumerate the USB bus.
+
+Extensions found on the ID channels of kits can also be kept in memory by an ExtensionCache.  Scans only use one when
+it is given to them, and the KitWatcher keeps one for its lifetime, dropping the extensions of kits that are detached.
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+from logging import getLogger
+
+CACHE_FILENAME = "kitinfo-cache.json"
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 256
+
+
+class KitInfoCache():
+    """
+    On-disk cache of probed kit information
+
+    Entries older than ttl seconds are ignored and dropped, and when there are more than max_entries entries the
+    oldest ones are evicted.  The cache is loaded when created and only written back by save() if it was modified.
+
+    :param path: path to the cache file, defaults to a file in the user cache directory
+    :type path: str, optional
+    :param ttl: maximum age of an entry in seconds
+    :type ttl: int, optional
+    :param max_entries: maximum number of entries kept in the cache
+    :type max_entries: int, optional
+    :param refresh: if True existing entries are ignored, so all kits are probed again and their entries replaced
+    :type refresh: bool, optional
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, path=None, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+        self.logger = getLogger(__name__)
+        if path is None:
+            from appdirs import user_cache_dir # pylint: disable=import-outside-toplevel
+            path = os.path.join(user_cache_dir("pykitinfo", "Microchip"), CACHE_FILENAME)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._entries = self._load()
+
+    @staticmethod
+    def key(vendor_id, product_id, serial_number):
+        """
+        Make the cache key of a kit
+
+        :param vendor_id: USB vendor ID
+        :type vendor_id: int
+        :param product_id: USB product ID
+        :type product_id: int
+        :param serial_number: USB serial number
+        :type serial_number: str
+        :return: cache key, or None if the kit can't be cached because it has no serial number
+        :rtype: str
+        """
+        if not serial_number or serial_number == 'N/A':
+            return None
+        return "{:04X}:{:04X}:{}".format(vendor_id, product_id, serial_number)
+
+    def _load(self):
+        """
+        Load the cache file, ignoring files that are missing, unreadable or in an unknown format
+        """
+        try:
+            with open(self.path, 'rt', encoding='utf8') as file:
+                content = json.load(file)
+            if content.get('version') == CACHE_FORMAT_VERSION:
+                return content['entries']
+            self.logger.debug("Ignoring kit info cache with unknown format")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as exc:
+            self.logger.debug("Ignoring unreadable kit info cache '%s': %s", self.path, exc)
+        return {}
+
+    def _expired(self, entry, now):
+        return now - entry[0] > self.ttl
+
+    def get(self, key):
+        """
+        Look up cached kit information
+
+        :param key: cache key as made by key()
+        :type key: str
+        :return: cached kit information, or None if there is no valid entry
+        :rtype: dict
+        """
+        if key is None or self.refresh:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or self._expired(entry, time.time()):
+            return None
+        return entry[1]
+
+    def put(self, key, data):
+        """
+        Store kit information
+
+        :param key: cache key as made by key()
+        :type key: str
+        :param data: JSON serializable kit information
+        :type data: dict
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = [time.time(), data]
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the cache back to disk if it was modified, evicting expired and surplus entries
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            entries = {key: entry for key, entry in self._entries.items() if not self._expired(entry, now)}
+            if len(entries) > self.max_entries:
+                newest = sorted(entries, key=lambda key: entries[key][0], reverse=True)[:self.max_entries]
+                entries = {key: entries[key] for key in newest}
+            self._entries = entries
+            self._dirty = False
+            content = {'version': CACHE_FORMAT_VERSION, 'entries': entries}
+
+        temp_path = None
+        try:
+            directory = os.path.dirname(self.path)
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file and replace, so that concurrent readers never see a partial file
+            handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".kitinfo-cache-")
+            with os.fdopen(handle, 'wt', encoding='utf8') as file:
+                json.dump(content, file, separators=(',', ':'), ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as exc:
+            self.logger.warning("Unable to write kit info cache '%s': %s", self.path, exc)
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class ExtensionCache():
+    """
+    In-memory cache of the extensions found on the ID channels of kits
+
+    Entries are kept per kit serial number and channel, together with the connection they were read over.  When a
+    kit is seen over another connection, it has been reconnected and its entries are dropped.  As a kit can be
+    reconnected over the same connection, or have its extensions swapped while attached, a cache should only live as
+    long as something watching for detach, such as a KitWatcher, which drops the entries of detached kits.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kits = {}
+
+    def get(self, serial_number, connection, channels):
+        """
+        Look up the extensions of a kit
+
+        :param serial_number: kit serial number
+        :type serial_number: str
+        :param connection: identifies the current connection to the kit, such as its HID device path
+        :type connection: hashable
+        :param channels: ID channels to look up
+        :type channels: iterable of int
+        :return: extension records by channel, None for empty channels. Channels not cached are left out.
+        :rtype: dict
+        """
+        with self._lock:
+            entry = self._kits.get(serial_number)
+            if entry is None:
+                return {}
+            if entry[0] != connection:
+                # Reconnected since it was cached
+                del self._kits[serial_number]
+                return {}
+            return {channel: entry[1][channel] for channel in channels if channel in entry[1]}
+
+    def put(self, serial_number, connection, channel, extension):
+        """
+        Store the extension found on an ID channel of a kit
+
+        :param serial_number: kit serial number
+        :type serial_number: str
+        :param connection: identifies the current connection to the kit
+        :type connection: hashable
+        :param channel: ID channel
+        :type channel: int
+        :param extension: extension record, or None if there is no extension on the channel
+        :type extension: dict
+        """
+        if not serial_number:
+            return
+        with self._lock:
+            entry = self._kits.get(serial_number)
+            if entry is None or entry[0] != connection:
+                entry = self._kits[serial_number] = (connection, {})
+            entry[1][channel] = extension
+
+    def invalidate(self, serial_number):
+        """
+        Forget the extensions of a kit, for example when it is detached
+
+        :param serial_number: kit serial number
+        :type serial_number: str
+        """
+        with self._lock:
+            self._kits.pop(serial_number, None)
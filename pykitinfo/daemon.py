@@ -0,0 +1,356 @@
+"""
+Local kit inventory daemon.
+
+The daemon keeps an inventory of the connected kits, updated through hotplug events by a KitWatcher, and answers
+queries over a UNIX socket.  Many clients can then look up kits at the same time without enumerating the USB bus or
+opening kits that are in use.
+
+Each query is a JSON object on a single line, with optional filters combined with "and":
+
+- serial_number: the kit serial number ends with this value, like -s
+- serial_port: the kit's virtual serial port
+- kitname: the kit name, ignoring case
+
+The answer is a JSON object on a single line, with the matching kits under "kits", or an "error" message.  Several
+queries can be sent over one connection.
+"""
+import os
+import json
+import socket
+import socketserver
+import threading
+from logging import getLogger
+from .watch import KitWatcher, create_monitor, DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_TIME
+
+SOCKET_FILENAME = "pykitinfo.sock"
+SOCKET_ENVIRONMENT_VARIABLE = "PYKITINFO_SOCKET"
+
+# Filters a query can have
+QUERY_FIELDS = ('serial_number', 'serial_port', 'kitname')
+
+# Longest query accepted, in bytes without the newline.  Longer queries get an error and the connection is closed
+MAX_QUERY_SIZE = 4096
+# Time a query waits for the first scan of the daemon to complete
+READY_TIMEOUT = 30.0
+# Clients wait for the "not ready" answer rather than timing out while the daemon is waiting for its first scan
+DEFAULT_CLIENT_TIMEOUT = READY_TIMEOUT + 5.0
+
+_encoder = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+class DaemonError(Exception):
+    """
+    Error raised when the daemon can't be started or queried
+    """
+
+
+def default_socket_path():
+    """
+    Get the path of the daemon socket
+
+    :return: path from the PYKITINFO_SOCKET environment variable, or a file in the user cache directory
+    :rtype: str
+    """
+    path = os.environ.get(SOCKET_ENVIRONMENT_VARIABLE)
+    if path:
+        return path
+    from appdirs import user_cache_dir # pylint: disable=import-outside-toplevel
+    return os.path.join(user_cache_dir("pykitinfo", "Microchip"), SOCKET_FILENAME)
+
+
+def _check_platform():
+    if not hasattr(socket, 'AF_UNIX'):
+        raise DaemonError("UNIX sockets are not supported on this platform")
+
+
+class _Snapshot():
+    """
+    Immutable view of the inventory at one point in time, with indexes for the queries
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, kits):
+        self.kits = tuple(kits)
+        self.by_serial_port = {}
+        self.by_kitname = {}
+        for kit in self.kits:
+            self.by_serial_port.setdefault(kit['debugger']['serial_port'], []).append(kit)
+            self.by_kitname.setdefault(kit['debugger']['kitname'].casefold(), []).append(kit)
+        # The answer to the most common query is encoded once per update
+        self.all_kits_answer = _encoder.encode({'kits': self.kits}).encode('utf-8') + b'\n'
+
+
+class KitInventory():
+    """
+    Connected kits, indexed for queries
+
+    The inventory is replaced as a whole on each update, so queries from any thread never see a partial update and
+    don't need to take a lock.
+    """
+    def __init__(self):
+        self._snapshot = _Snapshot([])
+        self._ready = threading.Event()
+
+    def update(self, kits):
+        """
+        Replace the inventory
+
+        :param kits: kits currently connected
+        :type kits: list of dict
+        """
+        self._snapshot = _Snapshot(kits)
+        self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        """
+        Wait until the inventory has been updated at least once
+
+        :param timeout: maximum time to wait in seconds, defaults to waiting forever
+        :type timeout: float, optional
+        :return: True if the inventory is ready
+        :rtype: bool
+        """
+        return self._ready.wait(timeout)
+
+    def find(self, serial_number=None, serial_port=None, kitname=None):
+        """
+        Find kits
+
+        :param serial_number: (partial) serial number, matching kits with a serial number ending with it
+        :type serial_number: str, optional
+        :param serial_port: serial port
+        :type serial_port: str, optional
+        :param kitname: kit name, ignoring case
+        :type kitname: str, optional
+        :return: matching kits, all kits if no filter is given
+        :rtype: list of dict
+        """
+        snapshot = self._snapshot
+        kits = snapshot.kits
+        if serial_port is not None:
+            kits = snapshot.by_serial_port.get(serial_port, [])
+        if kitname is not None:
+            matches = snapshot.by_kitname.get(kitname.casefold(), [])
+            if serial_port is None:
+                kits = matches
+            else:
+                kits = [kit for kit in kits if any(kit is match for match in matches)]
+        if serial_number is not None:
+            kits = [kit for kit in kits if (kit['usb']['serial_number'] or '').endswith(serial_number)]
+        return list(kits)
+
+    def answer(self, query):
+        """
+        Answer a query
+
+        :param query: query filters
+        :type query: dict
+        :return: answer as a line of UTF-8 encoded JSON
+        :rtype: bytes
+        """
+        unknown = [name for name in query if name not in QUERY_FIELDS]
+        if unknown:
+            return self.error("Unknown query field {}".format(', '.join(unknown)))
+        if not all(isinstance(value, str) for value in query.values()):
+            return self.error("Query values must be strings")
+        if not query:
+            return self._snapshot.all_kits_answer
+        return _encoder.encode({'kits': self.find(**query)}).encode('utf-8') + b'\n'
+
+    @staticmethod
+    def error(message):
+        """
+        Make an error answer
+
+        :param message: error message
+        :type message: str
+        :return: answer as a line of UTF-8 encoded JSON
+        :rtype: bytes
+        """
+        return _encoder.encode({'error': message}).encode('utf-8') + b'\n'
+
+
+class _QueryHandler(socketserver.StreamRequestHandler):
+    """
+    Answers the queries sent over one client connection
+    """
+    def handle(self):
+        inventory = self.server.inventory
+        while True:
+            line = self.rfile.readline(MAX_QUERY_SIZE + 1)
+            if not line:
+                return
+            if len(line) > MAX_QUERY_SIZE and not line.endswith(b'\n'):
+                # Read the rest of the query before answering, so that closing the connection with unread data
+                # doesn't reset it before the client has read the error
+                while line and not line.endswith(b'\n'):
+                    line = self.rfile.readline(MAX_QUERY_SIZE)
+                self.wfile.write(inventory.error("Query too long, at most {} bytes".format(MAX_QUERY_SIZE)))
+                return
+            try:
+                query = json.loads(line.decode('utf-8'))
+                if not isinstance(query, dict):
+                    raise ValueError("Query must be a JSON object")
+            except ValueError as exc:
+                self.wfile.write(inventory.error("Invalid query: {}".format(exc)))
+                continue
+            if not inventory.wait_ready(READY_TIMEOUT):
+                self.wfile.write(inventory.error("Inventory not ready"))
+                continue
+            self.wfile.write(inventory.answer(query))
+
+
+class InventoryDaemon():
+    """
+    Keeps an inventory of the connected kits up to date and answers queries about them over a UNIX socket
+
+    :param socket_path: path of the socket, defaults to default_socket_path()
+    :type socket_path: str, optional
+    :param serialnumber: (partial) serial number of the kits to keep track of, defaults to all kits
+    :type serialnumber: str, optional
+    :param cache: cache of probed kit information, defaults to probing every new kit
+    :type cache: class:pykitinfo.cache.KitInfoCache, optional
+    :param probe: if False, kits are never opened and only USB properties and serial ports are reported
+    :type probe: bool, optional
+    :param monitor: hotplug monitor, defaults to the best monitor available on this platform
+    :param poll_interval: polling interval in seconds, if hotplug events are unavailable
+    :type poll_interval: float, optional
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, socket_path=None, *, serialnumber=None, cache=None, probe=True, monitor=None,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        # pylint: disable=too-many-arguments
+        self.logger = getLogger(__name__)
+        self.socket_path = socket_path or default_socket_path()
+        self.inventory = KitInventory()
+        self.watcher = KitWatcher(serialnumber=serialnumber, cache=cache, probe=probe)
+        self.monitor = monitor
+        self.poll_interval = poll_interval
+        self.settle_time = DEFAULT_SETTLE_TIME
+        self._server = None
+        self._stopped = threading.Event()
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) # pylint: disable=no-member
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise DaemonError("A pykitinfo daemon is already running on {}".format(self.socket_path))
+
+    def _watch(self):
+        while not self._stopped.is_set():
+            try:
+                for event, kit in self.watcher.update():
+                    self.logger.info("Kit %s %s", kit['usb']['serial_number'], event)
+            except Exception as exc: # pylint: disable=broad-except
+                # Keep serving the last known inventory, and try again on the next change
+                self.logger.error("Updating the inventory failed with %s: %s", type(exc).__name__, exc)
+            self.inventory.update(self.watcher.kits)
+            self.watcher.wait(self.monitor, self.settle_time)
+
+    def start(self):
+        """
+        Bind the socket, and start the inventory and the query server in background threads
+
+        :raises DaemonError: if UNIX sockets are not supported or a daemon is already running on the socket
+        """
+        _check_platform()
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._remove_stale_socket()
+        if self.monitor is None:
+            self.monitor = create_monitor(self.poll_interval)
+        # Only the user running the daemon can query it.  The socket is created with these permissions, as changing
+        # them after binding would let other users connect in between.
+        umask = os.umask(0o077)
+        try:
+            # pylint: disable=no-member
+            self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, _QueryHandler)
+        finally:
+            os.umask(umask)
+        self._server.daemon_threads = True
+        self._server.inventory = self.inventory
+        threading.Thread(target=self._watch, name="pykitinfo-inventory", daemon=True).start()
+        threading.Thread(target=self._server.serve_forever, name="pykitinfo-server", daemon=True).start()
+        self.logger.info("Serving kit inventory on %s", self.socket_path)
+
+    def close(self):
+        """
+        Stop answering queries and remove the socket
+        """
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            os.unlink(self.socket_path)
+        if self.monitor is not None:
+            self.monitor.close()
+
+
+def serve(socket_path=None, *, serialnumber=None, cache=None, probe=True, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Run the inventory daemon until interrupted
+
+    See InventoryDaemon for parameters.
+
+    :raises DaemonError: if UNIX sockets are not supported or a daemon is already running on the socket
+    """
+    daemon = InventoryDaemon(socket_path=socket_path, serialnumber=serialnumber, cache=cache, probe=probe,
+                             poll_interval=poll_interval)
+    daemon.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+
+def query_daemon(serial_number=None, serial_port=None, kitname=None, *, socket_path=None,
+                 timeout=DEFAULT_CLIENT_TIMEOUT):
+    """
+    Look up kits in the inventory of a running daemon
+
+    :param serial_number: (partial) serial number, matching kits with a serial number ending with it
+    :type serial_number: str, optional
+    :param serial_port: serial port
+    :type serial_port: str, optional
+    :param kitname: kit name, ignoring case
+    :type kitname: str, optional
+    :param socket_path: path of the daemon socket, defaults to default_socket_path()
+    :type socket_path: str, optional
+    :param timeout: maximum time in seconds to wait for the answer
+    :type timeout: float, optional
+    :return: matching kits, all kits if no filter is given
+    :rtype: list of dict
+    :raises DaemonError: if the daemon can't be reached or the query fails
+    """
+    # pylint: disable=too-many-arguments
+    _check_platform()
+    socket_path = socket_path or default_socket_path()
+    query = {name: value for name, value in [('serial_number', serial_number), ('serial_port', serial_port),
+                                             ('kitname', kitname)] if value is not None}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client: # pylint: disable=no-member
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(_encoder.encode(query).encode('utf-8') + b'\n')
+            with client.makefile('rb') as answer_file:
+                line = answer_file.readline()
+    except OSError as exc:
+        raise DaemonError("Unable to query the pykitinfo daemon on {}: {}".format(socket_path, exc)) from exc
+    try:
+        answer = json.loads(line.decode('utf-8'))
+    except ValueError as exc:
+        raise DaemonError("Invalid answer from the pykitinfo daemon: {}".format(exc)) from exc
+    if 'error' in answer:
+        raise DaemonError(answer['error'])
+    return answer['kits']
@@ -0,0 +1,141 @@
+"""
+asyncio API for kit detection.
+
+The detectors use blocking pyusb and hidapi calls, so they are run in an executor to keep the event loop responsive.
+When a call is cancelled or times out, the scan is asked to stop probing further devices.  A device that is being
+probed at that moment is completed in the background, since a USB transaction in progress can't be interrupted.
+
+Example:
+
+.. code-block:: python
+
+    import asyncio
+    from pykitinfo.detect_async import detect_all_kits_async
+
+    kits = asyncio.run(detect_all_kits_async(timeout=10))
+"""
+import asyncio
+from functools import partial
+from .timeouts import DEFAULT_TRANSACTION_TIMEOUT_MS
+from .scan import ScanContext, BACKEND_EDBG, BACKEND_PK3, BACKEND_GENX, BACKEND_MCP2221A
+from . import pykitinfo
+
+
+def _detect(backend, serialnumber, context):
+    # The detector is imported in the executor as well, since importing USB libraries takes time
+    return pykitinfo.get_detector(backend)(serialnumber, context=context)
+
+
+async def _run_detector(backend, serialnumber, context, executor):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(_detect, backend, serialnumber, context))
+
+
+async def _run_with_timeout(coroutine, context, timeout):
+    try:
+        return await asyncio.wait_for(coroutine, timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        # Stop the scan running in the executor at the next device
+        context.cancel()
+        raise
+
+
+async def _detect_async(backend, serialnumber, context, timeout, executor):
+    if context is None:
+        context = ScanContext()
+    return await _run_with_timeout(_run_detector(backend, serialnumber, context, executor), context, timeout)
+
+
+async def detect_edbg_kits_async(serialnumber=None, context=None, timeout=None, executor=None):
+    """
+    Look for all compatible EDBG-based kits without blocking the event loop
+
+    :param serialnumber: (partial) serial number to use
+    :type serialnumber: str
+    :param context: scan context to take enumerated devices from, defaults to a new scan
+    :type context: class:pykitinfo.scan.ScanContext, optional
+    :param timeout: maximum time in seconds to wait for the result, defaults to no timeout
+    :type timeout: float, optional
+    :param executor: executor to run the blocking detector in, defaults to the event loop's default executor
+    :type executor: class:concurrent.futures.Executor, optional
+    :return: kits and tools connected
+    :rtype: list of dictionaries
+    :raises asyncio.TimeoutError: if the timeout expired
+    """
+    return await _detect_async(BACKEND_EDBG, serialnumber, context, timeout, executor)
+
+
+async def detect_pickit3s_async(serialnumber=None, context=None, timeout=None, executor=None):
+    """
+    Look for PICkit3 devices without blocking the event loop
+
+    See detect_edbg_kits_async() for parameters.
+    """
+    return await _detect_async(BACKEND_PK3, serialnumber, context, timeout, executor)
+
+
+async def detect_microchip_tools_async(serialnumber=None, context=None, timeout=None, executor=None):
+    """
+    Detect all USB tools in the Gen4/5 family without blocking the event loop
+
+    See detect_edbg_kits_async() for parameters.
+    """
+    return await _detect_async(BACKEND_GENX, serialnumber, context, timeout, executor)
+
+
+async def detect_mcp2221a_kits_async(serialnumber=None, context=None, timeout=None, executor=None):
+    """
+    Look for all compatible MCP2221A kits without blocking the event loop
+
+    See detect_edbg_kits_async() for parameters.
+    """
+    return await _detect_async(BACKEND_MCP2221A, serialnumber, context, timeout, executor)
+
+
+async def detect_all_kits_async(serialnumber=None, *, cache=None, probe=True, # pylint: disable=too-many-arguments
+                                timeout=None, executor=None, transaction_timeout=DEFAULT_TRANSACTION_TIMEOUT_MS,
+                                backends=None, extensions=True, profile=None):
+    """
+    Look for all compatible connected kits without blocking the event loop
+
+    The backend detectors run concurrently and share one enumeration of the USB bus.  Results are merged in the
+    same fixed order as detect_all_kits().
+
+    :param serialnumber: (partial) serial number to use
+    :type serialnumber: str
+    :param cache: cache of probed kit information, defaults to probing every kit.
+        The cache is saved when the scan completes.
+    :type cache: class:pykitinfo.cache.KitInfoCache, optional
+    :param probe: if False, kits are never opened and only USB properties and serial ports are reported
+    :type probe: bool, optional
+    :param timeout: maximum time in seconds to wait for the result, defaults to no timeout
+    :type timeout: float, optional
+    :param executor: executor to run the blocking detectors in, defaults to the event loop's default executor
+    :type executor: class:concurrent.futures.Executor, optional
+    :param transaction_timeout: maximum time in milliseconds to wait for a single USB transaction with a GENx tool
+    :type transaction_timeout: int, optional
+    :param backends: backends to look for kits with, defaults to all backends
+    :type backends: iterable of str, optional
+    :param extensions: if False, kits are not probed for extensions and no extensions are reported
+    :type extensions: bool, optional
+    :param profile: profile to record the time taken by each detector, device and probe step in
+    :type profile: class:pykitinfo.profiling.ScanProfile, optional
+    :return: kits and tools connected
+    :rtype: list of dictionaries
+    :raises asyncio.TimeoutError: if the timeout expired
+    :raises ValueError: if a backend name is unknown
+    """
+    backends = pykitinfo.select_backends(backends)
+    context = ScanContext(cache=cache, probe=probe, profile=profile, transaction_timeout=transaction_timeout,
+                          extensions=extensions)
+    scan = asyncio.gather(*[_run_detector(backend, serialnumber, context, executor)
+                            for backend in backends])
+    results = await _run_with_timeout(scan, context, timeout)
+
+    if cache is not None:
+        await asyncio.get_running_loop().run_in_executor(executor, cache.save)
+
+    kit_list = []
+    for result in results:
+        kit_list += result
+    return kit_list
@@ -4,55 +4,131 @@ These tools are generally HID-based, are CMSIS-DAP implentations and use the Atm
 Examples: Atmel-ICE, nEDBG/PKOB nano used on Curiosity Nano kits
 """
 from logging import getLogger
-from pyedbglib.hidtransport.hidtransportfactory import hid_transport
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from pyedbglib.hidtransport.cyhidapi import CyHidApiTransport
+from pyedbglib.hidtransport.hidtransportbase import HidTool
 from pyedbglib.protocols.cmsisdap import CmsisDapUnit
 from pyedbglib.protocols.edbgprotocol import EdbgProtocol
-from pyedbglib.serialport.serialportmap import SerialPortMap
 from pyedbglib.protocols.avrcmsisdap import AvrCommandError
-from pydebuggerconfig.backend import board_config_manager
+from pydebuggerconfig.boardconfig import BoardConfig
+from .scan import ScanContext, BACKEND_EDBG
+from .cache import KitInfoCache
+from .tools import get_registry
+from .kitconfig import read_board_registers
 
-NUM_ID_CHANNELS_EDBG = 8    # Maximum 8 extensions, 1-indexed
-NUM_ID_CHANNELS_NEDBG = 1   # Single ID channel
+MAX_PROBE_WORKERS = 8       # Maximum number of kits probed in parallel
 
 
-def _detect_compatible_hid_devices(transport, serialnumber=None):
+class _EnumeratedHidTool(HidTool):
+    """
+    HID tool which also knows the path it was enumerated on, identifying the current connection to the kit
+    """
+    def __init__(self, device):
+        super().__init__(device['vendor_id'],
+                         device['product_id'],
+                         device['serial_number'],
+                         device['product_string'],
+                         device['manufacturer_string'])
+        self.path = device.get('path')
+
+
+class _IdChipProtocol(EdbgProtocol):
+    """
+    EDBG protocol querying the commands supported by the kit only once
+
+    EdbgProtocol queries the supported commands before each ID chip command, doubling the cost of probing each
+    ID channel.
+    """
+    def __init__(self, transport):
+        super().__init__(transport)
+        self._commands_supported = None
+
+    def check_command_exists(self, command):
+        """
+        Check if command is supported, using the list of supported commands read on first use
+
+        :param command: The command to test.
+        :raises NotImplementedError: if the command is not supported
+        """
+        if self._commands_supported is None:
+            self._commands_supported = self.query(self.EDBG_QUERY_COMMANDS)
+        if command not in self._commands_supported:
+            raise NotImplementedError("Invalid command: 0x{:02X}".format(command))
+
+
+class _SingleDeviceHidTransport(CyHidApiTransport):
+    """
+    HID transport bound to a single, already enumerated, HID tool
+
+    Gives each kit its own transport without enumerating the USB bus again.
+    """
+    def __init__(self, tool):
+        self._tool = tool
+        super().__init__()
+
+    def detect_devices(self):
+        """
+        Populate the device list with the single tool this transport is bound to
+
+        :return: number of devices connected
+        """
+        self.devices = [self._tool]
+        return len(self.devices)
+
+
+def _detect_compatible_hid_devices(context, serialnumber=None):
     """
     Look for all connected HID-based kits
 
+    :param context: scan context to take enumerated devices from
+    :type context: class:pykitinfo.scan.ScanContext
     :param serialnumber: (partial) serial number to use
     :type serialnumber: str
-    :return: kits and tools connected
-    :rtype: list of dictionaries
+    :return: HID tools connected
+    :rtype: list of HidTool
     """
-    kit_list = []
-    for i in transport.devices:
+    tools = []
+    for device in context.hid_devices(BACKEND_EDBG):
         # Filter out by serial number if specified
-        if serialnumber and i.serial_number and not i.serial_number.endswith(serialnumber):
+        if serialnumber and device['serial_number'] and not device['serial_number'].endswith(serialnumber):
             continue
-        usb = {}
-        usb['interface'] = 'hid'
-        usb['product_string'] = i.product_string
-        usb['serial_number'] = i.serial_number
-        usb['packet_size'] = i.packet_size
-        usb['product_id'] = i.product_id
-        usb['vendor_id'] = i.vendor_id
-        kit_list.append(usb)
-    return kit_list
+        tools.append(_EnumeratedHidTool(device))
+    return tools
+
 
+def _usb_info(tool):
+    """
+    Collect the USB properties of a HID-based kit
+
+    :param tool: HID tool as enumerated by the HID transport
+    :type tool: class:pyedbglib.hidtransport.hidtransportbase.HidTool
+    :return: USB properties
+    :rtype: dict
+    """
+    usb = {}
+    usb['interface'] = 'hid'
+    usb['product_string'] = tool.product_string
+    usb['serial_number'] = tool.serial_number
+    usb['packet_size'] = tool.packet_size
+    usb['product_id'] = tool.product_id
+    usb['vendor_id'] = tool.vendor_id
+    return usb
 
-def _get_kitname(serialnumber):
+
+def _get_kitname(transport):
     """
-    Looks up kitname given a connected kit's serial number
+    Looks up kitname of a connected kit
+
+    The board configuration is read over the transport already connected to the kit.
+
+    :param transport: transport connected to the kit
+    :type transport: class:pyedbglib.hidtransport.cyhidapi.CyHidApiTransport
     :return: kit name
     """
-    with board_config_manager(serialnumber_substring=serialnumber) as board_cfg:
-        board_cfg.config_read_from_board()
-        for register in board_cfg.specification_xml['board'].findall("./registers/register"):
-            offset = int(register.attrib['offset'], 16)
-            size = int(register.attrib['size'])
-            if register.attrib['name'] == "KITNAME":
-                return ''.join(chr(i) for i in board_cfg.data_array['board'][offset:offset + size]).strip('\0')
-    return ''
+    board_cfg = BoardConfig()
+    board_cfg.transport_set(transport)
+    return read_board_registers(board_cfg, ['KITNAME'])['KITNAME'].strip('\0')
 
 def _edbg_config_request(field):
     """
@@ -66,46 +142,105 @@ def _edbg_config_request(field):
     request.extend ([32, 0]) # size
     return bytearray(request)
 
-def detect_edbg_kits(serialnumber=None):
+def _parse_extension(ext, id_data):
     """
-    Look for all compatible EDBG-based kits
+    Parse the ID data read from an ID channel
 
-    :param serialnumber: (partial) serial number to use
-    :type serialnumber: str
-    :return: kits and tools connected
-    :rtype: list of dictionaries
+    :return: extension record, or None if there is no extension on the channel
+    """
+    if not id_data or id_data[0] == 0:
+        return None
+    ext_details = bytes(id_data).decode('latin-1').split('\0')
+    return {
+        'ext' : ext,
+        'manufacturer' : ext_details[0],
+        'name' : ext_details[1],
+        'power' : ext_details[2],
+        'serial_number' : ext_details[3],
+    }
+
+def _read_extensions(tool, transport, id_channels, cache=None):
+    """
+    Look for extensions on the ID channels of a kit
+
+    Channels are taken from the extension cache, if any, when the kit has not been reconnected since they were read.
+
+    :param tool: HID tool as enumerated by the HID transport
+    :type tool: class:_EnumeratedHidTool
+    :param transport: transport connected to the kit
+    :type transport: class:pyedbglib.hidtransport.cyhidapi.CyHidApiTransport
+    :param id_channels: number of ID channels of the kit
+    :type id_channels: int
+    :param cache: cache of the extensions read, defaults to reading all channels
+    :type cache: class:pykitinfo.cache.ExtensionCache, optional
+    :return: extensions found, in channel order
+    :rtype: list of dict
+    """
+    channels = range(1, id_channels + 1)
+    found = cache.get(tool.serial_number, tool.path, channels) if cache is not None else {}
+    if len(found) < id_channels:
+        edbg = _IdChipProtocol(transport)
+        # Refresh the ID chip and read the ID data
+        edbg.refresh_id_chip()
+        for ext in channels:
+            if ext in found:
+                continue
+            try:
+                id_data = edbg.read_id_chip(ext)
+            except AvrCommandError:
+                # Not cached, so that the remaining channels are read again on the next scan
+                break
+            if id_data is False:
+                # Firmware with the old version of the command answers without ID data when the channel is empty
+                found[ext] = None
+            else:
+                found[ext] = _parse_extension(ext, id_data)
+            if cache is not None:
+                cache.put(tool.serial_number, tool.path, ext, found[ext])
+    return [dict(found[ext]) for ext in channels if found.get(ext) is not None]
+
+def _read_edbg_kit_info(tool, context):
+    """
+    Read the kit information of a single EDBG-based kit
+
+    The kit is probed over its own transport so that several kits can be probed at the same time.
+
+    :param tool: HID tool as enumerated by the HID transport
+    :type tool: class:pyedbglib.hidtransport.hidtransportbase.HidTool
+    :param context: scan context of the current scan
+    :type context: class:pykitinfo.scan.ScanContext
+    :return: 'debugger' properties, except the serial port, and 'extensions' if the kit supports extensions.
+        None if the kit could not be connected to.
+    :rtype: dict
     """
     logger = getLogger(__name__)
-    logger.debug("Looking for xEDBG kits")
-    kit_list = []
-    transport = hid_transport()
-    usb_devices = _detect_compatible_hid_devices(transport, serialnumber=serialnumber)
-
-    # Run through the top-level list
-    for device in usb_devices:
-        kit = {
-            'usb': device
-        }
-        # Probe each edbg-like kit
-        if not transport.connect(device['serial_number']):
-            logger.error("Unable to connect to kit")
-            continue
+    kit_info = {}
+    stage = partial(context.stage, detector=BACKEND_EDBG, device=tool.serial_number)
+    transport = _SingleDeviceHidTransport(tool)
+    # Probe each edbg-like kit
+    with stage('connect'):
+        connected = transport.connect(tool.serial_number)
+    if not connected:
+        logger.error("Unable to connect to kit")
+        return None
 
+    try:
         # Find out CMSIS-DAP level info
         unit = CmsisDapUnit(transport)
-        info = unit.dap_info()
+        with stage('dap_info'):
+            info = unit.dap_info()
 
-        # Some EDBG versions do NOT have the dap_info 'device' tag populated for non-ARM parts.
-        # Sneak in and collect the data from the EDBG config instead
-        if info['product'][:4] == 'EDBG' and info['device_name'] == '':
-            try:
-                cmd = _edbg_config_request(0x04) # 4 == 'TARGET DEVICE NAME'
-                # raw command routed via the HK interface
-                response = unit.dap_command_response(cmd)
-                info['device_name'] = response[6:6 + 32].split(b'\0')[0].decode()
-            except: #pylint: disable=bare-except
-                # resort to ''
-                pass
+            # Some EDBG versions do NOT have the dap_info 'device' tag populated for non-ARM parts.
+            # Sneak in and collect the data from the EDBG config instead
+            if info['product'][:4] == 'EDBG' and info['device_name'] == '':
+                try:
+                    cmd = _edbg_config_request(0x04) # 4 == 'TARGET DEVICE NAME'
+                    # raw command routed via the HK interface
+                    response = unit.dap_command_response(cmd)
+                    info['device_name'] = response[6:6 + 32].split(b'\0')[0].decode()
+                except: #pylint: disable=bare-except
+                    # resort to ''
+                    pass
 
         debugger = {
             'device': info['device_name'],
@@ -113,69 +248,135 @@ def detect_edbg_kits(serialnumber=None):
             'serial_number': info['serial'],
             'protocol': 'edbg'
         }
-        kit['debugger'] = debugger
+        kit_info['debugger'] = debugger
 
+        # How to find the kit name and which ID channels are available depends on the product
+        capabilities = get_registry().edbg_product(debugger['product'])
         # nEDBG uses kit config have kitnames
-        if 'nedbg' in debugger['product'].lower():
-            # Which ID channels are available (used later)
-            ID_CHANNELS = range(1, NUM_ID_CHANNELS_NEDBG+1)
-            # Disconnect before using pydebuggerconfig backend
-            transport.disconnect()
-            debugger['kitname'] = _get_kitname(device['serial_number'])
-            # Reconnect for further probing
-            transport.connect(device['serial_number'])
+        if capabilities['kitname'] == 'config_area':
+            with stage('kitname'):
+                debugger['kitname'] = _get_kitname(transport)
         # mEDBG and EDBG need different lookup
-        elif 'edbg' in debugger['product'].lower().split()[0]:
-            # Which ID channels are available (used later)
-            ID_CHANNELS = range(1, NUM_ID_CHANNELS_EDBG+1)
+        elif capabilities['kitname'] == 'get_config':
             # Look for extra info
             cmd = _edbg_config_request(0x02) # 2 == 'KIT NAME'
-            # raw command routed via the HK interface
-            response = unit.dap_command_response(cmd)
+            with stage('kitname'):
+                # raw command routed via the HK interface
+                response = unit.dap_command_response(cmd)
             debugger['kitname'] = response[6:6 + 32].split(b'\0')[0].decode()
         else:
-            # Which ID channels are available (used later)
-            ID_CHANNELS = []
             # Else use debugger name as kit name
             debugger['kitname'] = debugger['product']
 
-        # Some kits can have guessable serial ports
-        if debugger['product'].lower().split()[0] in ['nedbg', 'medbg', 'edbg', 'power', 'mplab']:
-            spm = SerialPortMap()
-            try:
-                debugger['serial_port'] = spm.find_matching_tools_ports(debugger['serial_number'])[0]['port']
-            except IndexError:
-                debugger['serial_port'] = 'N/A'
-        else:
-            debugger['serial_port'] = 'N/A'
-
         # EDBG and nEDBG products support extensions, which can be probed for
-        if debugger['product'].lower().split()[0] in ['edbg', 'nedbg']:
-            edbg = EdbgProtocol(transport)
-            # Look for extensions
-            extensions = []
-            # Refresh the ID chip and read the ID data
-            edbg.refresh_id_chip()
-            for ext in ID_CHANNELS:
-                try:
-                    id_data = edbg.read_id_chip(ext)
-                except (NotImplementedError, AvrCommandError):
-                    break
-                if id_data[0] != 0:
-                    # Parse out extension fields
-                    ext_details = ''.join(chr(i) for i in id_data).split('\0')
-                    extension = {
-                        'ext' : ext,
-                        'manufacturer' : ext_details[0],
-                        'name' : ext_details[1],
-                        'power' : ext_details[2],
-                        'serial_number' : ext_details[3],
-                    }
-                    extensions.append(extension)
-            kit['extensions'] = extensions
-
+        if capabilities['id_channels'] > 0 and context.extensions:
+            with stage('id_chip'):
+                kit_info['extensions'] = _read_extensions(tool, transport, capabilities['id_channels'],
+                                                          cache=context.extension_cache)
+    finally:
         transport.disconnect()
 
-        kit_list.append(kit)
+    return kit_info
+
+def _enumerated_edbg_kit(tool, context):
+    """
+    Report an EDBG-based kit using enumeration data only, without opening it
+
+    :param tool: HID tool as enumerated by the HID transport
+    :type tool: class:pyedbglib.hidtransport.hidtransportbase.HidTool
+    :param context: scan context of the current scan
+    :type context: class:pykitinfo.scan.ScanContext
+    :return: kit information
+    :rtype: dict
+    """
+    debugger = {
+        'device': 'N/A',
+        'serial_number': tool.serial_number,
+        'protocol': 'edbg',
+        # Use product name as kit name
+        'kitname': tool.product_string,
+        'serial_port': context.serial_ports.find_port(tool.serial_number) or 'N/A',
+    }
+    return {
+        'usb': _usb_info(tool),
+        'debugger': debugger
+    }
+
+def _probe_edbg_kit(tool, context):
+    """
+    Probe a single EDBG-based kit
+
+    Kit information is taken from the cache if available, otherwise it is read from the kit.
+
+    :param tool: HID tool as enumerated by the HID transport
+    :type tool: class:pyedbglib.hidtransport.hidtransportbase.HidTool
+    :param context: scan context of the current scan
+    :type context: class:pykitinfo.scan.ScanContext
+    :return: kit information, or None if the kit could not be connected to or the scan was cancelled
+    :rtype: dict
+    """
+    if context.cancelled:
+        return None
+    if not context.probe:
+        return _enumerated_edbg_kit(tool, context)
+    kit = {
+        'usb': _usb_info(tool)
+    }
+    cache_key = KitInfoCache.key(tool.vendor_id, tool.product_id, tool.serial_number)
+    kit_info = context.cache.get(cache_key) if context.cache is not None else None
+    if kit_info is None:
+        kit_info = _read_edbg_kit_info(tool, context)
+        if kit_info is None:
+            return None
+        # Kit information without extensions would hide them from later scans
+        if context.cache is not None and context.extensions:
+            context.cache.put(cache_key, kit_info)
+
+    debugger = dict(kit_info['debugger'])
+    kit['debugger'] = debugger
+
+    # Some kits can have guessable serial ports
+    if get_registry().edbg_product(debugger['product'])['serial_port']:
+        with context.stage('serial_port', detector=BACKEND_EDBG, device=tool.serial_number):
+            debugger['serial_port'] = context.serial_ports.find_port(debugger['serial_number']) or 'N/A'
+    else:
+        debugger['serial_port'] = 'N/A'
+
+    if 'extensions' in kit_info and context.extensions:
+        kit['extensions'] = [dict(extension) for extension in kit_info['extensions']]
+
+    return kit
+
+def detect_edbg_kits(serialnumber=None, context=None, max_workers=MAX_PROBE_WORKERS):
+    """
+    Look for all compatible EDBG-based kits
+
+    Each kit is probed over its own HID connection, and up to max_workers kits are probed in parallel.
+    Kits are returned in the order they were enumerated.
+
+    :param serialnumber: (partial) serial number to use
+    :type serialnumber: str
+    :param context: scan context to take enumerated devices from, defaults to a new scan
+    :type context: class:pykitinfo.scan.ScanContext, optional
+    :param max_workers: maximum number of kits to probe in parallel. Use 1 to probe one kit at a time.
+    :type max_workers: int, optional
+    :return: kits and tools connected
+    :rtype: list of dictionaries
+    """
+    logger = getLogger(__name__)
+    logger.debug("Looking for xEDBG kits")
+    if context is None:
+        context = ScanContext()
+    tools = _detect_compatible_hid_devices(context, serialnumber=serialnumber)
+
+    probe = partial(_probe_edbg_kit, context=context)
+    if max_workers <= 1 or len(tools) <= 1:
+        kits = [probe(tool) for tool in tools]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tools)),
+                                thread_name_prefix="pykitinfo-edbg") as executor:
+            # map() returns results in enumeration order regardless of completion order
+            kits = list(executor.map(probe, tools))
 
-    return kit_list
+    # Kits that could not be connected to are left out
+    return [kit for kit in kits if kit is not None]
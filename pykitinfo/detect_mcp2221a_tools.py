@@ -1,16 +1,21 @@
+"""
+Detection for MCP2221A USB-I2C/UART bridges.
+These devices are HID-based and use the Microchip USB VID.  They are found on Curiosity boards as the kit's
+virtual serial port.
+"""
 from logging import getLogger
 from .tools import MICROCHIP_VID
-import hid
-import serial.tools.list_ports
+from .tools import MCP2221A_PID
+from .scan import ScanContext, SerialPortIndex, BACKEND_MCP2221A
 
-MCP2221A_PID = 0x00DD
-
-def detect_mcp2221a_kits(serial_number=None):
+def detect_mcp2221a_kits(serial_number=None, context=None):
     """
     Look for all compatible MCP2221A kits
 
     :param serial_number: (partial) serial number to use
     :type serial_number: str
+    :param context: scan context to take enumerated devices from, defaults to a new scan
+    :type context: class:pykitinfo.scan.ScanContext, optional
     :return: List of detected tools
     :rtype: list
     """
@@ -18,8 +23,13 @@ def detect_mcp2221a_kits(serial_number=None):
     logger = getLogger(__name__)
     logger.debug("Looking for MCP2221A kits")
 
-    devices = hid.enumerate(MICROCHIP_VID, MCP2221A_PID)
-    port_map = map_mcp2221a_to_serial_port(devices)
+    if context is None:
+        context = ScanContext()
+    devices = context.hid_devices(BACKEND_MCP2221A)
+    with context.stage('serial_port', detector=BACKEND_MCP2221A):
+        port_map = map_mcp2221a_to_serial_port(devices, port_index=context.serial_ports)
+    # Port mapping keyed by the identity of the enumerated device
+    port_by_device = {id(item['tool']): item['port'] for item in port_map}
     kits = []
 
     for device in devices:
@@ -27,8 +37,6 @@ def detect_mcp2221a_kits(serial_number=None):
             if not device['serial_number'] or not device['serial_number'].endswith(serial_number):
                 continue
 
-        mapped_port = list(filter(lambda dev: dev['tool'] == device, port_map))
-
         usb_info = {
             "interface": "hid",
             "packet_size": 0,
@@ -44,7 +52,7 @@ def detect_mcp2221a_kits(serial_number=None):
             'protocol': 'N/A',
             # Use product name as kit name
             'kitname' : device['product_string'],
-            'serial_port': 'N/A' if len(mapped_port) == 0 else mapped_port[0]['port'],
+            'serial_port': port_by_device.get(id(device), 'N/A'),
         }
 
         kit = {
@@ -56,11 +64,13 @@ def detect_mcp2221a_kits(serial_number=None):
 
     return kits
 
-def map_mcp2221a_to_serial_port(devices):
+def map_mcp2221a_to_serial_port(devices, port_index=None):
     """Map MCP2221A devices to serial ports
 
     :param devices: List of MCP2221A devices
     :type devices: list(dict)
+    :param port_index: Serial ports to map to, defaults to listing the serial ports on the host
+    :type port_index: class:pykitinfo.scan.SerialPortIndex, optional
     :return: List containing mapped serial ports to devices
     :rtype: list(dict)
     """
@@ -68,23 +78,21 @@ def map_mcp2221a_to_serial_port(devices):
     logger = getLogger(__name__)
 
     portmap = []
-    available_comports = serial.tools.list_ports.comports()
+    if port_index is None:
+        # Only needed when not given the serial ports of a scan
+        import serial.tools.list_ports # pylint: disable=import-outside-toplevel
+        port_index = SerialPortIndex(serial.tools.list_ports.comports())
 
-    usbports = set([p for p in available_comports if "USB" in p.hwid and MICROCHIP_VID == p.vid and p.pid == MCP2221A_PID])
-    used_comports = set()
+    usbports = port_index.find_ports(vendor_id=MICROCHIP_VID, product_id=MCP2221A_PID)
     devices_missing_serial_number = []
 
     for dev in devices:
         if not dev['serial_number'] or dev['serial_number'] == "":
             devices_missing_serial_number.append(dev)
         else:
-            remaining_comports = usbports.symmetric_difference(used_comports)
-
-            for port in remaining_comports:
-                if dev['serial_number'] == port.serial_number:
-                    portmap.append({"tool": dev, "port": port.device})
-                    used_comports.add(port)
-                    break
+            port = port_index.find_port(dev['serial_number'], vendor_id=MICROCHIP_VID, product_id=MCP2221A_PID)
+            if port:
+                portmap.append({"tool": dev, "port": port})
 
     # Now we should have left only the devices and ports from MCP2221A devices that don't have serial number
     # Here we can only map a single device
@@ -92,6 +100,6 @@ def map_mcp2221a_to_serial_port(devices):
     if len(devices_missing_serial_number) > 1:
         logger.debug("Too many MCP2221 devices without serial number connected. Cannot map these to serial ports")
     elif len(devices_missing_serial_number) > 0 and len(usbports) > 0:
-        portmap.append({"tool": devices_missing_serial_number[0], "port": list(usbports)[0].device})
+        portmap.append({"tool": devices_missing_serial_number[0], "port": usbports[0].device})
 
     return portmap
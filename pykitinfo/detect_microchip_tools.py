@@ -4,74 +4,43 @@ These tools are generally Vendor class USB interface and use the Microchip USB V
 Examples: PICkit4 (not in 'AVR mode') and PICkit5
 """
 from logging import getLogger
-import libusb_package
 import usb
-from pyedbglib.serialport.serialportmap import SerialPortMap
 from pydebuggerconfig.boardconfig import BoardConfig
 from pydebuggerconfig.pydebuggerconfig_errors import PydebuggerconfigError
-import serial.tools.list_ports
-from .tools import lookup_tool
-from .tools import MICROCHIP_VID
+from .tools import MICROCHIP_VID, INTERFACE_USB
+from .timeouts import DEFAULT_TRANSACTION_TIMEOUT_MS
+from .tools import get_registry
 from .genx import GenxContoller, GenxError
+from .kitconfig import read_board_registers
+from .scan import ScanContext, BACKEND_GENX
+from .cache import KitInfoCache
 
 
 logger = getLogger(__name__)
 
-# pylint: disable=too-few-public-methods
-class VendorClassTool ():
-    """
-    Class for holding information about Vendor class tools
-    """
-    def __init__ (self, serial_number):
-        self.serial_number = serial_number
-
-class MicrochipVendorClassToolsSerialPortMap(SerialPortMap):
-    """
-    This is a utility to find virtual serial port name based on the tool's device serial number.
-    A sub-set of functionality is supported compared to the pyedbglib version for HID/CMSIS-DAP tools.
-    """
-    def __init__(self): #pylint: disable=super-init-not-called
-        """
-        Create map of tools and ports based on serial number matching. Method used is
-        very different on Windows and other platforms.
-        """
-        # Hook onto logger
-        self.logger = getLogger(__name__)
-
-        self.portmap = []
-        usbports = [p for p in serial.tools.list_ports.comports() if "USB" in p.hwid]
-
-        for port in usbports:
-            if port.serial_number is None:
-                # On Mac MCP2221 serial port on some Curiosity Development Boards have proven to not have a serial
-                # number associated, so to avoid an exception when trying to map the serial port to a serial number
-                # this port is just ignored
-                self.logger.debug("No serial number associated with %s, ignoring",
-                                  port.hwid)
-                continue
-            if f"PID={MICROCHIP_VID:04X}" in port.hwid:
-                self.portmap.append({"tool" : VendorClassTool(port.serial_number), "port": port.device})
-
-def get_kit_info(device):
+def get_kit_info(device, context=None):
     """Get the kit info from PKoB4
 
     :param device: pyusb USB device
     :type device: Device
+    :param context: scan context providing the transaction timeout, defaults to the default timeout
+    :type context: class:pykitinfo.scan.ScanContext, optional
     """
     kit_info = {}
     try:
-        genx_tool = GenxContoller(device)
+        timeout_ms = context.transaction_timeout if context is not None else DEFAULT_TRANSACTION_TIMEOUT_MS
+        genx_tool = GenxContoller(device, timeout_ms=timeout_ms)
         board = BoardConfig()
         # Hack to inject GenxController into BoardConfig
         board.protocol = genx_tool
         board.transport = True
         board.transport_connected = True
-        board.config_read_from_board()
+        registers = read_board_registers(board)
 
-        kit_info["kitname"] = board.register_get("KITNAME").replace('\u0000', '')
-        kit_info["device"] = board.register_get("DEVNAME").replace('\u0000', '')
-        kit_info["manufacturer"] = board.register_get("MNFRNAME").replace('\u0000', '')
-        kit_info["serialnumber"] = board.register_get("SERNUM").replace('\u0000', '')
+        kit_info["kitname"] = registers["KITNAME"].replace('\u0000', '')
+        kit_info["device"] = registers["DEVNAME"].replace('\u0000', '')
+        kit_info["manufacturer"] = registers["MNFRNAME"].replace('\u0000', '')
+        kit_info["serialnumber"] = registers["SERNUM"].replace('\u0000', '')
     # The TypeError is here only until pydebuggerconfig library is fixed and returns
     # a library specific error based on PydebuggerconfigError
     except (TypeError, PydebuggerconfigError, GenxError) as exc:
@@ -83,15 +52,17 @@ def get_kit_info(device):
 
     return kit_info
 
-def generate_kit_info(device, tool, serial_number):
+def generate_kit_info(device, tool, serial_number, context):
     """Generate kit info
 
     :param device: pyusb device
     :type device: device
-    :param tool: Tool information
+    :param tool: Tool registry entry
     :type tool: dict
     :param serial_number: Tool serial number
     :type serial_number: str
+    :param context: scan context of the current scan
+    :type context: class:pykitinfo.scan.ScanContext
     :return: Kit information
     :rtype: dict
     """
@@ -105,23 +76,27 @@ def generate_kit_info(device, tool, serial_number):
         'device': '',
         'serial_number': serial_number,
         'protocol': 'N/A',
-        'kitname' : tool['Name'],
+        'kitname' : tool['name'],
         'serial_port': 'N/A',
     }
 
     # TODO Once the CMSIS based PKoB supports kit-info we can change this to
     # read out the info again
-    if "pkob4" in tool['Name'].lower() and "cmsis" not in tool['Name'].lower():
-        kit_info = get_kit_info(device)
+    if context.probe and tool['config_area']:
+        cache_key = KitInfoCache.key(device.idVendor, device.idProduct, serial_number)
+        kit_info = context.cache.get(cache_key) if context.cache is not None else None
+        if kit_info is None:
+            with context.stage('genx_config', detector=BACKEND_GENX, device=serial_number):
+                kit_info = get_kit_info(device, context)
+            # Failed reads are not cached, so they are retried on the next scan
+            if context.cache is not None and kit_info["kitname"] != "N/A":
+                context.cache.put(cache_key, kit_info)
         debugger["device"] = kit_info["device"]
         debugger["kitname"] = kit_info["kitname"]
 
-    if "Serial port" in tool and tool["Serial port"] is True:
-        serial_port_mapper = MicrochipVendorClassToolsSerialPortMap()
-        try:
-            debugger['serial_port'] = serial_port_mapper.find_matching_tools_ports(serial_number)[0]['port']
-        except IndexError:
-            debugger['serial_port'] = 'N/A'
+    if tool['serial_port']:
+        with context.stage('serial_port', detector=BACKEND_GENX, device=serial_number):
+            debugger['serial_port'] = context.serial_ports.find_port(serial_number, vendor_id=MICROCHIP_VID) or 'N/A'
 
     usb_info = {
         "interface": "winusb",
@@ -137,20 +112,27 @@ def generate_kit_info(device, tool, serial_number):
     }
     return kit
 
-def list_libusb_tools(serialnumber=None):
+def list_libusb_tools(serialnumber=None, context=None):
     """
     List all Microchip Vendor class tools that libusb can find
 
     :param serialnumber: (partial) serial number to use
     :type serialnumber: str
+    :param context: scan context to take enumerated devices from, defaults to a new scan
+    :type context: class:pykitinfo.scan.ScanContext, optional
     :return: List of tools that were detected through libusb.
     :rtype: list
     """
+    if context is None:
+        context = ScanContext()
     tools = []
-    devices =  libusb_package.find(find_all=True, idVendor=MICROCHIP_VID)
-    for device in devices:
-        tool = lookup_tool(device.idProduct)
+    for device in context.usb_devices(BACKEND_GENX):
+        if context.cancelled:
+            break
+        tool = get_registry().lookup(INTERFACE_USB, device.idVendor, device.idProduct)
         if tool:
+            # String descriptors are read with the same timeout as other transactions
+            device.default_timeout = context.transaction_timeout
             try:
                 serial_number = device.serial_number
                 if serial_number is None:
@@ -161,12 +143,15 @@ def list_libusb_tools(serialnumber=None):
             except ValueError as exc:
                 logger.debug("Device VID=0x%04x PID=%04x %s", device.idVendor, device.idProduct, exc)
                 serial_number = "N/A"
+            except usb.core.USBError as exc:
+                logger.error("Device VID=0x%04x PID=%04x %s", device.idVendor, device.idProduct, exc)
+                serial_number = "N/A"
             if serialnumber and serial_number and not serial_number.endswith(serialnumber):
                 continue
 
             if tool:
                 try:
-                    kit = generate_kit_info(device, tool, serial_number)
+                    kit = generate_kit_info(device, tool, serial_number, context)
                     tools.append(kit)
                 except usb.core.USBError as exc:
                     logger.error("Device VID=0x%04x PID=%04x %s", device.idVendor, device.idProduct, exc)
@@ -174,17 +159,19 @@ def list_libusb_tools(serialnumber=None):
     return tools
 
 
-def detect_microchip_tools(serialnumber=None):
+def detect_microchip_tools(serialnumber=None, context=None):
     """
     Detect all USB tools in the Gen4/5 family.
 
     The tools are searched by using winusb library on Windows and libusb on all other platforms.
     :param serialnumber: (partial) serial number to use
     :type serialnumber: str
+    :param context: scan context to take enumerated devices from, defaults to a new scan
+    :type context: class:pykitinfo.scan.ScanContext, optional
     :return: List of detected tools
     :rtype: list
     """
 
     logger.debug("Looking for Microchip USB Vendor Class tools")
-    tools = list_libusb_tools(serialnumber)
+    tools = list_libusb_tools(serialnumber, context=context)
     return tools
@@ -1,5 +1,7 @@
 """ Genx tools API"""
 from enum import Enum, unique
+import usb
+from .timeouts import DEFAULT_TRANSACTION_TIMEOUT_MS
 
 GET_PKOB_CONFIG_AREA_TRANSMIT_SIZE_IN_BYTES                    =    9
 # Transmit offsets
@@ -248,32 +250,43 @@ class GenxContoller():
     # Receive offsets:
     API_COMMAND_OPCODE_RESPONSE_ECHO_OFFSET =   0
 
-    def __init__(self, device):
+    def __init__(self, device, timeout_ms=DEFAULT_TRANSACTION_TIMEOUT_MS):
+        """
+        :param device: pyusb USB device
+        :type device: Device
+        :param timeout_ms: Timeout in milliseconds for each USB transfer of a transaction
+        :type timeout_ms: int, optional
+        """
         self.usb_device = device
+        self.timeout_ms = timeout_ms
 
-    def send_command(self, command, timeout_ms=1000):
+    def send_command(self, command, timeout_ms=None):
         """Send a command
 
         :param command: Command to send
         :type command: bytes | bytearray
-        :param timeout: Timeout in milliseconds for the write operation, defaults to 1000 ms
+        :param timeout_ms: Timeout in milliseconds for the write operation, defaults to the timeout of the controller
         :type timeout_ms: int, optional
         :return: Number of bytes that have been sent
         :rtype: int
         """
+        if timeout_ms is None:
+            timeout_ms = self.timeout_ms
         bytes_written = self.usb_device.write(self.COMMAND_CHANNEL_USB_OUT_ENDPOINT_ADDRESS, command, timeout=timeout_ms)
         return bytes_written
 
-    def get_command_response(self, response_size, timeout_ms=1000):
+    def get_command_response(self, response_size, timeout_ms=None):
         """Fetch a command response
 
         :param response_size: Size of the expected response
         :type response_size: int
-        :param timeout_ms: Timeout in milliseconds for the read operation, defaults to 1000 ms
-        :type timeout: int, optional
+        :param timeout_ms: Timeout in milliseconds for the read operation, defaults to the timeout of the controller
+        :type timeout_ms: int, optional
         :return: Response
         :rtype: bytes
         """
+        if timeout_ms is None:
+            timeout_ms = self.timeout_ms
         response = self.usb_device.read(self.COMMAND_CHANNEL_USB_IN_ENDPOINT_ADDRESS, response_size, timeout=timeout_ms)
         return bytes(response)
 
@@ -284,14 +297,20 @@ class GenxContoller():
         :type command: bytes | bytearray
         :param response_size: Expected response size
         :type response_size: int
-        :raises GenxError: For detected errors in the transaction
+        :raises GenxError: For detected errors in the transaction, including USB errors and timeouts
         :return: Response
         :rtype: bytes
         """
-        bytes_sent = self.send_command(command)
-        if bytes_sent != len(command):
-            raise GenxError("USB send error")
-        response= self.get_command_response(response_size)
+        timeout_ms = self.timeout_ms
+        try:
+            bytes_sent = self.send_command(command, timeout_ms=timeout_ms)
+            if bytes_sent != len(command):
+                raise GenxError("USB send error")
+            response = self.get_command_response(response_size, timeout_ms=timeout_ms)
+        except usb.core.USBTimeoutError as exc:
+            raise GenxError("USB timeout after {} ms".format(timeout_ms)) from exc
+        except usb.core.USBError as exc:
+            raise GenxError("USB error: {}".format(exc)) from exc
         # Check command echo
         if response[self.API_COMMAND_OPCODE_RESPONSE_ECHO_OFFSET] != Commands.GET_PKOB_CONFIG_AREA.value:
             err_txt = "Invalid command response. " +\
@@ -0,0 +1,125 @@
+"""
+Decoding of kit (board) configuration data
+
+The specification of each board configuration version is opened once per process and kept as a register layout,
+shared by all threads.  Registers are then decoded straight from the raw configuration bytes read from a kit.
+"""
+from threading import Lock
+from pydebuggerconfig.pydebuggerconfig_errors import PydebuggerconfigError
+
+# Registers reported as kit information
+KIT_INFO_REGISTERS = ['KITNAME', 'DEVNAME', 'MNFRNAME', 'SERNUM']
+
+_layouts = {}
+_layouts_lock = Lock()
+
+
+def _to_int(value):
+    # Specification numbers are either decimal or 0x-prefixed hex
+    if value.lower().startswith('0x'):
+        return int(value, 16)
+    return int(value)
+
+
+class RegisterLayout:
+    """
+    Register offsets, sizes and types of one board configuration specification version
+
+    :param specification: parsed board configuration specification
+    :type specification: class:xml.etree.ElementTree.ElementTree
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, specification):
+        self.registers = {}
+        for register in specification.findall("./registers/register"):
+            self.registers[register.attrib['name']] = (_to_int(register.attrib['offset']),
+                                                       _to_int(register.attrib['size']),
+                                                       register.attrib.get('type'))
+
+    def decode(self, data, names):
+        """
+        Decode registers from raw configuration data
+
+        Values are decoded like pydebuggerconfig's BoardConfig.register_get(): STRING registers as str, ARRAY
+        registers as a list of bytes and other registers as a hex string.
+
+        :param data: raw configuration data
+        :type data: list of int or bytes
+        :param names: names of the registers to decode
+        :type names: iterable of str
+        :return: register values by name
+        :rtype: dict
+        :raises PydebuggerconfigError: if a register does not exist
+        """
+        values = {}
+        for name in names:
+            try:
+                offset, size, regtype = self.registers[name]
+            except KeyError:
+                raise PydebuggerconfigError("Register {} does not exist.".format(name)) from None
+            register_data = data[offset:offset + size]
+            if regtype == 'STRING':
+                values[name] = ''.join(chr(item) for item in register_data)
+            elif regtype == 'ARRAY':
+                values[name] = list(register_data)
+            else:
+                values[name] = "0x{:0{}x}".format(int.from_bytes(bytes(register_data), 'little'), size * 2)
+        return values
+
+
+def config_version(data):
+    """
+    Get the specification version of raw configuration data
+
+    :param data: raw configuration data
+    :type data: list of int or bytes
+    :return: (major, minor, build)
+    :rtype: tuple
+    """
+    return data[0], data[1], data[2] | data[3] << 8
+
+
+def _load_register_layout(board, data):
+    """
+    Get the register layout for raw configuration data, opening its specification the first time its version is seen
+
+    The specification is opened by the board configuration as if it had read the data itself.  The lock is held
+    while the specification is parsed, so it is parsed only once even when several kits are probed at the same time.
+    """
+    version = config_version(data)
+    with _layouts_lock:
+        layout = _layouts.get(version)
+        if layout is None:
+            board.data_array['board'] = data
+            board.major['board'], board.minor['board'], board.build['board'] = version
+            board.specification_open('board')
+            layout = RegisterLayout(board.specification_xml['board'])
+            _layouts[version] = layout
+        return layout
+
+
+def read_board_registers(board, names=None):
+    """
+    Read the configuration from a kit and decode registers from it in a single pass
+
+    The specification of each configuration version is only opened once per process, after that reading the
+    registers of a kit only costs reading its configuration.
+
+    :param board: board configuration with a transport or protocol to the kit
+    :type board: class:pydebuggerconfig.boardconfig.BoardConfig
+    :param names: names of the registers to decode, defaults to KIT_INFO_REGISTERS
+    :type names: iterable of str, optional
+    :return: register values by name
+    :rtype: dict
+    :raises PydebuggerconfigError: if the configuration can't be read, no specification is found for its version
+        or a register does not exist
+    """
+    if names is None:
+        names = KIT_INFO_REGISTERS
+    board.transport_check()
+    data = board.protocol.read_config_block(factory=False)
+    with _layouts_lock:
+        layout = _layouts.get(config_version(data))
+    if layout is None:
+        layout = _load_register_layout(board, data)
+    return layout.decode(data, names)
@@ -0,0 +1,201 @@
+"""
+Logging configuration support for the pykitinfo CLI.
+
+Parsing the YAML logging configuration and locating the user log directory is done once; the result is cached in the
+user cache directory, keyed by the path, modification time and size of the configuration file.  File handlers open
+their file, and create the log directory, only when the first record is written to them, and file writes are done
+by a background thread so that logging never blocks USB probing.
+"""
+import os
+import json
+import atexit
+import logging
+import logging.handlers
+import queue
+import tempfile
+from pathlib import Path
+
+LOGGING_CACHE_FILENAME = "logging-config.json"
+LOGGING_CACHE_FORMAT_VERSION = 1
+
+# Listeners writing queued records to file, stopped at exit
+_listeners = []
+
+# File handler classes replaced by their lazy counterparts
+LAZY_HANDLER_CLASSES = {
+    'logging.FileHandler': 'pykitinfo.logconfig.LazyFileHandler',
+    'logging.handlers.RotatingFileHandler': 'pykitinfo.logconfig.LazyRotatingFileHandler',
+    'logging.handlers.TimedRotatingFileHandler': 'pykitinfo.logconfig.LazyTimedRotatingFileHandler',
+}
+
+
+def _make_log_dir(filename):
+    Path(os.path.dirname(os.path.abspath(filename))).mkdir(exist_ok=True, parents=True)
+
+
+class LoggingConfigError(Exception):
+    """
+    Logging configuration file could not be parsed
+    """
+
+
+class LazyFileHandler(logging.FileHandler):
+    """
+    File handler that creates the file, and its directory, when the first record is written
+    """
+    def __init__(self, filename, *args, **kwargs):
+        kwargs.setdefault('delay', True)
+        super().__init__(filename, *args, **kwargs)
+
+    def _open(self):
+        _make_log_dir(self.baseFilename)
+        return super()._open()
+
+
+class LazyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotating file handler that creates the file, and its directory, when the first record is written
+    """
+    def __init__(self, filename, *args, **kwargs):
+        kwargs.setdefault('delay', True)
+        super().__init__(filename, *args, **kwargs)
+
+    def _open(self):
+        _make_log_dir(self.baseFilename)
+        return super()._open()
+
+
+class LazyTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    Timed rotating file handler that creates the file, and its directory, when the first record is written
+    """
+    def __init__(self, filename, *args, **kwargs):
+        kwargs.setdefault('delay', True)
+        super().__init__(filename, *args, **kwargs)
+
+    def _open(self):
+        _make_log_dir(self.baseFilename)
+        return super()._open()
+
+
+def _cache_path():
+    from appdirs import user_cache_dir # pylint: disable=import-outside-toplevel
+    return os.path.join(user_cache_dir("pykitinfo", "Microchip"), LOGGING_CACHE_FILENAME)
+
+
+def _cache_key(path, log_dir_name):
+    status = os.stat(path)
+    return [os.path.abspath(path), status.st_mtime_ns, status.st_size, log_dir_name]
+
+
+def _parse_config(path, log_dir_name):
+    """
+    Parse a YAML logging configuration and redirect its file handlers to the user log directory
+    """
+    # Imported here as the parsed configuration is usually taken from the cache
+    # pylint: disable=import-outside-toplevel
+    import yaml
+    from appdirs import user_log_dir
+
+    with open(path, 'rt', encoding='utf-8') as file:
+        # Load logging configfile from yaml
+        try:
+            configfile = yaml.safe_load(file)
+        except yaml.YAMLError as error:
+            raise LoggingConfigError("Error parsing logging config file '{}'".format(path)) from error
+    # File logging goes to user log directory under Microchip/modulename
+    logdir = user_log_dir(log_dir_name, "Microchip")
+    # Look through all handlers, prepend log directory to redirect all file loggers and open files lazily
+    for handler in configfile['handlers'].values():
+        # A filename key
+        if 'filename' in handler:
+            handler['filename'] = os.path.join(logdir, handler['filename'])
+            handler['class'] = LAZY_HANDLER_CLASSES.get(handler['class'], handler['class'])
+            handler.setdefault('delay', True)
+    return configfile
+
+
+def load_logging_config(path, log_dir_name, cache_path=None):
+    """
+    Load a YAML logging configuration, from the cache if the file has not changed
+
+    File handlers are redirected to the user log directory, and replaced by handlers that open their file lazily.
+
+    :param path: path to the YAML logging configuration
+    :type path: str
+    :param log_dir_name: application name used for the user log directory
+    :type log_dir_name: str
+    :param cache_path: path to the cache file, defaults to a file in the user cache directory
+    :type cache_path: str, optional
+    :return: logging configuration for logging.config.dictConfig()
+    :rtype: dict
+    :raises LoggingConfigError: if the YAML can't be parsed
+    :raises KeyError: if the configuration has no handlers section
+    """
+    if cache_path is None:
+        cache_path = _cache_path()
+    key = _cache_key(path, log_dir_name)
+    try:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            cached = json.load(cache_file)
+        if cached.get('version') == LOGGING_CACHE_FORMAT_VERSION and cached.get('key') == key:
+            return cached['config']
+    except (OSError, ValueError, AttributeError):
+        # No usable cache, parse the file
+        pass
+
+    config = _parse_config(path, log_dir_name)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+        with os.fdopen(descriptor, "w", encoding="utf-8") as cache_file:
+            json.dump({'version': LOGGING_CACHE_FORMAT_VERSION, 'key': key, 'config': config}, cache_file)
+        os.replace(temporary_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        # Caching is only an optimization
+        pass
+    return config
+
+
+def queue_file_handlers(logger_names):
+    """
+    Move the file handlers of the given loggers to a background thread
+
+    Each file handler is replaced by a queue handler feeding a listener thread, so that logging a record only
+    costs putting it in a queue.  The listeners are stopped, and queued records written, at exit or by
+    stop_queued_file_handlers().
+
+    :param logger_names: names of the loggers to update, '' for the root logger
+    :type logger_names: iterable of str
+    :return: the started listeners
+    :rtype: list of class:logging.handlers.QueueListener
+    """
+    if not _listeners:
+        atexit.register(stop_queued_file_handlers)
+    queue_handlers = {}
+    listeners = []
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        for handler in list(logger.handlers):
+            if not isinstance(handler, logging.FileHandler):
+                continue
+            if handler not in queue_handlers:
+                record_queue = queue.SimpleQueue()
+                queue_handler = logging.handlers.QueueHandler(record_queue)
+                queue_handler.setLevel(handler.level)
+                listener = logging.handlers.QueueListener(record_queue, handler, respect_handler_level=True)
+                listener.start()
+                listeners.append(listener)
+                queue_handlers[handler] = queue_handler
+            logger.removeHandler(handler)
+            logger.addHandler(queue_handlers[handler])
+    _listeners.extend(listeners)
+    return listeners
+
+
+def stop_queued_file_handlers():
+    """
+    Stop all listeners started by queue_file_handlers() once their queued records are written
+    """
+    while _listeners:
+        _listeners.pop().stop()
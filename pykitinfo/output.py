@@ -0,0 +1,179 @@
+"""
+Machine-oriented output of kit lists
+
+Kits are written one at a time as they are taken from an iterable, so that a kit list is never serialized as a whole
+and kits can be written while a scan is still running:
+
+- ndjson: one JSON object per line
+- csv: a header line with the field names, then one line per kit
+- json-compact: a single JSON array without whitespace
+
+A projection selects the fields written, by dotted paths like "usb.serial_number".  Projected kits are written as
+flat objects keyed by the paths, and fields missing from a kit are written as null in JSON and empty in CSV.
+"""
+import csv
+import json
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+FORMAT_JSON_COMPACT = 'json-compact'
+FORMATS = (FORMAT_NDJSON, FORMAT_CSV, FORMAT_JSON_COMPACT)
+
+# Fields written to CSV when no fields are given, as nested values can't be written as CSV columns
+DEFAULT_CSV_FIELDS = [
+    'usb.serial_number',
+    'usb.vendor_id',
+    'usb.product_id',
+    'usb.product_string',
+    'usb.interface',
+    'debugger.kitname',
+    'debugger.device',
+    'debugger.protocol',
+    'debugger.serial_port',
+]
+
+# One encoder is shared by all writes, with the same key order as the pretty-printed output
+_encoder = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+
+def parse_fields(value):
+    """
+    Parse a comma separated list of dotted field paths
+
+    :param value: field paths, like "usb.serial_number,debugger.serial_port"
+    :type value: str
+    :return: field paths
+    :rtype: list of str
+    :raises ValueError: if a field path is empty or has an empty part
+    """
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    if not fields:
+        raise ValueError("No fields given")
+    for field in fields:
+        if not all(field.split('.')):
+            raise ValueError("Invalid field '{}'".format(field))
+    return fields
+
+
+class Projection():
+    """
+    Selection of fields from kits
+
+    :param fields: dotted field paths
+    :type fields: list of str
+    """
+    def __init__(self, fields):
+        self.fields = list(fields)
+        # Paths are split once, not once per kit
+        self._paths = [tuple(field.split('.')) for field in self.fields]
+
+    @staticmethod
+    def _get(kit, path):
+        value = kit
+        for key in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    def values(self, kit):
+        """
+        Get the values of the fields of a kit
+
+        :param kit: kit information
+        :type kit: dict
+        :return: field values, None for fields missing from the kit
+        :rtype: list
+        """
+        return [self._get(kit, path) for path in self._paths]
+
+    def project(self, kit):
+        """
+        Get the fields of a kit as a flat dict
+
+        :param kit: kit information
+        :type kit: dict
+        :return: field values by field path
+        :rtype: dict
+        """
+        return dict(zip(self.fields, self.values(kit)))
+
+
+def _write_ndjson(kits, stream, projection, flush):
+    count = 0
+    for kit in kits:
+        stream.write(_encoder.encode(projection.project(kit) if projection else kit))
+        stream.write('\n')
+        if flush:
+            stream.flush()
+        count += 1
+    return count
+
+
+def _write_json_compact(kits, stream, projection, flush):
+    count = 0
+    stream.write('[')
+    for kit in kits:
+        if count:
+            stream.write(',')
+        stream.write(_encoder.encode(projection.project(kit) if projection else kit))
+        if flush:
+            stream.flush()
+        count += 1
+    stream.write(']\n')
+    return count
+
+
+def _csv_value(value):
+    # Nested values such as extensions are written as JSON
+    if isinstance(value, (dict, list)):
+        return _encoder.encode(value)
+    return '' if value is None else value
+
+
+def _write_csv(kits, stream, projection, flush):
+    if projection is None:
+        projection = Projection(DEFAULT_CSV_FIELDS)
+    writer = csv.writer(stream, lineterminator='\n')
+    writer.writerow(projection.fields)
+    if flush:
+        stream.flush()
+    count = 0
+    for kit in kits:
+        writer.writerow([_csv_value(value) for value in projection.values(kit)])
+        if flush:
+            stream.flush()
+        count += 1
+    return count
+
+
+_WRITERS = {
+    FORMAT_NDJSON: _write_ndjson,
+    FORMAT_CSV: _write_csv,
+    FORMAT_JSON_COMPACT: _write_json_compact,
+}
+
+
+def write_kits(kits, stream, output_format, fields=None, flush=False):
+    """
+    Write kits in a machine-oriented format
+
+    :param kits: kit information, consumed one kit at a time
+    :type kits: iterable of dict
+    :param stream: text stream to write to
+    :type stream: file-like object
+    :param output_format: one of FORMATS
+    :type output_format: str
+    :param fields: dotted paths of the fields to write, defaults to whole kits, or DEFAULT_CSV_FIELDS for CSV
+    :type fields: list of str, optional
+    :param flush: flush the stream after each kit, for kits written as they are found
+    :type flush: bool, optional
+    :return: number of kits written
+    :rtype: int
+    :raises ValueError: if the format is unknown
+    """
+    try:
+        writer = _WRITERS[output_format]
+    except KeyError:
+        raise ValueError("Unknown format {}, choose from {}".format(output_format, ', '.join(FORMATS))) from None
+    return writer(kits, stream, Projection(fields) if fields else None, flush)
@@ -0,0 +1,117 @@
+"""
+Timing of the stages of a scan.
+
+A ScanProfile passed to a scan records how long each detector, each device and each probe step took, so that slow
+kits and slow steps can be found.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+
+class ScanProfile():
+    """
+    Timings recorded during a scan
+
+    Each record holds the step name, the detector (backend name) and the device (USB serial number) it belongs to,
+    if any, and its start time and duration in seconds.  Start times are relative to the creation of the profile.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.records = []
+
+    @contextmanager
+    def stage(self, step, detector=None, device=None):
+        """
+        Time a stage of the scan
+
+        :param step: name of the step
+        :type step: str
+        :param detector: name of the backend running the step
+        :type detector: str, optional
+        :param device: serial number of the device the step is done for
+        :type device: str, optional
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            record = {
+                'step': step,
+                'detector': detector,
+                'device': device,
+                'start': start - self._origin,
+                'duration': duration
+            }
+            with self._lock:
+                self.records.append(record)
+
+    def stages(self):
+        """
+        Summarize the timings by detector and step
+
+        :return: count, total and maximum duration in seconds of each step of each detector, slowest first
+        :rtype: list of dictionaries
+        """
+        summary = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            key = (record['detector'] or '', record['step'])
+            entry = summary.setdefault(key, {'detector': record['detector'], 'step': record['step'],
+                                             'count': 0, 'total': 0.0, 'max': 0.0})
+            entry['count'] += 1
+            entry['total'] += record['duration']
+            entry['max'] = max(entry['max'], record['duration'])
+        return sorted(summary.values(), key=lambda entry: entry['total'], reverse=True)
+
+    def devices(self):
+        """
+        Summarize the time spent probing each device
+
+        :return: detector, device and total duration in seconds of all probe steps of each device, slowest first
+        :rtype: list of dictionaries
+        """
+        summary = {}
+        with self._lock:
+            records = [record for record in self.records if record['device'] is not None]
+        for record in records:
+            key = (record['detector'] or '', record['device'])
+            entry = summary.setdefault(key, {'detector': record['detector'], 'device': record['device'],
+                                             'total': 0.0})
+            entry['total'] += record['duration']
+        return sorted(summary.values(), key=lambda entry: entry['total'], reverse=True)
+
+    def to_dict(self):
+        """
+        Get all timings
+
+        :return: the raw records and both summaries
+        :rtype: dict
+        """
+        with self._lock:
+            records = list(self.records)
+        return {'records': records, 'stages': self.stages(), 'devices': self.devices()}
+
+    def format_table(self):
+        """
+        Format the timing summaries as a human readable table
+
+        :return: table text
+        :rtype: str
+        """
+        lines = ["{:<10} {:<20} {:>6} {:>12} {:>12}".format("Detector", "Step", "Count", "Total (ms)", "Max (ms)")]
+        for entry in self.stages():
+            lines.append("{:<10} {:<20} {:>6} {:>12.1f} {:>12.1f}".format(entry['detector'] or '-', entry['step'],
+                                                                        entry['count'], entry['total'] * 1000,
+                                                                        entry['max'] * 1000))
+        devices = self.devices()
+        if devices:
+            lines.append("")
+            lines.append("{:<10} {:<30} {:>12}".format("Detector", "Device", "Total (ms)"))
+            for entry in devices:
+                lines.append("{:<10} {:<30} {:>12.1f}".format(entry['detector'] or '-', entry['device'],
+                                                             entry['total'] * 1000))
+        return "\n".join(lines)
@@ -2,11 +2,20 @@
 Python Kit Info
 """
 from logging import getLogger
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
 import json
-from .detect_microchip_tools import detect_microchip_tools
-from .detect_edbg_tools import detect_edbg_kits
-from .detect_legacy_pickit3_tools import detect_pickit3s
-from .detect_mcp2221a_tools import detect_mcp2221a_kits
+from .timeouts import DEFAULT_TRANSACTION_TIMEOUT_MS
+from .scan import ScanContext, BACKEND_EDBG, BACKEND_GENX
+# The backend registry and scan_kits() live in the scan module, so that the watcher can use them, and are still
+# available from here
+from .scan import DETECTORS, HID_BACKENDS, get_detector, select_backends, scan_kits # pylint: disable=unused-import
+from .scan import import_detector, usb_serial_number
+from .tools import get_registry, INTERFACE_HID, INTERFACE_USB
+from .cache import KitInfoCache
+from .profiling import ScanProfile
+from .records import Kit, to_records
+from .output import write_kits, FORMAT_NDJSON
 
 STATUS_SUCCESS = 0
 STATUS_FAILURE = 1
@@ -14,21 +23,139 @@ STATUS_FAILURE = 1
 from . import __version__ as VERSION
 from . import BUILD_DATE, COMMIT_ID
 
-def pykitinfo(args):
+# Backends opening each kit, which are run device by device when streaming.  The other backends report kits from
+# enumeration data only, and are run for all their devices at once.
+PROBED_BACKENDS = (BACKEND_EDBG, BACKEND_GENX)
+
+# Number of devices probed at the same time when streaming
+MAX_STREAM_WORKERS = 8
+
+# Command line options that only apply to a scan, by argument name
+SCANNING_OPTIONS = (('find_one', '--find-one'), ('stream', '--stream'), ('single_flight', '--single-flight'),
+                    ('profile', '--profile'))
+# Command line options that only apply when listing kits once, not to serve or --watch
+LISTING_OPTIONS = (('format', '--format'), ('fields', '--fields'), ('daemon', '--daemon'), ('port', '--port'),
+                   ('kitname', '--kitname')) + SCANNING_OPTIONS
+
+def __getattr__(name):
+    # The detector functions used to be imported into this module, and can still be used from here
+    for detector in DETECTORS.values():
+        if isinstance(detector, str) and detector.endswith(':' + name):
+            return import_detector(detector)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def _print_profile(args, profile):
+    # Timings go to stderr to keep the kit list on stdout parseable
+    if profile is not None:
+        if args.profile == 'json':
+            print(json.dumps(profile.to_dict(), indent=2), file=sys.stderr)
+        else:
+            print(profile.format_table(), file=sys.stderr)
+
+def _print_kit(args, kit):
     """
-    Main program
+    Print a kit in short form, or only its serial port in 'brief' mode
+    """
+    if args.brief:
+        print("{}".format(kit['debugger']['serial_port']), flush=True)
+    else:
+        print("Kit {}: '{}' ({}) on {}".format(kit['usb']['serial_number'],
+                                               kit['debugger']['kitname'],
+                                               kit['debugger']['device'],
+                                               kit['debugger']['serial_port']), flush=True)
+
+def _stream_kits(args, kits):
+    """
+    Print kits as soon as they are found: as one JSON object per line in long mode, otherwise in short form
+    """
+    if args.long:
+        write_kits(kits, sys.stdout, FORMAT_NDJSON, flush=True)
+        return
+    if not args.brief:
+        print("Looking for Microchip kits...", flush=True)
+    found = 0
+    for kit in kits:
+        found += 1
+        _print_kit(args, kit)
+    if not args.brief:
+        print("Compatible kits detected: {}".format(found))
+
+def _serve(args, cache):
+    """
+    Serve the kit inventory, or watch kits, until interrupted
     """
     logger = getLogger(__name__)
-    if args.version or args.release_info:
-        print("pykitinfo version {}".format(VERSION))
-        if args.release_info:
-            print("Build date: {}".format(BUILD_DATE))
-            print("Commit ID:  {}".format(COMMIT_ID))
-        return STATUS_SUCCESS
+    if args.action == 'serve':
+        # Imported here as the daemon builds on the watcher
+        from .daemon import serve # pylint: disable=import-outside-toplevel
+        logger.debug("Serving kit inventory...")
+        serve(socket_path=args.socket, serialnumber=args.serialnumber, cache=cache, probe=not args.fast,
+              poll_interval=args.poll_interval)
+    else:
+        # Imported here as the watcher builds on this module
+        from .watch import watch_kits # pylint: disable=import-outside-toplevel
+        logger.debug("Watching kits...")
+        watch_kits(serialnumber=args.serialnumber, cache=cache, probe=not args.fast, poll_interval=args.poll_interval)
+
+def _check_options(args):
+    """
+    Check the combination of options, returning an error message if it is invalid
+    """
+    serving = 'serve' if args.action == 'serve' else '--watch' if args.watch else None
+    unused = [flag for name, flag in LISTING_OPTIONS if getattr(args, name)] if serving else []
+    unused_by_daemon = [flag for name, flag in SCANNING_OPTIONS if getattr(args, name)] if args.daemon else []
+    errors = [
+        (args.action == 'serve' and args.watch, "--watch can't be used with serve"),
+        (unused, "{} can't be used with {}".format(', '.join(unused), serving)),
+        (unused_by_daemon, "{} can't be used with --daemon".format(', '.join(unused_by_daemon))),
+        (args.fields and not args.format, "--fields requires --format"),
+        ((args.port or args.kitname) and not args.daemon, "--port and --kitname require --daemon"),
+        (args.find_one and not args.serialnumber, "--find-one requires a serial number (-s)"),
+        (args.find_one and args.stream, "--stream can't be used with --find-one"),
+    ]
+    return next((message for failed, message in errors if failed), None)
 
-    # Populate kit list
+def _stream(args, cache, profile):
+    """
+    Print kits as soon as they are found, in the requested format
+    """
+    getLogger(__name__).debug("Streaming kits...")
+    kits = detect_kits_iter(serialnumber=args.serialnumber, max_workers=args.jobs or MAX_STREAM_WORKERS,
+                            cache=cache, probe=not args.fast, profile=profile, transaction_timeout=args.timeout,
+                            extensions=not args.no_extensions, backends=args.backend)
+    if args.format:
+        write_kits(kits, sys.stdout, args.format, fields=args.fields, flush=True)
+    else:
+        _stream_kits(args, kits)
+
+def _detect_kits(args, cache, profile):
+    """
+    Get the kit list from the daemon, or by looking for a single kit or for all kits
+    """
+    logger = getLogger(__name__)
+    if args.daemon:
+        from .daemon import query_daemon # pylint: disable=import-outside-toplevel
+        logger.debug("Querying kit inventory...")
+        return query_daemon(serial_number=args.serialnumber, serial_port=args.port, kitname=args.kitname,
+                            socket_path=args.socket)
+    if args.find_one:
+        logger.debug("Looking for kit %s...", args.serialnumber)
+        kit = find_kit(args.serialnumber, cache=cache, probe=not args.fast, profile=profile,
+                       transaction_timeout=args.timeout, extensions=not args.no_extensions, backends=args.backend)
+        return [kit] if kit else []
     logger.debug("Detecting kits...")
-    kit_list = detect_all_kits(serialnumber=args.serialnumber)
+    return detect_all_kits(serialnumber=args.serialnumber, max_workers=args.jobs, cache=cache,
+                           probe=not args.fast, profile=profile, transaction_timeout=args.timeout,
+                           extensions=not args.no_extensions, backends=args.backend,
+                           single_flight=args.single_flight)
+
+def _print_kits(args, kit_list):
+    """
+    Print the kit list in the requested format
+    """
+    if args.format:
+        write_kits(kit_list, sys.stdout, args.format, fields=args.fields)
+        return
 
     # Display output, except in 'brief' mode which displays only serial port info
     if not args.brief:
@@ -41,28 +168,252 @@ def pykitinfo(args):
     else:
         # Display short form
         for kit in kit_list:
-            if args.brief:
-                print("{}".format(kit['debugger']['serial_port']))
-            else:
-                print("Kit {}: '{}' ({}) on {}".format(kit['usb']['serial_number'],
-                                                       kit['debugger']['kitname'],
-                                                       kit['debugger']['device'],
-                                                       kit['debugger']['serial_port']))
+            _print_kit(args, kit)
+
+def pykitinfo(args):
+    """
+    Main program
+    """
+    if args.version or args.release_info:
+        print("pykitinfo version {}".format(VERSION))
+        if args.release_info:
+            print("Build date: {}".format(BUILD_DATE))
+            print("Commit ID:  {}".format(COMMIT_ID))
+        return STATUS_SUCCESS
+
+    error = _check_options(args)
+    if error:
+        getLogger(__name__).error(error)
+        return STATUS_FAILURE
+
+    cache = None
+    if (args.cache or args.refresh) and not args.no_cache:
+        cache = KitInfoCache(refresh=args.refresh)
+
+    if args.action == 'serve' or args.watch:
+        _serve(args, cache)
+        return STATUS_SUCCESS
+
+    profile = ScanProfile() if args.profile else None
+
+    if args.stream:
+        _stream(args, cache, profile)
+        _print_profile(args, profile)
+        return STATUS_SUCCESS
+
+    kit_list = _detect_kits(args, cache, profile)
+    _print_profile(args, profile)
+    _print_kits(args, kit_list)
     return STATUS_SUCCESS
 
-def detect_all_kits(serialnumber=None):
+def detect_all_kits(serialnumber=None, *, max_workers=None, cache=None, probe=True, profile=None,
+                    transaction_timeout=DEFAULT_TRANSACTION_TIMEOUT_MS, extensions=True, backends=None, records=False,
+                    single_flight=False):
     """
     Look for all compatible connected kits
 
+    The USB bus is enumerated once and the snapshot is shared by all backend detectors, which are run
+    concurrently.  See scan_kits() for details.
+
     :param serialnumber: (partial) serial number to use
     :type serialnumber: str
+    :param max_workers: number of backend detectors to run concurrently, defaults to one worker per detector.
+        Use 1 to run the detectors one after another in the calling thread.
+    :type max_workers: int, optional
+    :param cache: cache of probed kit information, defaults to probing every kit.
+        The cache is saved when the scan completes.
+    :type cache: class:pykitinfo.cache.KitInfoCache, optional
+    :param probe: if False, kits are never opened and only USB properties and serial ports are reported.
+        Kit name is then the USB product string, and target device is not available.
+    :type probe: bool, optional
+    :param profile: profile to record the time taken by each detector, device and probe step in
+    :type profile: class:pykitinfo.profiling.ScanProfile, optional
+    :param transaction_timeout: maximum time in milliseconds to wait for a single USB transaction with a GENx tool.
+        A tool that times out is reported with N/A kit name and device. EDBG and PICkit 3 kits use the timeouts of
+        pyedbglib.
+    :type transaction_timeout: int, optional
+    :param extensions: if False, kits are not probed for extensions and no extensions are reported
+    :type extensions: bool, optional
+    :param backends: backends to look for kits with, defaults to all backends: 'edbg', 'pk3', 'genx' and
+        'mcp2221a'. Devices only handled by other backends are not enumerated, and their detectors are not imported.
+    :type backends: iterable of str, optional
+    :param records: if True, kits are returned as compact records instead of dictionaries
+    :type records: bool, optional
+    :param single_flight: if True, scans of concurrent processes on this host are done one at a time, and a scan
+        that was in flight when called is waited for and its result returned instead of scanning again.
+        See pykitinfo.singleflight.
+    :type single_flight: bool, optional
+    :return: kits and tools connected
+    :rtype: list of dictionaries, or list of class:pykitinfo.records.Kit if records is True
+    :raises ValueError: if a backend name is unknown
+    """
+    # pylint: disable=too-many-arguments
+    def scan():
+        context = ScanContext(cache=cache, probe=probe, profile=profile, transaction_timeout=transaction_timeout,
+                              extensions=extensions)
+        kits = scan_kits(context, serialnumber=serialnumber, max_workers=max_workers, backends=backends)
+        if cache is not None:
+            cache.save()
+        return kits
+
+    if single_flight:
+        # Imported here as it is only needed to coordinate with other processes
+        from .singleflight import SingleFlight # pylint: disable=import-outside-toplevel
+        key = {'serialnumber': serialnumber, 'probe': probe, 'extensions': extensions,
+               'backends': select_backends(backends)}
+        kit_list = SingleFlight().run(key, scan)
+    else:
+        kit_list = scan()
+
+    return to_records(kit_list) if records else kit_list
+
+def _stream_jobs(context, backends):
+    """
+    Split a scan into jobs that can be run independently: one per device of the probed backends, and one per
+    backend for the others
+
+    :return: backend name and scan context of each job
+    :rtype: list of (str, class:pykitinfo.scan.ScanContext) tuples
+    """
+    jobs = []
+    for backend in backends:
+        if backend not in PROBED_BACKENDS:
+            jobs.append((backend, context))
+        elif backend in HID_BACKENDS:
+            jobs += [(backend, context.device_context(INTERFACE_HID, device))
+                     for device in context.hid_devices(backend)]
+        else:
+            jobs += [(backend, context.device_context(INTERFACE_USB, device))
+                     for device in context.usb_devices(backend)]
+    return jobs
+
+def detect_kits_iter(serialnumber=None, *, max_workers=MAX_STREAM_WORKERS, cache=None, probe=True, profile=None,
+                     transaction_timeout=DEFAULT_TRANSACTION_TIMEOUT_MS, extensions=True, backends=None, records=False):
+    """
+    Look for all compatible connected kits, yielding each kit as soon as it has been probed
+
+    The USB bus is enumerated once, like for detect_all_kits(), and then kits are probed one by one, up to
+    max_workers at the same time.  Kits are yielded in the order they are done, which differs from scan to scan.
+    Closing the generator before it is exhausted stops the scan at the next device.
+
+    See detect_all_kits() for the other parameters.
+
+    :param max_workers: number of kits to probe at the same time. Use 1 to probe them one after another in the
+        calling thread, in the same order as detect_all_kits().
+    :type max_workers: int, optional
     :return: kits and tools connected
-    :rtype: list of dictionaries
+    :rtype: generator of dictionaries, or of class:pykitinfo.records.Kit if records is True
+    :raises ValueError: if a backend name is unknown
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    backends = select_backends(backends)
+    context = ScanContext(cache=cache, probe=probe, profile=profile, transaction_timeout=transaction_timeout,
+                          extensions=extensions)
+
+    detectors = {}
+    for backend in backends:
+        with context.stage('import', detector=backend):
+            detectors[backend] = get_detector(backend)
+
+    def run(backend, job_context):
+        return detectors[backend](serialnumber, context=job_context)
+
+    def convert(kits):
+        return to_records(kits) if records else kits
+
+    jobs = _stream_jobs(context, backends)
+    try:
+        if max_workers <= 1 or len(jobs) <= 1:
+            for backend, job_context in jobs:
+                yield from convert(run(backend, job_context))
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs)),
+                                    thread_name_prefix="pykitinfo") as executor:
+                futures = [executor.submit(run, backend, job_context) for backend, job_context in jobs]
+                try:
+                    for future in as_completed(futures):
+                        yield from convert(future.result())
+                finally:
+                    for future in futures:
+                        future.cancel()
+    finally:
+        # Stops the jobs still running when the generator is closed early
+        context.cancel()
+
+    if cache is not None:
+        cache.save()
+
+def _find_devices(context, serialnumber, backends):
     """
-    kit_list = []
-    kit_list += detect_edbg_kits(serialnumber)
-    kit_list += detect_pickit3s(serialnumber)
-    kit_list += detect_microchip_tools(serialnumber)
-    kit_list += detect_mcp2221a_kits(serialnumber)
+    Find the devices with a serial number ending in serialnumber, looking where the kit is most likely to be first
+
+    Backends are tried in the order hinted by the tool registry.  Devices of all backends are looked at, so that a
+    serial number matching kits on both hidapi and libusb is found to be ambiguous.
+
+    :return: matching devices, each with the name of its backend, in the order they were found
+    :rtype: list of (str, device) tuples
+    """
+    hinted = [backend for backend in get_registry().backends_for_serial(serialnumber) if backend in backends]
+    order = hinted + [backend for backend in backends if backend not in hinted]
+    matches = []
+    for backend in order:
+        if backend in HID_BACKENDS:
+            matches += [(backend, device) for device in context.hid_devices(backend)
+                        if (device['serial_number'] or '').endswith(serialnumber)]
+        else:
+            matches += [(backend, device) for device in context.usb_devices(backend)
+                        if (usb_serial_number(device) or '').endswith(serialnumber)]
+    return matches
+
+def find_kit(serialnumber, *, cache=None, probe=True, profile=None, transaction_timeout=DEFAULT_TRANSACTION_TIMEOUT_MS,
+             extensions=True, backends=None, records=False):
+    """
+    Find the single kit with a given serial number
+
+    Unlike detect_all_kits(), only the matching kit is probed.  The serial number format is used to look for the kit
+    with the most likely backend first.
+
+    :param serialnumber: serial number of the kit, or the end of it
+    :type serialnumber: str
+    :param cache: cache of probed kit information, defaults to probing the kit.
+        The cache is saved when the kit has been probed.
+    :type cache: class:pykitinfo.cache.KitInfoCache, optional
+    :param probe: if False, the kit is not opened and only USB properties and serial port are reported
+    :type probe: bool, optional
+    :param profile: profile to record the time taken by each step in
+    :type profile: class:pykitinfo.profiling.ScanProfile, optional
+    :param transaction_timeout: maximum time in milliseconds to wait for a single USB transaction with the kit
+    :type transaction_timeout: int, optional
+    :param extensions: if False, the kit is not probed for extensions and no extensions are reported
+    :type extensions: bool, optional
+    :param backends: backends to look for the kit with, defaults to all backends
+    :type backends: iterable of str, optional
+    :param records: if True, the kit is returned as a compact record instead of a dictionary
+    :type records: bool, optional
+    :return: kit information, or None if no kit has a matching serial number
+    :rtype: dict, or class:pykitinfo.records.Kit if records is True
+    :raises ValueError: if more than one kit has a matching serial number, or a backend name is unknown
+    """
+    # pylint: disable=too-many-arguments
+    backends = select_backends(backends)
+    context = ScanContext(cache=cache, probe=probe, profile=profile, transaction_timeout=transaction_timeout,
+                          extensions=extensions)
+    matches = _find_devices(context, serialnumber, backends)
+    if not matches:
+        return None
+    if len(matches) > 1:
+        raise ValueError("{} kits have a serial number ending with '{}'".format(len(matches), serialnumber))
+
+    backend, device = matches[0]
+    device_context = context.device_context(INTERFACE_HID if backend in HID_BACKENDS else INTERFACE_USB, device)
+    with context.stage('import', detector=backend):
+        detector = get_detector(backend)
+    with context.stage('detect', detector=backend):
+        kits = detector(serialnumber, context=device_context)
+
+    if cache is not None:
+        cache.save()
 
-    return kit_list
+    if not kits:
+        return None
+    return Kit.from_dict(kits[0]) if records else kits[0]
@@ -10,22 +10,25 @@ import argparse
 import os
 import logging
 from logging.config import dictConfig
-from pathlib import Path
 import textwrap
-import yaml
-
-
-from appdirs import user_log_dir
-from yaml.scanner import ScannerError
 
 # pykitinfo main function
 from . import pykitinfo
+from .timeouts import DEFAULT_TRANSACTION_TIMEOUT_MS
+from .output import FORMATS, parse_fields
 
 def setup_logging(user_requested_level=logging.ERROR, default_path='logging.yaml',
-                  env_key='MICROCHIP_PYTHONTOOLS_CONFIG'):
+                  env_key='MICROCHIP_PYTHONTOOLS_CONFIG', console_stream=None):
     """
     Setup logging configuration for pykitinfo CLI
+
+    :param console_stream: stream to log to the console on, such as sys.stderr to keep stdout free for
+        machine-readable output. Defaults to the stream of the logging configuration.
     """
+    # Imported here to keep startup fast when logging is not configured
+    # pylint: disable=import-outside-toplevel
+    from .logconfig import load_logging_config, queue_file_handlers, LoggingConfigError
+
     # Logging config YAML file can be specified via environment variable
     value = os.getenv(env_key, None)
     if value:
@@ -36,50 +39,57 @@ def setup_logging(user_requested_level=logging.ERROR, default_path='logging.yaml
     # Load the YAML if possible
     if os.path.exists(path):
         try:
-            with open(path, 'rt') as file:
-                # Load logging configfile from yaml
-                configfile = yaml.safe_load(file)
-                # File logging goes to user log directory under Microchip/modulename
-                logdir = user_log_dir(__name__, "Microchip")
-                # Look through all handlers, and prepend log directory to redirect all file loggers
-                num_file_handlers = 0
-                for handler in configfile['handlers'].keys():
-                    # A filename key
-                    if 'filename' in configfile['handlers'][handler].keys():
-                        configfile['handlers'][handler]['filename'] = os.path.join(
-                            logdir, configfile['handlers'][handler]['filename'])
-                        num_file_handlers += 1
-                # If file logging is enabled, it needs a folder
-                if num_file_handlers > 0:
-                    # Create it if it does not exist
-                    Path(logdir).mkdir(exist_ok=True, parents=True)
-                # Console logging takes granularity argument from CLI user
-                configfile['handlers']['console']['level'] = user_requested_level
-                # Root logger must be the most verbose of the ALL YAML configurations and the CLI user argument
-                most_verbose_logging = min(user_requested_level, getattr(logging, configfile['root']['level']))
-                for handler in configfile['handlers'].keys():
-                    # A filename key
-                    if 'filename' in configfile['handlers'][handler].keys():
-                        level = getattr(logging, configfile['handlers'][handler]['level'])
-                        most_verbose_logging = min(most_verbose_logging, level)
-                configfile['root']['level'] = most_verbose_logging
+            # Parsed config with file handlers in the user log directory under Microchip/modulename
+            configfile = load_logging_config(path, __name__)
+            # Console logging takes granularity argument from CLI user
+            configfile['handlers']['console']['level'] = user_requested_level
+            if console_stream is not None:
+                configfile['handlers']['console']['stream'] = console_stream
+            # Root logger must be the most verbose of the ALL YAML configurations and the CLI user argument
+            most_verbose_logging = min(user_requested_level, getattr(logging, configfile['root']['level']))
+            for handler in configfile['handlers'].keys():
+                # A filename key
+                if 'filename' in configfile['handlers'][handler].keys():
+                    level = getattr(logging, configfile['handlers'][handler]['level'])
+                    most_verbose_logging = min(most_verbose_logging, level)
+            configfile['root']['level'] = most_verbose_logging
             dictConfig(configfile)
+            # File writes are done by a background thread
+            queue_file_handlers([''] + list(configfile.get('loggers', {}).keys()))
             return
-        except ScannerError:
+        except LoggingConfigError as error:
             # Error while parsing YAML
-            print("Error parsing logging config file '{}'".format(path))
+            print(error, file=console_stream)
         except KeyError as keyerror:
             # Error looking for custom fields in YAML
-            print("Key {} not found in logging config file".format(keyerror))
+            print("Key {} not found in logging config file".format(keyerror), file=console_stream)
     else:
         # Config specified by environment variable not found
-        print("Unable to open logging config file '{}'".format(path))
+        print("Unable to open logging config file '{}'".format(path), file=console_stream)
 
     # If all else fails, revert to basic logging at specified level for this application
-    print("Reverting to basic logging.")
-    logging.basicConfig(level=user_requested_level)
+    print("Reverting to basic logging.", file=console_stream)
+    logging.basicConfig(level=user_requested_level, stream=console_stream)
 
 # Helper functions
+def _parse_backends(value):
+    """
+    Parse a comma separated list of backend names
+    """
+    try:
+        return pykitinfo.select_backends([backend.strip() for backend in value.split(',') if backend.strip()])
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
+def _parse_fields(value):
+    """
+    Parse a comma separated list of dotted field paths
+    """
+    try:
+        return parse_fields(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
 def _parse_literal(literal):
     """
     Literals can either be integers or float values.  Default is Integer
@@ -100,6 +110,7 @@ def main():
         description=textwrap.dedent('''\
 
     Basic actions:
+        serve: keep an inventory of the connected kits and answer --daemon queries about them over a UNIX socket
             '''),
         epilog=textwrap.dedent('''\
     Usage examples:
@@ -109,14 +120,49 @@ def main():
             pykitinfo -l
         Show basic kit information for kit with serial number that ends with ABCDEFG
             pykitinfo -s ABCDEFG
+        Quickly look up the serial port of the kit with serial number MCHP3261021800001234
+            pykitinfo -b --find-one -s MCHP3261021800001234
+        Scan the backends one after another instead of concurrently
+            pykitinfo -j 1
+        Share one scan between CI jobs starting at the same time
+            pykitinfo --single-flight
+        Print detailed kit information as JSON lines, each kit as soon as it has been probed
+            pykitinfo --stream -l
+        Write the serial number and serial port of each kit as CSV
+            pykitinfo --format csv --fields usb.serial_number,debugger.serial_port
+        Only look for nEDBG/EDBG-based kits and MPLAB PICkit 5 and similar tools
+            pykitinfo --backend edbg,genx
+        Show serial numbers and serial ports of all kits, without opening them
+            pykitinfo -f
+        Show basic kit information, using cached information for kits seen before
+            pykitinfo -c
+        Print kits as they are attached and detached until interrupted
+            pykitinfo -w
+        Show how long each detector, kit and probe step took
+            pykitinfo --profile
+        Give up on unresponsive PICkit 4, PICkit 5 and PKoB4 tools after 200 ms
+            pykitinfo --timeout 200
+        Run the inventory daemon, and look up the kit on /dev/ttyACM0 from it without touching the USB bus
+            pykitinfo serve
+            pykitinfo --daemon --port /dev/ttyACM0
             '''))
 
+    parser.add_argument("action", nargs='?', choices=['serve'],
+                        help="Action to perform, defaults to listing the connected kits")
+
     parser.add_argument("-l", "--long", action="store_true",
                         help="Show long list")
 
     parser.add_argument("-b", "--brief", action="store_true",
                         help="Show only serial port mapping for detected matching units")
 
+    parser.add_argument("--format", choices=FORMATS,
+                        help="Write kits in a machine-oriented format instead of text: JSON lines, CSV "
+                        "or a single-line JSON array")
+
+    parser.add_argument("--fields", type=_parse_fields, metavar="FIELD[,FIELD...]",
+                        help="Only write these fields with --format, as dotted paths like usb.serial_number")
+
     parser.add_argument("-v", "--verbose",
                         default="warning", choices=['debug', 'info', 'warning', 'error', 'critical'],
                         help="Logging verbosity level")
@@ -132,11 +178,79 @@ def main():
                         type=str,
                         help="USB serial number of the unit to use")
 
+    parser.add_argument("--find-one", action="store_true",
+                        help="Stop as soon as the single kit matching --serialnumber has been found, "
+                        "and only probe that kit")
+
+    parser.add_argument("--backend", type=_parse_backends, metavar="BACKEND[,BACKEND...]",
+                        help="Only look for kits with these backends: {}. "
+                        "Default is all backends".format(", ".join(pykitinfo.DETECTORS)))
+
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        help="Number of backend detectors to run concurrently (1 runs them one after another). "
+                        "With --stream, number of kits probed concurrently")
+
+    parser.add_argument("--single-flight", action="store_true",
+                        help="Wait for a scan already running in another pykitinfo process and reuse its result "
+                        "instead of scanning at the same time")
+
+    parser.add_argument("--stream", action="store_true",
+                        help="Print each kit as soon as it has been probed, in the order they are done. "
+                        "With -l kits are printed as JSON lines")
+
+    parser.add_argument("-f", "--fast", action="store_true",
+                        help="Report USB information and serial ports only, without opening the kits")
+
+    parser.add_argument("-c", "--cache", action="store_true",
+                        help="Use cached kit information for kits seen before, and cache it for new kits")
+
+    parser.add_argument("--refresh", action="store_true",
+                        help="Probe all kits again and refresh their cached kit information")
+
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not use the kit information cache (overrides --cache and --refresh)")
+
+    parser.add_argument("-w", "--watch", action="store_true",
+                        help="Keep running and print kits as they are attached and detached, as JSON lines")
+
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="Polling interval in seconds for --watch where hotplug events are unavailable")
+
+    parser.add_argument("--no-extensions", action="store_true",
+                        help="Do not look for extension boards on the ID channels of kits")
+
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TRANSACTION_TIMEOUT_MS, metavar="MS",
+                        help="Maximum time in milliseconds to wait for a single USB transaction with a GENx tool, "
+                        "such as a PICkit 4 or 5 or a PKoB4 kit. A tool that times out is listed with N/A kit name "
+                        "and device. EDBG and PICkit 3 kits are not affected.")
+
+    parser.add_argument("--daemon", action="store_true",
+                        help="Look up kits in the inventory of a running 'pykitinfo serve' instead of scanning")
+
+    parser.add_argument("--port", type=str,
+                        help="With --daemon, only show the kit on this serial port")
+
+    parser.add_argument("--kitname", type=str,
+                        help="With --daemon, only show kits with this kit name, ignoring case")
+
+    parser.add_argument("--socket", type=str, metavar="PATH",
+                        help="UNIX socket of the inventory daemon, defaults to $PYKITINFO_SOCKET or a socket in the "
+                        "user cache directory")
+
+    parser.add_argument("--profile", nargs='?', const='table', choices=['table', 'json'],
+                        help="Print the time taken by each detector, kit and probe step to stderr, "
+                        "as a table (default) or as JSON")
+
     # Parse args
     arguments = parser.parse_args()
 
-    # Setup logging
-    setup_logging(user_requested_level=getattr(logging, arguments.verbose.upper()))
+    # Setup logging, except when only printing the version
+    if not (arguments.version or arguments.release_info):
+        # Log messages must not end up in machine-readable output on stdout
+        machine_readable = arguments.format or arguments.watch or (arguments.stream and arguments.long)
+        setup_logging(user_requested_level=getattr(logging, arguments.verbose.upper()),
+                      console_stream=sys.stderr if machine_readable else None)
     logger = logging.getLogger(__name__)
     try:
         # Call main with args
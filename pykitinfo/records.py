@@ -0,0 +1,220 @@
+"""
+Compact kit records
+
+Kits are reported as nested dicts by the detectors.  The record classes here hold the same information in __slots__
+based objects with attribute access, which take a fraction of the memory of the dicts when many kits or scans are
+kept around.  to_dict() gives back the dicts exactly as reported, so that the JSON output of a record is the same
+as the JSON output of the kit it was made from.
+
+Values are kept as reported by the detectors, for example the target device is '' or 'N/A' depending on the backend
+when it is not known.
+"""
+
+
+class _Record:
+    """
+    Base class of the records: equality, representation and conversion to dict from the record fields
+    """
+    __slots__ = ()
+
+    def _fields(self):
+        return [(name, getattr(self, name)) for name in self.__slots__]
+
+    def __eq__(self, other):
+        if type(other) is not type(self): # pylint: disable=unidiomatic-typecheck
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__,
+                               ", ".join("{}={!r}".format(name, value) for name, value in self._fields()))
+
+    def to_dict(self):
+        """
+        Convert the record to the dict form reported by the detectors
+
+        :return: kit information
+        :rtype: dict
+        """
+        return dict(self._fields())
+
+
+class UsbInfo(_Record):
+    """
+    USB properties of a kit, the 'usb' entry of a kit
+
+    :param interface: 'hid' for kits found by hidapi, 'winusb' for kits found by libusb
+    :type interface: str
+    :param packet_size: USB packet size, 0 if not known
+    :type packet_size: int
+    :param product_id: USB product ID
+    :type product_id: int
+    :param product_string: USB product string
+    :type product_string: str
+    :param serial_number: USB serial number
+    :type serial_number: str
+    :param vendor_id: USB vendor ID
+    :type vendor_id: int
+    """
+    __slots__ = ('interface', 'packet_size', 'product_id', 'product_string', 'serial_number', 'vendor_id')
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, *, interface, packet_size, product_id, product_string, serial_number, vendor_id):
+        self.interface = interface
+        self.packet_size = packet_size
+        self.product_id = product_id
+        self.product_string = product_string
+        self.serial_number = serial_number
+        self.vendor_id = vendor_id
+
+    @classmethod
+    def from_dict(cls, usb):
+        """
+        Make a record from the 'usb' entry of a kit
+
+        :param usb: USB properties
+        :type usb: dict
+        :return: USB properties record
+        :rtype: class:UsbInfo
+        """
+        return cls(**usb)
+
+
+class DebuggerInfo(_Record):
+    """
+    Debugger properties of a kit, the 'debugger' entry of a kit
+
+    :param device: target device name, '' or 'N/A' if not known
+    :type device: str
+    :param kitname: kit name
+    :type kitname: str
+    :param protocol: protocol used to talk to the debugger, 'N/A' if not known
+    :type protocol: str
+    :param serial_number: debugger serial number
+    :type serial_number: str
+    :param serial_port: virtual serial port of the kit, 'N/A' if it has none or it was not found
+    :type serial_port: str
+    :param product: CMSIS-DAP product name, only reported for probed EDBG-based kits
+    :type product: str, optional
+    """
+    __slots__ = ('device', 'kitname', 'protocol', 'serial_number', 'serial_port', 'product')
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, *, device, kitname, protocol, serial_number, serial_port, product=None):
+        self.device = device
+        self.kitname = kitname
+        self.protocol = protocol
+        self.serial_number = serial_number
+        self.serial_port = serial_port
+        self.product = product
+
+    @classmethod
+    def from_dict(cls, debugger):
+        """
+        Make a record from the 'debugger' entry of a kit
+
+        :param debugger: debugger properties
+        :type debugger: dict
+        :return: debugger properties record
+        :rtype: class:DebuggerInfo
+        """
+        return cls(**debugger)
+
+    def to_dict(self):
+        debugger = super().to_dict()
+        if self.product is None:
+            del debugger['product']
+        return debugger
+
+
+class Extension(_Record):
+    """
+    Extension board found on an ID channel of a kit, an item of the 'extensions' entry of a kit
+
+    :param ext: ID channel
+    :type ext: int
+    :param manufacturer: extension manufacturer
+    :type manufacturer: str
+    :param name: extension name
+    :type name: str
+    :param power: extension power requirement, as read from the extension
+    :type power: str
+    :param serial_number: extension serial number
+    :type serial_number: str
+    """
+    __slots__ = ('ext', 'manufacturer', 'name', 'power', 'serial_number')
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, *, ext, manufacturer, name, power, serial_number):
+        self.ext = ext
+        self.manufacturer = manufacturer
+        self.name = name
+        self.power = power
+        self.serial_number = serial_number
+
+    @classmethod
+    def from_dict(cls, extension):
+        """
+        Make a record from an item of the 'extensions' entry of a kit
+
+        :param extension: extension properties
+        :type extension: dict
+        :return: extension record
+        :rtype: class:Extension
+        """
+        return cls(**extension)
+
+
+class Kit(_Record):
+    """
+    Kit as reported by the detectors
+
+    :param usb: USB properties
+    :type usb: class:UsbInfo
+    :param debugger: debugger properties
+    :type debugger: class:DebuggerInfo
+    :param extensions: extensions found on the kit, None for kits that were not probed for extensions
+    :type extensions: list of class:Extension, optional
+    """
+    __slots__ = ('usb', 'debugger', 'extensions')
+
+    def __init__(self, usb, debugger, extensions=None):
+        self.usb = usb
+        self.debugger = debugger
+        self.extensions = extensions
+
+    @classmethod
+    def from_dict(cls, kit):
+        """
+        Make a record from a kit as reported by the detectors
+
+        :param kit: kit information
+        :type kit: dict
+        :return: kit record
+        :rtype: class:Kit
+        """
+        extensions = kit.get('extensions')
+        if extensions is not None:
+            extensions = [Extension.from_dict(extension) for extension in extensions]
+        return cls(UsbInfo.from_dict(kit['usb']), DebuggerInfo.from_dict(kit['debugger']), extensions)
+
+    def to_dict(self):
+        kit = {
+            'usb': self.usb.to_dict(),
+            'debugger': self.debugger.to_dict()
+        }
+        if self.extensions is not None:
+            kit['extensions'] = [extension.to_dict() for extension in self.extensions]
+        return kit
+
+
+def to_records(kits):
+    """
+    Convert kits as reported by the detectors to records
+
+    :param kits: kit information
+    :type kits: list of dict
+    :return: kit records
+    :rtype: list of class:Kit
+    """
+    return [Kit.from_dict(kit) for kit in kits]
@@ -0,0 +1,418 @@
+"""
+Scan context shared by all detectors during a single scan, and the backend detectors run on it.
+
+The USB bus is enumerated once per scan, and each enumerated device is routed to exactly one backend detector.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from contextlib import nullcontext
+from types import MappingProxyType
+from logging import getLogger
+from .tools import MICROCHIP_VID, INTERFACE_HID, INTERFACE_USB
+from .tools import get_registry
+from .timeouts import DEFAULT_TRANSACTION_TIMEOUT_MS
+
+# Backend names
+BACKEND_EDBG = 'edbg'
+BACKEND_PK3 = 'pk3'
+BACKEND_GENX = 'genx'
+BACKEND_MCP2221A = 'mcp2221a'
+
+# Backend detectors by backend name, in the order their results are reported.
+# Detectors are named as "module:function" and only imported when run, so that the USB libraries they depend on
+# are not loaded until a scan is done.
+DETECTORS = {
+    BACKEND_EDBG: "pykitinfo.detect_edbg_tools:detect_edbg_kits",
+    BACKEND_PK3: "pykitinfo.detect_legacy_pickit3_tools:detect_pickit3s",
+    BACKEND_GENX: "pykitinfo.detect_microchip_tools:detect_microchip_tools",
+    BACKEND_MCP2221A: "pykitinfo.detect_mcp2221a_tools:detect_mcp2221a_kits"
+}
+
+# Backends handling devices enumerated by hidapi, the others handle devices found by libusb
+HID_BACKENDS = (BACKEND_EDBG, BACKEND_PK3, BACKEND_MCP2221A)
+
+
+def route_hid_device(device):
+    """
+    Find the backend responsible for a HID device
+
+    :param device: HID device as enumerated by hidapi
+    :type device: dict
+    :return: backend name, or None if no backend supports the device
+    :rtype: str
+    """
+    tool = get_registry().lookup(INTERFACE_HID, device['vendor_id'], device['product_id'], device['product_string'])
+    return tool['backend'] if tool else None
+
+
+def route_usb_device(device):
+    """
+    Find the backend responsible for a (non-HID) USB device
+
+    :param device: pyusb USB device
+    :type device: class:usb.core.Device
+    :return: backend name, or None if no backend supports the device
+    :rtype: str
+    """
+    tool = get_registry().lookup(INTERFACE_USB, device.idVendor, device.idProduct)
+    return tool['backend'] if tool else None
+
+
+def usb_serial_number(device):
+    """
+    Read the serial number of a libusb device
+
+    :param device: pyusb USB device
+    :type device: class:usb.core.Device
+    :return: serial number, or None if it can't be read
+    :rtype: str
+    """
+    import usb # pylint: disable=import-outside-toplevel
+    try:
+        serial_number = device.serial_number
+    except (ValueError, usb.core.USBError):
+        return None
+    finally:
+        usb.util.dispose_resources(device)
+    return serial_number.replace('\u0000', '') if serial_number else None
+
+
+class SerialPortIndex():
+    """
+    Index of the USB virtual serial ports on the host, keyed by USB serial number
+
+    :param ports: serial ports as listed by pyserial
+    :type ports: iterable of class:serial.tools.list_ports_common.ListPortInfo
+    """
+    def __init__(self, ports):
+        self.logger = getLogger(__name__)
+        self.ports = tuple(port for port in ports if "USB" in port.hwid)
+        self._by_serial_number = {}
+        for port in self.ports:
+            if port.serial_number is None:
+                # On Mac MCP2221 serial port on some Curiosity Development Boards have proven to not have a serial
+                # number associated, so these ports can only be found by VID/PID
+                self.logger.debug("No serial number associated with %s", port.hwid)
+                continue
+            self._by_serial_number.setdefault(port.serial_number, []).append(port)
+
+    @staticmethod
+    def _usb_id_matches(port, vendor_id, product_id):
+        return (vendor_id is None or port.vid == vendor_id) and (product_id is None or port.pid == product_id)
+
+    def find_port(self, serial_number, vendor_id=None, product_id=None):
+        """
+        Find the serial port of a USB device
+
+        :param serial_number: USB serial number of the device
+        :type serial_number: str
+        :param vendor_id: only consider ports with this USB vendor ID
+        :type vendor_id: int, optional
+        :param product_id: only consider ports with this USB product ID
+        :type product_id: int, optional
+        :return: serial port name, or None if the device has no serial port
+        :rtype: str
+        """
+        for port in self._by_serial_number.get(serial_number, ()):
+            if self._usb_id_matches(port, vendor_id, product_id):
+                return port.device
+        return None
+
+    def find_ports(self, vendor_id=None, product_id=None):
+        """
+        Find all serial ports with a given USB vendor and product ID, including ports without a serial number
+
+        :param vendor_id: USB vendor ID
+        :type vendor_id: int, optional
+        :param product_id: USB product ID
+        :type product_id: int, optional
+        :return: serial ports as listed by pyserial
+        :rtype: list of class:serial.tools.list_ports_common.ListPortInfo
+        """
+        return [port for port in self.ports if self._usb_id_matches(port, vendor_id, product_id)]
+
+
+class ScanContext():
+    """
+    Snapshot of the USB bus shared by the detectors of a single scan
+
+    Each enumeration is done at most once, on first use, and the resulting snapshot is never modified.
+    A context can also be created from existing snapshots, in which case no enumeration is done at all.
+
+    :param hid_devices: HID devices as enumerated by hidapi, defaults to enumerating on first use
+    :type hid_devices: iterable of dict, optional
+    :param usb_devices: Microchip USB devices as found by libusb, defaults to enumerating on first use
+    :type usb_devices: iterable of class:usb.core.Device, optional
+    :param serial_ports: serial ports as listed by pyserial, defaults to listing on first use
+    :type serial_ports: iterable of class:serial.tools.list_ports_common.ListPortInfo, optional
+    :param cache: cache of probed kit information, defaults to probing every kit
+    :type cache: class:pykitinfo.cache.KitInfoCache, optional
+    :param probe: if False, kits are never opened and only information available from enumeration is reported
+    :type probe: bool, optional
+    :param profile: profile to record the timings of the scan in, defaults to no timing
+    :type profile: class:pykitinfo.profiling.ScanProfile, optional
+    :param transaction_timeout: maximum time in milliseconds to wait for a single USB transaction with a GENx tool
+    :type transaction_timeout: int, optional
+    :param extensions: if False, kits are not probed for extensions and no extensions are reported
+    :type extensions: bool, optional
+    :param extension_cache: cache of the extensions read from the kits, defaults to reading the extensions of every
+        kit. Entries of detached kits must be dropped by the owner of the cache.
+    :type extension_cache: class:pykitinfo.cache.ExtensionCache, optional
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, hid_devices=None, usb_devices=None, serial_ports=None, *, cache=None, probe=True, profile=None,
+                 transaction_timeout=DEFAULT_TRANSACTION_TIMEOUT_MS, extensions=True, extension_cache=None):
+        # pylint: disable=too-many-arguments
+        self.logger = getLogger(__name__)
+        self.cache = cache
+        self.probe = probe
+        self.extensions = extensions
+        self.extension_cache = extension_cache
+        self.profile = profile
+        self.transaction_timeout = transaction_timeout
+        self._cancelled = threading.Event()
+        self._hid_lock = threading.Lock()
+        self._usb_lock = threading.Lock()
+        self._serial_port_lock = threading.Lock()
+        self._hid_routes = None
+        self._usb_routes = None
+        self._serial_ports = None
+        self._parent = None
+        if serial_ports is not None:
+            self._serial_ports = SerialPortIndex(serial_ports)
+        if hid_devices is not None:
+            self._hid_routes = self._route(hid_devices, route_hid_device, MappingProxyType)
+        if usb_devices is not None:
+            self._usb_routes = self._route(usb_devices, route_usb_device)
+
+    @staticmethod
+    def _route(devices, router, wrap=None):
+        """
+        Sort devices by the backend responsible for them, leaving out unsupported devices
+        """
+        routes = {}
+        for device in devices:
+            backend = router(device)
+            if backend:
+                routes.setdefault(backend, []).append(wrap(device) if wrap else device)
+        return {backend: tuple(routed) for backend, routed in routes.items()}
+
+    def device_context(self, interface, device):
+        """
+        Make a context for probing a single device of this scan
+
+        The device context shares the settings, caches, cancellation and serial ports of this scan, so that devices
+        can be probed one by one without enumerating the bus again.
+
+        :param interface: INTERFACE_HID for a device enumerated by hidapi, INTERFACE_USB for a device found by libusb
+        :type interface: str
+        :param device: enumerated device
+        :type device: dict or class:usb.core.Device
+        :return: scan context with only this device
+        :rtype: class:ScanContext
+        """
+        # pylint: disable=protected-access
+        context = ScanContext(hid_devices=[device] if interface == INTERFACE_HID else [],
+                              usb_devices=[device] if interface == INTERFACE_USB else [],
+                              cache=self.cache, probe=self.probe, profile=self.profile,
+                              transaction_timeout=self.transaction_timeout, extensions=self.extensions,
+                              extension_cache=self.extension_cache)
+        context._cancelled = self._cancelled
+        context._parent = self
+        return context
+
+    def stage(self, step, detector=None, device=None):
+        """
+        Time a stage of the scan, if the scan is profiled
+
+        :param step: name of the step
+        :type step: str
+        :param detector: name of the backend running the step
+        :type detector: str, optional
+        :param device: serial number of the device the step is done for
+        :type device: str, optional
+        :return: context manager timing the enclosed code
+        """
+        if self.profile is None:
+            return nullcontext()
+        return self.profile.stage(step, detector=detector, device=device)
+
+    def cancel(self):
+        """
+        Ask the detectors to stop probing devices
+
+        Devices already being probed are completed, and remaining devices are left out of the scan.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        """
+        Has the scan been cancelled?
+
+        :return: True if cancel() has been called
+        :rtype: bool
+        """
+        return self._cancelled.is_set()
+
+    def _hid_snapshot(self):
+        with self._hid_lock:
+            if self._hid_routes is None:
+                self.logger.debug("Enumerating HID devices")
+                # USB libraries are imported on first use to keep importing pykitinfo fast
+                import hid # pylint: disable=import-outside-toplevel
+                with self.stage('enumerate_hid'):
+                    self._hid_routes = self._route(hid.enumerate(), route_hid_device, MappingProxyType)
+        return self._hid_routes
+
+    def _usb_snapshot(self):
+        with self._usb_lock:
+            if self._usb_routes is None:
+                self.logger.debug("Enumerating Microchip USB devices")
+                import libusb_package # pylint: disable=import-outside-toplevel
+                with self.stage('enumerate_usb'):
+                    self._usb_routes = self._route(libusb_package.find(find_all=True, idVendor=MICROCHIP_VID),
+                                                   route_usb_device)
+        return self._usb_routes
+
+    def hid_devices(self, backend):
+        """
+        Get the HID devices routed to a backend
+
+        :param backend: backend name
+        :type backend: str
+        :return: HID devices as enumerated by hidapi
+        :rtype: tuple of read-only dicts
+        """
+        return self._hid_snapshot().get(backend, ())
+
+    def usb_devices(self, backend):
+        """
+        Get the USB devices found by libusb routed to a backend
+
+        :param backend: backend name
+        :type backend: str
+        :return: pyusb USB devices
+        :rtype: tuple of class:usb.core.Device
+        """
+        return self._usb_snapshot().get(backend, ())
+
+    def routed_devices(self):
+        """
+        Get all enumerated devices that are routed to a backend
+
+        :return: HID devices (read-only dicts) and pyusb USB devices, each with the name of its backend
+        :rtype: list of (str, device) tuples
+        """
+        routed = []
+        for routes in [self._hid_snapshot(), self._usb_snapshot()]:
+            for backend, devices in routes.items():
+                routed += [(backend, device) for device in devices]
+        return routed
+
+    @property
+    def serial_ports(self):
+        """
+        Index of the USB virtual serial ports on the host
+
+        :return: serial port index
+        :rtype: class:SerialPortIndex
+        """
+        if self._parent is not None:
+            return self._parent.serial_ports
+        with self._serial_port_lock:
+            if self._serial_ports is None:
+                self.logger.debug("Listing serial ports")
+                import serial.tools.list_ports # pylint: disable=import-outside-toplevel
+                with self.stage('list_serial_ports'):
+                    self._serial_ports = SerialPortIndex(serial.tools.list_ports.comports())
+        return self._serial_ports
+
+
+def import_detector(name):
+    """
+    Import a detector function
+
+    :param name: detector named as "module:function"
+    :type name: str
+    :return: detector function
+    """
+    module_name, function_name = name.split(':')
+    return getattr(import_module(module_name), function_name)
+
+
+def get_detector(backend):
+    """
+    Get the detector function of a backend, importing it if needed
+
+    :param backend: backend name
+    :type backend: str
+    :return: detector function
+    """
+    detector = DETECTORS[backend]
+    if isinstance(detector, str):
+        detector = import_detector(detector)
+    return detector
+
+
+def select_backends(backends=None):
+    """
+    Validate a selection of backends
+
+    :param backends: backend names, defaults to all backends
+    :type backends: iterable of str, optional
+    :return: selected backend names, in the order their results are reported
+    :rtype: list of str
+    :raises ValueError: if a backend name is unknown
+    """
+    if backends is None:
+        return list(DETECTORS)
+    unknown = [backend for backend in backends if backend not in DETECTORS]
+    if unknown:
+        raise ValueError("Unknown backend {}, choose from {}".format(', '.join(unknown), ', '.join(DETECTORS)))
+    return [backend for backend in DETECTORS if backend in backends]
+
+
+def scan_kits(context, serialnumber=None, max_workers=None, backends=None):
+    """
+    Run all backend detectors on a scan context
+
+    The backend detectors are run concurrently in a pool of worker threads since most of their time is spent
+    waiting for USB I/O.  Results are always merged in the same fixed order: EDBG kits, PICkit3 kits,
+    Microchip vendor class tools and MCP2221A kits.
+
+    :param context: scan context shared by the detectors
+    :type context: class:pykitinfo.scan.ScanContext
+    :param serialnumber: (partial) serial number to use
+    :type serialnumber: str
+    :param max_workers: number of backend detectors to run concurrently, defaults to one worker per detector.
+        Use 1 to run the detectors one after another in the calling thread.
+    :type max_workers: int, optional
+    :param backends: backends to run, defaults to all backends. Other detectors are never imported or run.
+    :type backends: iterable of str, optional
+    :return: kits and tools connected
+    :rtype: list of dictionaries
+    :raises ValueError: if a backend name is unknown
+    """
+    backends = select_backends(backends)
+    if max_workers is None:
+        max_workers = len(backends)
+
+    def run(backend):
+        with context.stage('import', detector=backend):
+            detector = get_detector(backend)
+        with context.stage('detect', detector=backend):
+            return detector(serialnumber, context=context)
+
+    if max_workers <= 1 or len(backends) <= 1:
+        results = [run(backend) for backend in backends]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pykitinfo") as executor:
+            # map() returns results in submission order regardless of completion order
+            results = list(executor.map(run, backends))
+
+    kit_list = []
+    for result in results:
+        kit_list += result
+    return kit_list
@@ -0,0 +1,118 @@
+"""
+Single-flight scans shared by concurrent processes.
+
+When several processes scan at the same time they race to open the same kits, and kits that are busy in one process
+can't be connected to by the others.  A single-flight scan takes an exclusive lock on a file in the user cache
+directory while scanning.  The result is written to a snapshot file before the lock is released.  Processes that
+started waiting for the lock while a scan was in flight take its result from the snapshot instead of scanning again,
+so N concurrent callers cost one scan, and each of them gets the result of a complete scan.
+
+Results are only shared between scans with the same parameters, other scans wait for the lock and then scan.
+"""
+import os
+import json
+import time
+import tempfile
+from logging import getLogger
+
+LOCK_FILENAME = "scan.lock"
+SNAPSHOT_FILENAME = "scan-snapshot.json"
+SNAPSHOT_FORMAT_VERSION = 1
+
+if os.name == 'nt':
+    import msvcrt # pylint: disable=import-error
+
+    def _lock(file):
+        while True:
+            try:
+                # Locks the first byte, retrying for 10 seconds before raising OSError
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock(file):
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class SingleFlight():
+    """
+    Runs a scan at most once at a time on the host, sharing its result with the processes waiting for it
+
+    :param directory: directory of the lock and snapshot files, defaults to the user cache directory
+    :type directory: str, optional
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, directory=None):
+        self.logger = getLogger(__name__)
+        if directory is None:
+            from appdirs import user_cache_dir # pylint: disable=import-outside-toplevel
+            directory = user_cache_dir("pykitinfo", "Microchip")
+        self.directory = directory
+        self.lock_path = os.path.join(directory, LOCK_FILENAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILENAME)
+
+    def _read_snapshot(self, key, since):
+        """
+        Read the result of a scan with the same key that completed at or after since, or None if there is none
+        """
+        try:
+            with open(self.snapshot_path, 'rt', encoding='utf8') as file:
+                snapshot = json.load(file)
+            if (snapshot.get('version') == SNAPSHOT_FORMAT_VERSION and snapshot['key'] == key
+                    and snapshot['completed'] >= since):
+                return snapshot['result']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            self.logger.debug("Ignoring unreadable scan snapshot '%s': %s", self.snapshot_path, exc)
+        return None
+
+    def _write_snapshot(self, key, result):
+        snapshot = {'version': SNAPSHOT_FORMAT_VERSION, 'key': key, 'completed': time.time(), 'result': result}
+        temp_path = None
+        try:
+            # Write to a temporary file and replace, so that readers never see a partial snapshot
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".scan-snapshot-")
+            with os.fdopen(handle, 'wt', encoding='utf8') as file:
+                json.dump(snapshot, file, separators=(',', ':'), ensure_ascii=False)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as exc:
+            self.logger.warning("Unable to write scan snapshot '%s': %s", self.snapshot_path, exc)
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def run(self, key, scan):
+        """
+        Run a scan, or take the result of the scan that was in flight when called
+
+        :param key: JSON serializable parameters of the scan. Results are only shared between scans with equal keys.
+        :param scan: function doing the scan
+        :type scan: callable returning a JSON serializable result
+        :return: scan result
+        """
+        # JSON round trip, so that the key compares equal to the key read from the snapshot
+        key = json.loads(json.dumps(key))
+        since = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a+b') as lock_file:
+            _lock(lock_file)
+            try:
+                result = self._read_snapshot(key, since)
+                if result is not None:
+                    self.logger.debug("Using the result of a concurrent scan")
+                    return result
+                result = scan()
+                self._write_snapshot(key, result)
+                return result
+            finally:
+                _unlock(lock_file)
@@ -0,0 +1,65 @@
+"""
+Benchmark of pykitinfo startup time.
+
+Each command is run in a fresh interpreter a number of times and the median wall time is reported, next to an empty
+interpreter for reference:
+
+    python -m pykitinfo.tests.benchmark_import
+    python -m pykitinfo.tests.benchmark_import --runs 20 --json
+"""
+import sys
+import time
+import json
+import argparse
+import statistics
+import subprocess
+
+COMMANDS = {
+    'python': [sys.executable, "-c", "pass"],
+    'import pykitinfo.pykitinfo': [sys.executable, "-c", "import pykitinfo.pykitinfo"],
+    'pykitinfo -V': [sys.executable, "-m", "pykitinfo.pykitinfo_cli", "-V"],
+}
+DEFAULT_RUNS = 10
+
+
+def measure(command, runs=DEFAULT_RUNS):
+    """
+    Measure the wall time of a command
+
+    :param command: command line to run
+    :type command: list of str
+    :param runs: number of times to run the command
+    :type runs: int
+    :return: median wall time in seconds
+    :rtype: float
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    """
+    Measure all commands and print the results
+    """
+    parser = argparse.ArgumentParser(description="Benchmark pykitinfo startup time")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="Number of runs of each command")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    arguments = parser.parse_args()
+
+    results = {name: measure(command, arguments.runs) for name, command in COMMANDS.items()}
+
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    for name, wall_time in results.items():
+        print("{:<30} {:>8.1f} ms".format(name, wall_time * 1000))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
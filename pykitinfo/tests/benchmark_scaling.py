@@ -0,0 +1,86 @@
+"""
+Benchmark of detect_all_kits() against a growing number of simulated kits.
+
+Runs offline on the simulated USB backends, reporting wall time, USB transactions and peak memory per scan:
+
+    python -m pykitinfo.tests.benchmark_scaling
+    python -m pykitinfo.tests.benchmark_scaling --kits 1 10 --latency 0.002 --json
+"""
+import sys
+import time
+import json
+import argparse
+import tracemalloc
+from pykitinfo.pykitinfo import detect_all_kits
+from pykitinfo.tests.simulated_backends import SimulatedBus, make_kits
+
+DEFAULT_KIT_COUNTS = [1, 10, 50, 200]
+# Typical round trip of a full speed USB HID transaction
+DEFAULT_LATENCY = 0.001
+DEFAULT_ENUMERATION_LATENCY = 0.005
+
+
+def run_benchmark(kit_count, latency=DEFAULT_LATENCY, enumeration_latency=DEFAULT_ENUMERATION_LATENCY,
+                  **scan_args):
+    """
+    Scan a simulated bus once
+
+    :param kit_count: number of simulated kits
+    :type kit_count: int
+    :param latency: time in seconds taken by each USB transaction
+    :type latency: float
+    :param enumeration_latency: time in seconds taken by each enumeration of the bus
+    :type enumeration_latency: float
+    :param scan_args: further arguments to detect_all_kits()
+    :return: kit count, kits found, wall time in seconds, transaction counts and peak memory in bytes
+    :rtype: dict
+    """
+    bus = SimulatedBus(make_kits(kit_count), latency=latency, enumeration_latency=enumeration_latency)
+    with bus.patch():
+        tracemalloc.start()
+        start = time.perf_counter()
+        kits = detect_all_kits(**scan_args)
+        wall_time = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'kits': kit_count,
+        'found': len(kits),
+        'wall_time': wall_time,
+        'transactions': sum(bus.counts.values()),
+        'transaction_counts': dict(bus.counts),
+        'peak_memory': peak_memory,
+    }
+
+
+def main():
+    """
+    Run the benchmark for each kit count and print the results
+    """
+    parser = argparse.ArgumentParser(description="Benchmark kit detection against simulated kits")
+    parser.add_argument("--kits", type=int, nargs='+', default=DEFAULT_KIT_COUNTS,
+                        help="Numbers of simulated kits to scan")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY,
+                        help="Time in seconds taken by each USB transaction")
+    parser.add_argument("--enumeration-latency", type=float, default=DEFAULT_ENUMERATION_LATENCY,
+                        help="Time in seconds taken by each enumeration of the bus")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    arguments = parser.parse_args()
+
+    results = [run_benchmark(count, latency=arguments.latency, enumeration_latency=arguments.enumeration_latency)
+               for count in arguments.kits]
+
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print("{:>6} {:>6} {:>12} {:>13} {:>14}".format("Kits", "Found", "Wall (ms)", "Transactions", "Peak mem (kB)"))
+    for result in results:
+        print("{:>6} {:>6} {:>12.1f} {:>13} {:>14.1f}".format(result['kits'], result['found'],
+                                                             result['wall_time'] * 1000, result['transactions'],
+                                                             result['peak_memory'] / 1024))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+"""
+Simulated USB backends for testing and benchmarking the detectors without hardware.
+
+A SimulatedBus replaces hidapi, the pyedbglib HID transport, libusb_package.find and pyserial comports with fakes
+serving a list of simulated kits.  The fakes answer the CMSIS-DAP, EDBG GET_CONFIG, JTAGICE3 ID chip and GENx config
+area commands sent by the detectors, add a configurable latency to each USB transaction and count the transactions
+done.
+
+Example:
+
+.. code-block:: python
+
+    bus = SimulatedBus(make_kits(10), latency=0.001)
+    with bus.patch():
+        kits = detect_all_kits()
+    print(bus.counts)
+"""
+import time
+import threading
+from types import SimpleNamespace
+from contextlib import contextmanager, ExitStack
+import usb
+from mock import patch
+from serial.tools.list_ports_common import ListPortInfo
+
+ATMEL_VID = 0x03EB
+MICROCHIP_VID = 0x04D8
+
+# Simulated kit types
+KIT_EDBG = 'edbg'
+KIT_MEDBG = 'medbg'
+KIT_ATMELICE = 'atmelice'
+KIT_PICKIT3 = 'pickit3'
+KIT_MCP2221A = 'mcp2221a'
+KIT_PICKIT5 = 'pickit5'
+KIT_NEDBG = 'nedbg'
+KIT_PKOB4 = 'pkob4'
+KIT_TYPES = [KIT_EDBG, KIT_MEDBG, KIT_ATMELICE, KIT_PICKIT3, KIT_MCP2221A, KIT_PICKIT5, KIT_NEDBG, KIT_PKOB4]
+# Kit types found by libusb, the others are HID devices
+LIBUSB_KIT_TYPES = [KIT_PICKIT5, KIT_PKOB4]
+# Kit types with a kit name in the board configuration area
+CONFIG_AREA_KIT_TYPES = [KIT_NEDBG, KIT_PKOB4]
+
+# CMSIS-DAP and EDBG commands answered by the simulated firmware
+DAP_INFO = 0x00
+AVR_COMMAND = 0x80
+AVR_RESPONSE = 0x81
+AVR_GET_CONFIG = 0x83
+JTAGICE3_TOKEN = 0x0E
+# AVR responses are split in fragments fitting the smallest HID report size, 64 bytes
+AVR_FRAGMENT_SIZE = 60
+EDBG_CMD_QUERY = 0x00
+EDBG_CMD_REFRESH_ID_CHIP = 0x51
+EDBG_CMD_READ_ID_CHIP = 0x7E
+EDBG_CONFIG_KIT_NAME = 0x02
+EDBG_CONFIG_TARGET_DEVICE_NAME = 0x04
+EDBG_CONFIG_RAW_ACCESS = 0x40
+# Offset of the user configuration block in raw config accesses
+EDBG_USER_CONFIG_OFFSET = 0xC00
+# GENx command reading the PKoB4 config area
+GENX_GET_PKOB_CONFIG_AREA = 0xF1
+
+# Board configuration area, laid out as in specification 1.14.10 bundled with pydebuggerconfig
+CONFIG_SIZE = 512
+CONFIG_VERSION = (1, 14, 10)
+CONFIG_STRINGS = {
+    'KITNAME': (0x048, 60),
+    'MNFRNAME': (0x084, 60),
+    'DEVNAME': (0x0C0, 32),
+    'SERNUM': (0x0E0, 20),
+}
+
+# DAP_Info IDs
+DAP_ID_PRODUCT = 0x02
+DAP_ID_SER_NUM = 0x03
+DAP_ID_DEVICE_NAME = 0x06
+
+
+class SimulatedKit():
+    """
+    A kit on the simulated USB bus
+
+    :param kit_type: one of KIT_TYPES
+    :type kit_type: str
+    :param serial_number: USB serial number
+    :type serial_number: str
+    :param index: position on the bus, used for USB address and serial port name
+    :type index: int
+    :param responsive: if False the kit never answers GENx commands, so reading its config area times out
+    :type responsive: bool
+    """
+    # USB IDs, product string and serial port by kit type
+    USB_IDS = {
+        KIT_EDBG: (ATMEL_VID, 0x2111, "EDBG CMSIS-DAP", True),
+        KIT_MEDBG: (ATMEL_VID, 0x2145, "mEDBG CMSIS-DAP", True),
+        KIT_ATMELICE: (ATMEL_VID, 0x2141, "Atmel-ICE CMSIS-DAP", False),
+        KIT_PICKIT3: (MICROCHIP_VID, 0x900A, "PICkit 3", False),
+        KIT_MCP2221A: (MICROCHIP_VID, 0x00DD, "MCP2221 USB-I2C/UART Combo", True),
+        KIT_PICKIT5: (MICROCHIP_VID, 0x9036, "MPLAB PICkit 5", True),
+        KIT_NEDBG: (ATMEL_VID, 0x2175, "nEDBG CMSIS-DAP", True),
+        KIT_PKOB4: (MICROCHIP_VID, 0x810B, "MPLAB PKoB 4", True),
+    }
+
+    def __init__(self, kit_type, serial_number, index=0, responsive=True):
+        self.kit_type = kit_type
+        self.serial_number = serial_number
+        self.index = index
+        self.responsive = responsive
+        self.vendor_id, self.product_id, self.product_string, self.has_serial_port = self.USB_IDS[kit_type]
+        self.kitname = "Simulated {} kit {}".format(kit_type, index)
+        self.device_name = "ATmega4809"
+        # Extension connected to the first ID channel of EDBG kits
+        self.extension = b"Microchip\0OLED1 Xplained Pro\0 5\0" + serial_number.encode() + b"\0"
+        self._avr_fragments = []
+        self._avr_fragment_count = 0
+
+    @property
+    def is_hid(self):
+        """Is the kit a HID device?"""
+        return self.kit_type not in LIBUSB_KIT_TYPES
+
+    def config_area(self):
+        """
+        Board configuration area of the kit
+
+        :rtype: bytearray
+        """
+        major, minor, build = CONFIG_VERSION
+        data = bytearray(CONFIG_SIZE)
+        data[0:4] = bytearray([major, minor, build & 0xFF, build >> 8])
+        values = {
+            'KITNAME': self.kitname,
+            'MNFRNAME': "Microchip Technology",
+            'DEVNAME': self.device_name,
+            'SERNUM': self.serial_number,
+        }
+        for name, (offset, size) in CONFIG_STRINGS.items():
+            data[offset:offset + size] = values[name].encode().ljust(size, b'\0')[:size]
+        return data
+
+    def hid_info(self):
+        """
+        HID device as enumerated by hidapi
+
+        :rtype: dict
+        """
+        return {
+            'path': "/dev/hidraw{}".format(self.index).encode(),
+            'vendor_id': self.vendor_id,
+            'product_id': self.product_id,
+            'serial_number': self.serial_number,
+            'product_string': self.product_string,
+            'manufacturer_string': "Microchip Technology Incorporated",
+            'interface_number': 0,
+        }
+
+    def serial_port(self):
+        """
+        Serial port as listed by pyserial
+
+        :rtype: class:serial.tools.list_ports_common.ListPortInfo
+        """
+        port = ListPortInfo("/dev/ttyACM{}".format(self.index), skip_link_detection=True)
+        port.vid = self.vendor_id
+        port.pid = self.product_id
+        port.serial_number = self.serial_number
+        port.location = "1-{}:1.1".format(self.index)
+        port.apply_usb_info()
+        return port
+
+    def respond(self, packet):
+        """
+        Answer a CMSIS-DAP command
+
+        :param packet: command, without HID report ID
+        :type packet: bytearray
+        :return: response
+        :rtype: bytearray
+        """
+        command = packet[0]
+        if command == DAP_INFO:
+            value = {
+                DAP_ID_PRODUCT: self.product_string.split(' CMSIS-DAP')[0],
+                DAP_ID_SER_NUM: self.serial_number,
+                # EDBG does not report the target device in DAP_Info
+                DAP_ID_DEVICE_NAME: '' if self.kit_type == KIT_EDBG else self.device_name,
+            }.get(packet[1], '').encode()
+            return bytearray([DAP_INFO, len(value)]) + value
+        if command == AVR_GET_CONFIG and packet[2] == EDBG_CONFIG_RAW_ACCESS:
+            offset = packet[4] + (packet[5] << 8) - EDBG_USER_CONFIG_OFFSET
+            size = packet[6] + (packet[7] << 8)
+            return bytearray([AVR_GET_CONFIG, 0, 0, 0, 0, 0]) + self.config_area()[offset:offset + size]
+        if command == AVR_GET_CONFIG:
+            value = {
+                EDBG_CONFIG_KIT_NAME: self.kitname,
+                EDBG_CONFIG_TARGET_DEVICE_NAME: self.device_name,
+            }.get(packet[2], '').encode()
+            return bytearray([AVR_GET_CONFIG, 0, 0, 0, 0, 0]) + value.ljust(32, b'\0')
+        if command == AVR_COMMAND:
+            # Single fragment command
+            size = (packet[2] << 8) + packet[3]
+            response = self._jtagice3_respond(packet[4:4 + size])
+            self._avr_fragments = [response[offset:offset + AVR_FRAGMENT_SIZE]
+                                   for offset in range(0, len(response), AVR_FRAGMENT_SIZE)]
+            self._avr_fragment_count = len(self._avr_fragments)
+            return bytearray([AVR_COMMAND, 0x01])
+        if command == AVR_RESPONSE:
+            # Fragment number in the high nibble, number of fragments in the low nibble
+            number = self._avr_fragment_count - len(self._avr_fragments) + 1
+            fragment = self._avr_fragments.pop(0)
+            size = len(fragment)
+            info = (number << 4) | self._avr_fragment_count
+            return bytearray([AVR_RESPONSE, info, size >> 8, size & 0xFF]) + fragment
+        return bytearray([command, 0xFF])
+
+    def genx_respond(self, command):
+        """
+        Answer a GENx command
+
+        :param command: command sent to the command channel
+        :type command: bytearray
+        :return: response
+        :rtype: bytearray
+        """
+        if command[0] == GENX_GET_PKOB_CONFIG_AREA and self.kit_type in CONFIG_AREA_KIT_TYPES:
+            return bytearray([GENX_GET_PKOB_CONFIG_AREA]) + self.config_area() + bytearray([0x00])
+        # API_ILLEGAL_ARGUMENT
+        return bytearray([command[0], 0xC1])
+
+    def _jtagice3_respond(self, packet):
+        sequence = packet[2] + (packet[3] << 8)
+        handler = packet[4]
+        command = packet[5]
+        if command == EDBG_CMD_QUERY:
+            payload = bytearray([0x81, 0x00, EDBG_CMD_REFRESH_ID_CHIP, EDBG_CMD_READ_ID_CHIP])
+        elif command == EDBG_CMD_REFRESH_ID_CHIP:
+            payload = bytearray([0x80, 0x00])
+        elif command == EDBG_CMD_READ_ID_CHIP:
+            data = self.extension if packet[7] == 1 else b''
+            payload = bytearray([0x84, 0x00]) + data.ljust(64, b'\0') + bytearray([0x00])
+        else:
+            payload = bytearray([0xA0, 0x00, 0x10])
+        return bytearray([JTAGICE3_TOKEN, sequence >> 8, sequence & 0xFF, handler]) + payload
+
+
+def make_kits(count):
+    """
+    Make a mix of simulated kits of all types
+
+    :param count: number of kits
+    :type count: int
+    :return: simulated kits
+    :rtype: list of class:SimulatedKit
+    """
+    return [SimulatedKit(KIT_TYPES[index % len(KIT_TYPES)], "SIM{:07d}".format(index), index)
+            for index in range(count)]
+
+
+class _SimulatedHidDevice():
+    """Stand-in for hid.device"""
+    def __init__(self, bus):
+        self.bus = bus
+        self.kit = None
+        self._response = bytearray()
+
+    def open(self, vendor_id, product_id, serial_number=None):
+        """Open a simulated HID kit"""
+        self.kit = self.bus.find_hid_kit(vendor_id, product_id, serial_number)
+        self.bus.transaction('hid_open')
+
+    def set_nonblocking(self, _value):
+        """Blocking mode is ignored"""
+
+    def write(self, data):
+        """Send a HID report, skipping the report ID"""
+        self.bus.transaction('hid_transfer')
+        self._response = self.kit.respond(bytearray(data[1:]))
+        return len(data)
+
+    def read(self, size):
+        """Receive the response to the last report"""
+        return list(self._response[:size].ljust(size, b'\0'))
+
+    def close(self):
+        """Close the device"""
+        self.kit = None
+
+    def get_manufacturer_string(self):
+        """USB manufacturer string"""
+        return "Microchip Technology Incorporated"
+
+    def get_product_string(self):
+        """USB product string"""
+        return self.kit.product_string
+
+    def get_serial_number_string(self):
+        """USB serial number"""
+        return self.kit.serial_number
+
+
+class _SimulatedUsbDevice():
+    """Stand-in for a pyusb device"""
+    def __init__(self, bus, kit):
+        self._bus = bus
+        self._kit = kit
+        self._ctx = SimpleNamespace(dispose=lambda device: None)
+        self.idVendor = kit.vendor_id
+        self.idProduct = kit.product_id
+        self.bMaxPacketSize0 = 64
+        self.bus = 1
+        self.address = kit.index + 1
+        self.default_timeout = 1000
+        self._response = bytearray()
+
+    @property
+    def product(self):
+        """USB product string, read from the device"""
+        self._bus.transaction('usb_string')
+        return self._kit.product_string
+
+    @property
+    def serial_number(self):
+        """USB serial number, read from the device"""
+        self._bus.transaction('usb_string')
+        return self._kit.serial_number
+
+    def write(self, _endpoint, data, timeout=None):
+        """Send a GENx command"""
+        # pylint: disable=unused-argument
+        self._bus.transaction('usb_transfer')
+        self._response = self._kit.genx_respond(bytearray(data))
+        return len(data)
+
+    def read(self, _endpoint, size, timeout=None):
+        """Receive the response to the last command, timing out if the kit doesn't answer"""
+        if not self._kit.responsive:
+            timeout = self.default_timeout if timeout is None else timeout
+            self._bus.transaction('usb_timeout', timeout / 1000)
+            raise usb.core.USBTimeoutError("Operation timed out")
+        return self._response[:size]
+
+
+class SimulatedBus():
+    """
+    Simulated USB bus with hidapi, libusb and pyserial fakes
+
+    :param kits: kits connected to the bus
+    :type kits: list of class:SimulatedKit
+    :param latency: time in seconds taken by each USB transaction
+    :type latency: float
+    :param enumeration_latency: time in seconds taken by each enumeration of the bus
+    :type enumeration_latency: float
+    """
+    def __init__(self, kits, latency=0.0, enumeration_latency=0.0):
+        self.kits = list(kits)
+        self.latency = latency
+        self.enumeration_latency = enumeration_latency
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def transaction(self, name, latency=None):
+        """
+        Count a transaction and wait for it to complete
+
+        :param name: transaction type
+        :type name: str
+        :param latency: time in seconds taken by the transaction, defaults to the bus latency
+        :type latency: float, optional
+        """
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+        latency = self.latency if latency is None else latency
+        if latency:
+            time.sleep(latency)
+
+    def find_hid_kit(self, vendor_id, product_id, serial_number):
+        """
+        Find the kit a HID device is opened for
+
+        :raises OSError: if there is no such kit, like hidapi
+        """
+        for kit in self.kits:
+            if kit.is_hid and (kit.vendor_id, kit.product_id) == (vendor_id, product_id) and \
+                    (serial_number is None or kit.serial_number == serial_number):
+                return kit
+        raise OSError("open failed")
+
+    def hid_enumerate(self, vendor_id=0, product_id=0):
+        """Stand-in for hid.enumerate"""
+        self.transaction('hid_enumerate', self.enumeration_latency)
+        return [kit.hid_info() for kit in self.kits if kit.is_hid and
+                vendor_id in (0, kit.vendor_id) and product_id in (0, kit.product_id)]
+
+    def libusb_find(self, find_all=False, idVendor=None, idProduct=None, **_kwargs):
+        """Stand-in for libusb_package.find"""
+        # pylint: disable=invalid-name
+        self.transaction('usb_enumerate', self.enumeration_latency)
+        devices = [_SimulatedUsbDevice(self, kit) for kit in self.kits if not kit.is_hid and
+                   idVendor in (None, kit.vendor_id) and idProduct in (None, kit.product_id)]
+        if find_all:
+            return iter(devices)
+        return devices[0] if devices else None
+
+    def comports(self, include_links=False):
+        """Stand-in for serial.tools.list_ports.comports"""
+        # pylint: disable=unused-argument
+        self.transaction('list_serial_ports', self.enumeration_latency)
+        return [kit.serial_port() for kit in self.kits if kit.has_serial_port]
+
+    @contextmanager
+    def patch(self):
+        """
+        Plug the simulated bus into the detectors
+        """
+        with ExitStack() as stack:
+            stack.enter_context(patch('hid.enumerate', self.hid_enumerate))
+            stack.enter_context(patch('hid.device', lambda: _SimulatedHidDevice(self)))
+            # Endpoint size detection of some EDBG tools talks to libusb directly
+            stack.enter_context(patch('pyedbglib.hidtransport.hidtransportbase.detect_hid_packet_size',
+                                      return_value=0))
+            stack.enter_context(patch('libusb_package.find', self.libusb_find))
+            stack.enter_context(patch('serial.tools.list_ports.comports', self.comports))
+            yield self
@@ -0,0 +1,58 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from mock import patch
+
+from pykitinfo.cache import KitInfoCache
+
+
+class TestKitInfoCache(unittest.TestCase):
+    """Tests for the persistent kit information cache"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.json")
+        self.key = KitInfoCache.key(0x03EB, 0x2175, "MCHP3261021800001234")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_entries_persist_between_instances(self):
+        cache = KitInfoCache(path=self.path)
+        cache.put(self.key, {'debugger': {'kitname': 'AVR128DA48 Curiosity Nano'}})
+        cache.save()
+        self.assertEqual(KitInfoCache(path=self.path).get(self.key), {'debugger': {'kitname': 'AVR128DA48 Curiosity Nano'}})
+
+    def test_kits_without_serial_number_are_not_cached(self):
+        self.assertIsNone(KitInfoCache.key(0x04D8, 0x810B, 'N/A'))
+        self.assertIsNone(KitInfoCache.key(0x04D8, 0x810B, ''))
+
+    def test_expired_entries_are_ignored(self):
+        cache = KitInfoCache(path=self.path, ttl=60)
+        with patch('pykitinfo.cache.time.time', return_value=1000.0):
+            cache.put(self.key, {'kitname': 'x'})
+        with patch('pykitinfo.cache.time.time', return_value=1061.0):
+            self.assertIsNone(cache.get(self.key))
+
+    def test_refresh_ignores_existing_entries(self):
+        cache = KitInfoCache(path=self.path)
+        cache.put(self.key, {'kitname': 'x'})
+        cache.save()
+        self.assertIsNone(KitInfoCache(path=self.path, refresh=True).get(self.key))
+
+    def test_oldest_entries_are_evicted(self):
+        cache = KitInfoCache(path=self.path, max_entries=2)
+        for i in range(3):
+            with patch('pykitinfo.cache.time.time', return_value=1000.0 + i):
+                cache.put(str(i), {'kitname': str(i)})
+        with patch('pykitinfo.cache.time.time', return_value=1010.0):
+            cache.save()
+        with open(self.path) as file:
+            self.assertEqual(sorted(json.load(file)['entries']), ['1', '2'])
+
+    def test_unreadable_cache_file_is_ignored(self):
+        with open(self.path, 'w') as file:
+            file.write("{not json")
+        self.assertIsNone(KitInfoCache(path=self.path).get(self.key))
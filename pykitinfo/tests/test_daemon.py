@@ -0,0 +1,124 @@
+import os
+import json
+import stat
+import socket
+import tempfile
+import threading
+import unittest
+
+from pykitinfo.daemon import KitInventory, InventoryDaemon, DaemonError, query_daemon, MAX_QUERY_SIZE
+from pykitinfo.tests.simulated_backends import SimulatedBus, make_kits, KIT_TYPES
+
+
+def _kit(serial_number, serial_port, kitname):
+    return {
+        'usb': {'serial_number': serial_number},
+        'debugger': {'serial_port': serial_port, 'kitname': kitname}
+    }
+
+
+class _IdleMonitor():
+    """Hotplug monitor that never reports a change"""
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def wait(self, timeout=None):
+        self.closed.wait(timeout)
+        return False
+
+    def drain(self):
+        pass
+
+    def close(self):
+        self.closed.set()
+
+
+class TestKitInventory(unittest.TestCase):
+    """Tests for queries on the kit inventory"""
+
+    def setUp(self):
+        self.inventory = KitInventory()
+        self.inventory.update([_kit("MCHP0001", "/dev/ttyACM0", "Curiosity Nano"),
+                               _kit("MCHP0011", "/dev/ttyACM1", "curiosity nano"),
+                               _kit("BUR0001", "N/A", "MPLAB PICkit 5")])
+
+    def test_queries(self):
+        self.assertEqual(len(self.inventory.find()), 3)
+        self.assertEqual([kit['usb']['serial_number'] for kit in self.inventory.find(serial_number="0001")],
+                         ["MCHP0001", "BUR0001"])
+        self.assertEqual(self.inventory.find(serial_port="/dev/ttyACM1")[0]['usb']['serial_number'], "MCHP0011")
+        self.assertEqual(len(self.inventory.find(kitname="CURIOSITY NANO")), 2)
+        self.assertEqual(len(self.inventory.find(kitname="Curiosity Nano", serial_port="/dev/ttyACM0")), 1)
+        self.assertEqual(self.inventory.find(kitname="Curiosity Nano", serial_number="BUR0001"), [])
+
+    def test_invalid_queries(self):
+        self.assertIn('error', json.loads(self.inventory.answer({'name': "x"})))
+        self.assertIn('error', json.loads(self.inventory.answer({'serial_number': 1})))
+        self.assertEqual(len(json.loads(self.inventory.answer({}))['kits']), 3)
+
+
+class TestInventoryDaemon(unittest.TestCase):
+    """Tests for the inventory daemon and its clients"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "pykitinfo.sock")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_queries_leave_the_bus_alone(self):
+        bus = SimulatedBus(make_kits(2 * len(KIT_TYPES)))
+        with bus.patch():
+            daemon = InventoryDaemon(socket_path=self.socket_path, monitor=_IdleMonitor())
+            daemon.start()
+            try:
+                mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+                kits = query_daemon(socket_path=self.socket_path)
+                counts = dict(bus.counts)
+                found = query_daemon(serial_number=bus.kits[3].serial_number, socket_path=self.socket_path)
+                query_daemon(kitname="no such kit", socket_path=self.socket_path)
+                with self.assertRaises(DaemonError):
+                    InventoryDaemon(socket_path=self.socket_path, monitor=_IdleMonitor()).start()
+            finally:
+                daemon.close()
+        self.assertEqual(mode & 0o077, 0)
+        self.assertEqual(len(kits), len(bus.kits))
+        self.assertEqual([kit['usb']['serial_number'] for kit in found], [bus.kits[3].serial_number])
+        self.assertEqual(dict(bus.counts), counts)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_too_long_query_gets_a_single_error(self):
+        bus = SimulatedBus(make_kits(1))
+        with bus.patch():
+            daemon = InventoryDaemon(socket_path=self.socket_path, monitor=_IdleMonitor())
+            daemon.start()
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                    client.settimeout(5.0)
+                    client.connect(self.socket_path)
+                    query = json.dumps({'kitname': "x" * (2 * MAX_QUERY_SIZE)}).encode('utf-8')
+                    client.sendall(query + b"\n" + json.dumps({}).encode('utf-8') + b"\n")
+                    with client.makefile('rb') as answers:
+                        lines = answers.readlines()
+            finally:
+                daemon.close()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("too long", json.loads(lines[0].decode('utf-8'))['error'])
+
+    def test_stale_socket_is_replaced(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        bus = SimulatedBus(make_kits(1))
+        with bus.patch():
+            daemon = InventoryDaemon(socket_path=self.socket_path, monitor=_IdleMonitor())
+            daemon.start()
+            try:
+                self.assertEqual(len(query_daemon(socket_path=self.socket_path)), 1)
+            finally:
+                daemon.close()
+
+    def test_no_daemon(self):
+        with self.assertRaises(DaemonError):
+            query_daemon(socket_path=self.socket_path)
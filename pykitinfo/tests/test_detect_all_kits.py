@@ -0,0 +1,52 @@
+import time
+import unittest
+from mock import patch
+
+from pykitinfo import pykitinfo
+from pykitinfo import scan
+from pykitinfo.profiling import ScanProfile
+
+
+def _slow_detector(name, delay):
+    def detector(serialnumber=None, context=None):
+        time.sleep(delay)
+        return [{'name': name, 'serialnumber': serialnumber}]
+    return detector
+
+
+class TestDetectAllKits(unittest.TestCase):
+    """Tests for merging of backend detector results"""
+
+    def setUp(self):
+        # The first detector is the slowest so it completes last when run concurrently
+        self.detectors = {'edbg': _slow_detector('edbg', 0.05),
+                          'pk3': _slow_detector('pk3', 0.0),
+                          'genx': _slow_detector('genx', 0.02),
+                          'mcp2221a': _slow_detector('mcp2221a', 0.01)}
+
+    def test_concurrent_results_are_merged_in_fixed_order(self):
+        with patch.object(scan, 'DETECTORS', self.detectors):
+            kits = pykitinfo.detect_all_kits(serialnumber='1234')
+        self.assertEqual([kit['name'] for kit in kits], ['edbg', 'pk3', 'genx', 'mcp2221a'])
+        self.assertTrue(all(kit['serialnumber'] == '1234' for kit in kits))
+
+    def test_serial_mode_gives_same_result(self):
+        with patch.object(scan, 'DETECTORS', self.detectors):
+            concurrent = pykitinfo.detect_all_kits()
+            serial = pykitinfo.detect_all_kits(max_workers=1)
+        self.assertEqual(concurrent, serial)
+
+    def test_profile_times_each_detector(self):
+        profile = ScanProfile()
+        with patch.object(scan, 'DETECTORS', self.detectors):
+            pykitinfo.detect_all_kits(profile=profile)
+        stages = {(stage['detector'], stage['step']): stage for stage in profile.stages()}
+        self.assertEqual(set(stages), {(name, step) for name in self.detectors for step in ['import', 'detect']})
+        self.assertGreaterEqual(stages[('edbg', 'detect')]['total'], 0.05)
+
+    def test_only_selected_backends_are_run(self):
+        with patch.object(scan, 'DETECTORS', self.detectors):
+            kits = pykitinfo.detect_all_kits(backends=['mcp2221a', 'edbg'])
+            self.assertEqual([kit['name'] for kit in kits], ['edbg', 'mcp2221a'])
+            with self.assertRaises(ValueError):
+                pykitinfo.detect_all_kits(backends=['edbg', 'nosuchbackend'])
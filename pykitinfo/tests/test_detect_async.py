@@ -0,0 +1,64 @@
+import time
+import asyncio
+import unittest
+from mock import patch
+
+from pykitinfo import scan as scan_module
+from pykitinfo import detect_async
+from pykitinfo.scan import ScanContext
+
+
+def _detector(name, delay=0.0):
+    def detector(serialnumber=None, context=None):
+        time.sleep(delay)
+        return [{'name': name}]
+    return detector
+
+
+class TestDetectAsync(unittest.TestCase):
+    """Tests for the asyncio detection API"""
+
+    def test_results_are_merged_in_fixed_order(self):
+        detectors = {'edbg': _detector('edbg', 0.03), 'pk3': _detector('pk3'), 'genx': _detector('genx', 0.01),
+                     'mcp2221a': _detector('mcp2221a')}
+        with patch.object(scan_module, 'DETECTORS', detectors):
+            kits = asyncio.run(detect_async.detect_all_kits_async())
+        self.assertEqual([kit['name'] for kit in kits], ['edbg', 'pk3', 'genx', 'mcp2221a'])
+
+    def test_settings_are_passed_to_the_detectors(self):
+        contexts = []
+
+        def detector(serialnumber=None, context=None):
+            contexts.append(context)
+            return []
+
+        profile = object()
+        with patch.object(scan_module, 'DETECTORS', {'edbg': detector}):
+            asyncio.run(detect_async.detect_all_kits_async(backends=['edbg'], extensions=False, profile=profile))
+        self.assertFalse(contexts[0].extensions)
+        self.assertIs(contexts[0].profile, profile)
+
+    def test_event_loop_is_not_blocked(self):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def scan():
+            task = asyncio.create_task(ticker())
+            kits = await detect_async.detect_all_kits_async()
+            task.cancel()
+            return kits
+
+        with patch.object(scan_module, 'DETECTORS', {'edbg': _detector('edbg', 0.2)}):
+            asyncio.run(scan())
+        self.assertGreater(len(ticks), 5)
+
+    def test_timeout_cancels_the_scan(self):
+        context = ScanContext(hid_devices=[], usb_devices=[])
+        with patch.object(scan_module, 'DETECTORS', {'edbg': _detector('edbg', 0.2)}):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(detect_async.detect_edbg_kits_async(context=context, timeout=0.01))
+        self.assertTrue(context.cancelled)
@@ -0,0 +1,100 @@
+import time
+import unittest
+from mock import patch, MagicMock
+from pyedbglib.protocols.avrcmsisdap import AvrCommandError
+
+from pykitinfo import detect_edbg_tools
+from pykitinfo.scan import ScanContext
+from pykitinfo.cache import ExtensionCache
+
+
+def _hid_device(serial_number, vendor_id=0x03EB, product_string="nEDBG CMSIS-DAP"):
+    return {
+        'vendor_id': vendor_id,
+        'product_id': 0x2175,
+        'serial_number': serial_number,
+        'product_string': product_string,
+        'manufacturer_string': "Microchip Technology Incorporated",
+    }
+
+
+def _fake_probe(tool, context):
+    # Later kits are faster to probe so they complete first when probed in parallel
+    time.sleep(0.01 * int(tool.serial_number[-1]))
+    if tool.serial_number.endswith('2'):
+        # Unable to connect
+        return None
+    return {'usb': {'serial_number': tool.serial_number}}
+
+
+class TestDetectEdbgKits(unittest.TestCase):
+    """Tests for parallel probing of EDBG kits"""
+
+    def setUp(self):
+        self.context = ScanContext(hid_devices=[
+            _hid_device('MCHP0005'),
+            _hid_device('MCHP0002'),
+            # Not an EDBG kit, so routed to another backend
+            _hid_device('BUR0004', vendor_id=0x04D8, product_string="PICkit 3"),
+            _hid_device('MCHP0003'),
+            _hid_device('ATML0001', product_string="EDBG CMSIS-DAP"),
+        ], usb_devices=[])
+
+    @patch('pykitinfo.detect_edbg_tools._probe_edbg_kit', side_effect=_fake_probe)
+    def test_kits_are_returned_in_enumeration_order(self, _probe_mock):
+        kits = detect_edbg_tools.detect_edbg_kits(context=self.context)
+        self.assertEqual([kit['usb']['serial_number'] for kit in kits], ['MCHP0005', 'MCHP0003', 'ATML0001'])
+
+    @patch('pykitinfo.detect_edbg_tools._probe_edbg_kit', side_effect=_fake_probe)
+    def test_serial_number_filter(self, probe_mock):
+        kits = detect_edbg_tools.detect_edbg_kits(serialnumber='0003', context=self.context, max_workers=1)
+        self.assertEqual([kit['usb']['serial_number'] for kit in kits], ['MCHP0003'])
+        self.assertEqual(probe_mock.call_count, 1)
+
+    @patch('pykitinfo.detect_edbg_tools._read_edbg_kit_info')
+    def test_fast_mode_never_opens_kits(self, read_mock):
+        context = ScanContext(hid_devices=[_hid_device('MCHP0005')], usb_devices=[], serial_ports=[], probe=False)
+        kits = detect_edbg_tools.detect_edbg_kits(context=context)
+        read_mock.assert_not_called()
+        self.assertEqual(kits[0]['debugger'], {
+            'device': 'N/A',
+            'serial_number': 'MCHP0005',
+            'protocol': 'edbg',
+            'kitname': 'nEDBG CMSIS-DAP',
+            'serial_port': 'N/A',
+        })
+
+    @patch('pykitinfo.detect_edbg_tools.read_board_registers', return_value={'KITNAME': "PIC18F16Q41 Curiosity\0\0"})
+    @patch('pykitinfo.detect_edbg_tools._IdChipProtocol')
+    @patch('pykitinfo.detect_edbg_tools.BoardConfig')
+    @patch('pykitinfo.detect_edbg_tools.CmsisDapUnit')
+    @patch('pykitinfo.detect_edbg_tools._SingleDeviceHidTransport')
+    def test_nedbg_kitname_is_read_over_the_open_connection(self, transport_mock, unit_mock, board_mock, edbg_mock,
+                                                            _registers_mock):
+        transport = transport_mock.return_value
+        transport.connect.return_value = True
+        unit_mock.return_value.dap_info.return_value = {
+            'device_name': 'PIC18F16Q41', 'product': 'nEDBG CMSIS-DAP', 'serial': 'MCHP0005'}
+        edbg_mock.return_value.read_id_chip.return_value = [0]
+        context = ScanContext(hid_devices=[_hid_device('MCHP0005')], usb_devices=[], serial_ports=[])
+        kits = detect_edbg_tools.detect_edbg_kits(context=context)
+        self.assertEqual(kits[0]['debugger']['kitname'], 'PIC18F16Q41 Curiosity')
+        board_mock.return_value.transport_set.assert_called_once_with(transport)
+        transport.connect.assert_called_once()
+        transport.disconnect.assert_called_once()
+
+
+class TestReadExtensions(unittest.TestCase):
+    """Tests for reading extensions from the ID channels of a kit"""
+
+    @patch('pykitinfo.detect_edbg_tools._IdChipProtocol')
+    def test_empty_and_failed_channels(self, protocol_mock):
+        extension = b"Microchip\0OLED1 Xplained Pro\0 5\0123\0"
+        protocol_mock.return_value.read_id_chip.side_effect = [False, extension, AvrCommandError("failed")]
+        tool = MagicMock(serial_number="ATML0001", path=b"path")
+        cache = ExtensionCache()
+        extensions = detect_edbg_tools._read_extensions(tool, None, 4, cache=cache)
+        self.assertEqual([(extension['ext'], extension['name']) for extension in extensions],
+                         [(2, "OLED1 Xplained Pro")])
+        # The failed channel and the channels after it are read again next time
+        self.assertEqual(sorted(cache.get("ATML0001", b"path", range(1, 5))), [1, 2])
@@ -0,0 +1,37 @@
+import sys
+import json
+import unittest
+import subprocess
+
+# Libraries that are only needed once a scan is done
+HEAVY_MODULES = ['pyedbglib', 'pydebuggerconfig', 'usb', 'hid', 'serial', 'libusb_package', 'yaml', 'appdirs']
+
+
+def _imported_heavy_modules(statement):
+    code = "{}\nimport sys, json\nprint(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}} & set({}))))"
+    output = subprocess.check_output([sys.executable, "-c", code.format(statement, HEAVY_MODULES)])
+    return json.loads(output)
+
+
+class TestImportTime(unittest.TestCase):
+    """Tests that importing pykitinfo does not load the USB libraries"""
+
+    def test_library_import_is_lazy(self):
+        self.assertEqual(_imported_heavy_modules("from pykitinfo import pykitinfo"), [])
+
+    def test_cli_import_is_lazy(self):
+        self.assertEqual(_imported_heavy_modules("from pykitinfo import pykitinfo_cli"), [])
+
+    def test_unselected_detectors_are_not_imported(self):
+        statement = ("from mock import patch\n"
+                     "from pykitinfo import pykitinfo\n"
+                     "with patch('libusb_package.find', return_value=iter([])):\n"
+                     "    pykitinfo.detect_all_kits(backends=['genx'], probe=False)")
+        # hidapi is only needed by the other backends
+        self.assertNotIn('hid', _imported_heavy_modules(statement))
+
+    def test_detectors_can_still_be_imported_from_main_module(self):
+        # Looked up as attributes, as the detectors are only provided by the module's __getattr__
+        from pykitinfo import pykitinfo
+        from pykitinfo.detect_edbg_tools import detect_edbg_kits
+        self.assertIs(pykitinfo.detect_edbg_kits, detect_edbg_kits)
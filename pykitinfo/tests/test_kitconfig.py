@@ -0,0 +1,56 @@
+import unittest
+import xml.etree.ElementTree as ETree
+from mock import MagicMock
+from pydebuggerconfig.pydebuggerconfig_errors import PydebuggerconfigError
+
+from pykitinfo import kitconfig
+from pykitinfo.kitconfig import RegisterLayout, read_board_registers
+
+SPECIFICATION = """
+<config>
+    <registers>
+        <register offset="0x000" size="1" type="BYTE" name="CONFIG_FORMAT_MAJOR"/>
+        <register offset="0x002" size="2" type="BYTE" name="CONFIG_FORMAT_BUILD"/>
+        <register offset="0x004" size="4" type="STRING" name="KITNAME"/>
+        <register offset="0x008" size="2" type="ARRAY" name="SERNUM"/>
+    </registers>
+</config>
+"""
+
+DATA = [1, 2, 0x34, 0x12, ord('K'), ord('i'), ord('t'), 0, 0xAA, 0xBB]
+
+
+class TestKitConfig(unittest.TestCase):
+    """Tests for single-pass board configuration decoding"""
+
+    def setUp(self):
+        self.specification = ETree.ElementTree(ETree.fromstring(SPECIFICATION))
+        kitconfig._layouts.clear()
+
+    def test_decode(self):
+        values = RegisterLayout(self.specification).decode(DATA, ['KITNAME', 'SERNUM', 'CONFIG_FORMAT_BUILD'])
+        self.assertEqual(values, {'KITNAME': "Kit\0", 'SERNUM': [0xAA, 0xBB], 'CONFIG_FORMAT_BUILD': "0x1234"})
+
+    def test_unknown_register(self):
+        with self.assertRaises(PydebuggerconfigError):
+            RegisterLayout(self.specification).decode(DATA, ['DEVNAME'])
+
+    def _board(self):
+        board = MagicMock(data_array={}, major={}, minor={}, build={}, specification_xml={})
+        board.protocol.read_config_block.return_value = DATA
+
+        def specification_open(source):
+            board.specification_xml[source] = self.specification
+        board.specification_open.side_effect = specification_open
+        return board
+
+    def test_specification_is_opened_once_per_version(self):
+        board = self._board()
+        self.assertEqual(read_board_registers(board, ['KITNAME']), {'KITNAME': "Kit\0"})
+        self.assertEqual(board.major['board'], 1)
+        self.assertEqual(board.build['board'], 0x1234)
+        other_board = self._board()
+        self.assertEqual(read_board_registers(other_board, ['SERNUM']), {'SERNUM': [0xAA, 0xBB]})
+        board.specification_open.assert_called_once_with('board')
+        other_board.specification_open.assert_not_called()
+        self.assertEqual(list(kitconfig._layouts), [(1, 2, 0x1234)])
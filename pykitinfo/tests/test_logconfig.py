@@ -0,0 +1,93 @@
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from mock import patch
+
+from pykitinfo import logconfig
+from pykitinfo.logconfig import load_logging_config, queue_file_handlers, stop_queued_file_handlers
+from pykitinfo.logconfig import LazyFileHandler, LoggingConfigError
+
+CONFIG = """
+version: 1
+handlers:
+    console:
+        class: logging.StreamHandler
+        level: WARNING
+    debug_file_handler:
+        class: logging.FileHandler
+        level: DEBUG
+        filename: debug.log
+root:
+    level: WARNING
+    handlers: [console]
+"""
+
+
+class TestLogConfig(unittest.TestCase):
+    """Tests for the cached logging configuration"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmpdir, "logging.yaml")
+        self.cache_path = os.path.join(self.tmpdir, "cache", "logging-config.json")
+        self.logdir = os.path.join(self.tmpdir, "logs")
+        with open(self.config_path, "w") as config_file:
+            config_file.write(CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self):
+        with patch('appdirs.user_log_dir', return_value=self.logdir):
+            return load_logging_config(self.config_path, "pykitinfo", cache_path=self.cache_path)
+
+    def test_file_handlers_are_redirected_and_lazy(self):
+        config = self._load()
+        handler = config['handlers']['debug_file_handler']
+        self.assertEqual(handler['filename'], os.path.join(self.logdir, "debug.log"))
+        self.assertEqual(handler['class'], 'pykitinfo.logconfig.LazyFileHandler')
+        self.assertFalse(os.path.exists(self.logdir))
+
+    def test_config_is_cached_until_file_changes(self):
+        self._load()
+        with patch.object(logconfig, '_parse_config') as parse:
+            self._load()
+            parse.assert_not_called()
+            stat = os.stat(self.config_path)
+            os.utime(self.config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+            self._load()
+            parse.assert_called_once()
+
+    def test_invalid_yaml_raises(self):
+        with open(self.config_path, "w") as config_file:
+            config_file.write("handlers: [")
+        with self.assertRaises(LoggingConfigError):
+            self._load()
+
+    def test_lazy_file_handler_creates_file_on_first_record(self):
+        filename = os.path.join(self.logdir, "debug.log")
+        handler = LazyFileHandler(filename)
+        self.assertFalse(os.path.exists(self.logdir))
+        handler.emit(logging.makeLogRecord({'msg': "hello"}))
+        handler.close()
+        with open(filename) as log_file:
+            self.assertEqual(log_file.read(), "hello\n")
+
+    def test_file_handlers_are_queued(self):
+        filename = os.path.join(self.logdir, "queued.log")
+        logger = logging.getLogger("pykitinfo.tests.queued")
+        handler = LazyFileHandler(filename)
+        logger.addHandler(handler)
+        try:
+            queue_file_handlers(["pykitinfo.tests.queued"])
+            self.assertNotIn(handler, logger.handlers)
+            logger.warning("queued %d", 1)
+            stop_queued_file_handlers()
+        finally:
+            for queue_handler in list(logger.handlers):
+                logger.removeHandler(queue_handler)
+            handler.close()
+        with open(filename) as log_file:
+            self.assertEqual(log_file.read(), "queued 1\n")
@@ -0,0 +1,71 @@
+import io
+import csv
+import json
+import unittest
+
+from pykitinfo.output import write_kits, parse_fields, DEFAULT_CSV_FIELDS
+
+KITS = [
+    {
+        'usb': {'interface': 'hid', 'packet_size': 64, 'product_id': 0x2111, 'product_string': "EDBG CMSIS-DAP",
+                'serial_number': "ATML0001", 'vendor_id': 0x03EB},
+        'debugger': {'device': 'ATmega4809', 'kitname': "ATmega4809 Xplained Pro", 'product': 'EDBG',
+                     'protocol': 'edbg', 'serial_number': "ATML0001", 'serial_port': "/dev/ttyACM0"},
+        'extensions': [{'ext': 1, 'manufacturer': "Microchip", 'name': "OLED1 Xplained Pro", 'power': "5",
+                        'serial_number': "0123"}]
+    },
+    {
+        'usb': {'interface': 'winusb', 'packet_size': 64, 'product_id': 0x9036, 'product_string': "MPLAB PICkit 5",
+                'serial_number': "BUR0002", 'vendor_id': 0x04D8},
+        'debugger': {'device': '', 'kitname': "MPLAB® PICkit™ 5", 'protocol': 'N/A', 'serial_number': "BUR0002",
+                     'serial_port': 'N/A'}
+    }
+]
+
+
+class TestOutput(unittest.TestCase):
+    """Tests for the machine-oriented output formats"""
+
+    def test_ndjson(self):
+        stream = io.StringIO()
+        self.assertEqual(write_kits(iter(KITS), stream, 'ndjson'), 2)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], KITS)
+        self.assertIn("MPLAB® PICkit™ 5", lines[1])
+
+    def test_json_compact(self):
+        stream = io.StringIO()
+        write_kits(iter(KITS), stream, 'json-compact')
+        self.assertEqual(json.loads(stream.getvalue()), KITS)
+        self.assertEqual(stream.getvalue().count('\n'), 1)
+        stream = io.StringIO()
+        write_kits(iter([]), stream, 'json-compact')
+        self.assertEqual(stream.getvalue(), "[]\n")
+
+    def test_csv_default_fields(self):
+        stream = io.StringIO()
+        write_kits(iter(KITS), stream, 'csv')
+        rows = list(csv.reader(io.StringIO(stream.getvalue())))
+        self.assertEqual(rows[0], DEFAULT_CSV_FIELDS)
+        self.assertEqual(rows[2][0], "BUR0002")
+        self.assertEqual(len(rows), 3)
+
+    def test_fields_are_projected(self):
+        fields = parse_fields("usb.serial_number, debugger.product,extensions")
+        stream = io.StringIO()
+        write_kits(iter(KITS), stream, 'ndjson', fields=fields)
+        second = json.loads(stream.getvalue().splitlines()[1])
+        self.assertEqual(second, {'usb.serial_number': "BUR0002", 'debugger.product': None, 'extensions': None})
+        stream = io.StringIO()
+        write_kits(iter(KITS), stream, 'csv', fields=fields)
+        rows = list(csv.reader(io.StringIO(stream.getvalue())))
+        self.assertEqual(json.loads(rows[1][2]), KITS[0]['extensions'])
+        self.assertEqual(rows[2], ["BUR0002", "", ""])
+
+    def test_invalid_fields_and_format(self):
+        with self.assertRaises(ValueError):
+            parse_fields(" , ")
+        with self.assertRaises(ValueError):
+            parse_fields("usb..serial_number")
+        with self.assertRaises(ValueError):
+            write_kits(KITS, io.StringIO(), 'xml')
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+
+
+def _run(*arguments):
+    return subprocess.run([sys.executable, "-m", "pykitinfo.pykitinfo_cli"] + list(arguments),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=False)
+
+
+class TestCommandLine(unittest.TestCase):
+    """Tests for option checking and output streams of the command line interface"""
+
+    def test_options_that_cannot_apply_are_rejected(self):
+        for arguments, message in [(["--watch", "--format", "csv"], "--format can't be used with --watch"),
+                                   (["serve", "--find-one", "-s", "1"], "--find-one can't be used with serve"),
+                                   (["serve", "--watch"], "--watch can't be used with serve"),
+                                   (["--daemon", "--stream"], "--stream can't be used with --daemon"),
+                                   (["--find-one", "--stream", "-s", "1"], "--stream can't be used with --find-one")]:
+            result = _run(*arguments)
+            self.assertEqual(result.returncode, 1)
+            self.assertIn(message, result.stdout + result.stderr)
+
+    def test_machine_readable_output_is_not_mixed_with_log_messages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            socket_path = os.path.join(directory, "no-daemon.sock")
+            result = _run("--format", "ndjson", "--daemon", "--socket", socket_path)
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stdout, "")
+        self.assertIn("DaemonError", result.stderr)
@@ -0,0 +1,43 @@
+import json
+import unittest
+
+from pykitinfo.pykitinfo import detect_all_kits, find_kit
+from pykitinfo.records import Kit, DebuggerInfo
+from pykitinfo.tests.simulated_backends import SimulatedBus, make_kits, KIT_TYPES
+
+
+class TestRecords(unittest.TestCase):
+    """Tests for the compact kit records"""
+
+    def test_records_give_the_same_json(self):
+        bus = SimulatedBus(make_kits(2 * len(KIT_TYPES)))
+        with bus.patch():
+            kits = detect_all_kits()
+            records = detect_all_kits(records=True)
+        self.assertEqual(json.dumps([record.to_dict() for record in records], sort_keys=True, indent=2),
+                         json.dumps(kits, sort_keys=True, indent=2))
+        self.assertEqual([record.to_dict() for record in records], kits)
+
+    def test_attribute_access(self):
+        bus = SimulatedBus(make_kits(len(KIT_TYPES)))
+        with bus.patch():
+            record = find_kit(bus.kits[0].serial_number, records=True)
+        self.assertIsInstance(record, Kit)
+        self.assertEqual(record.usb.serial_number, bus.kits[0].serial_number)
+        self.assertEqual(record.debugger.kitname, "Simulated edbg kit 0")
+        self.assertEqual(record.extensions[0].name, "OLED1 Xplained Pro")
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertFalse(hasattr(record.debugger, '__dict__'))
+
+    def test_optional_entries_are_left_out(self):
+        kit = {
+            'usb': {'interface': 'hid', 'packet_size': 0, 'product_id': 0x00DD,
+                    'product_string': "MCP2221 USB-I2C/UART", 'serial_number': "0001", 'vendor_id': 0x04D8},
+            'debugger': {'device': 'N/A', 'serial_number': "0001", 'protocol': 'N/A',
+                         'kitname': "MCP2221 USB-I2C/UART", 'serial_port': 'N/A'}
+        }
+        record = Kit.from_dict(kit)
+        self.assertIsNone(record.extensions)
+        self.assertEqual(record.to_dict(), kit)
+        self.assertEqual(Kit.from_dict(dict(kit, extensions=[])).to_dict(), dict(kit, extensions=[]))
+        self.assertEqual(record.debugger, DebuggerInfo.from_dict(kit['debugger']))
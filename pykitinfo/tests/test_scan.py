@@ -0,0 +1,109 @@
+import unittest
+from mock import patch, Mock
+
+from pykitinfo.scan import ScanContext, SerialPortIndex, BACKEND_EDBG, BACKEND_PK3, BACKEND_MCP2221A, BACKEND_GENX
+
+
+def _hid_device(vendor_id, product_id, product_string, serial_number='123'):
+    return {
+        'vendor_id': vendor_id,
+        'product_id': product_id,
+        'product_string': product_string,
+        'serial_number': serial_number,
+        'manufacturer_string': '',
+    }
+
+
+def _usb_device(product_id):
+    device = Mock()
+    device.idVendor = 0x04D8
+    device.idProduct = product_id
+    return device
+
+
+class TestScanContext(unittest.TestCase):
+    """Tests for enumeration and routing of devices"""
+
+    def setUp(self):
+        self.hid_devices = [
+            _hid_device(0x03EB, 0x2175, "nEDBG CMSIS-DAP"),
+            _hid_device(0x04D8, 0x00DD, "MCP2221 USB-I2C/UART Combo"),
+            _hid_device(0x04D8, 0x900A, "PICkit 3"),
+            _hid_device(0x04D8, 0x00DD, "Curiosity"),
+            _hid_device(0x046D, 0xC52B, "USB Receiver"),
+        ]
+        self.usb_devices = [_usb_device(0x9036), _usb_device(0x900A), _usb_device(0x00DD)]
+
+    @patch('libusb_package.find')
+    @patch('hid.enumerate')
+    def test_each_device_is_routed_to_one_backend(self, enumerate_mock, find_mock):
+        enumerate_mock.return_value = self.hid_devices
+        find_mock.return_value = iter(self.usb_devices)
+        context = ScanContext()
+
+        self.assertEqual(len(context.hid_devices(BACKEND_EDBG)), 1)
+        self.assertEqual([d['product_string'] for d in context.hid_devices(BACKEND_PK3)], ["PICkit 3"])
+        self.assertEqual(len(context.hid_devices(BACKEND_MCP2221A)), 2)
+        self.assertEqual([d.idProduct for d in context.usb_devices(BACKEND_GENX)], [0x9036])
+
+    @patch('libusb_package.find')
+    @patch('hid.enumerate')
+    def test_bus_is_enumerated_once(self, enumerate_mock, find_mock):
+        enumerate_mock.return_value = self.hid_devices
+        find_mock.return_value = iter(self.usb_devices)
+        context = ScanContext()
+        for backend in [BACKEND_EDBG, BACKEND_PK3, BACKEND_MCP2221A]:
+            context.hid_devices(backend)
+        context.usb_devices(BACKEND_GENX)
+        context.usb_devices(BACKEND_GENX)
+
+        enumerate_mock.assert_called_once_with()
+        find_mock.assert_called_once()
+
+    def test_snapshot_is_read_only(self):
+        context = ScanContext(hid_devices=self.hid_devices)
+        with self.assertRaises(TypeError):
+            context.hid_devices(BACKEND_EDBG)[0]['serial_number'] = 'changed'
+
+
+def _port(device, serial_number, vendor_id=0x04D8, product_id=0x00DD):
+    port = Mock()
+    port.device = device
+    port.serial_number = serial_number
+    port.vid = vendor_id
+    port.pid = product_id
+    port.hwid = "USB VID:PID={:04X}:{:04X} SER={}".format(vendor_id, product_id, serial_number)
+    return port
+
+
+class TestSerialPortIndex(unittest.TestCase):
+    """Tests for serial port lookup"""
+
+    def setUp(self):
+        non_usb = _port('/dev/ttyS0', None)
+        non_usb.hwid = 'PNP0501'
+        self.ports = [
+            non_usb,
+            _port('/dev/ttyACM0', 'MCHP3261021800001234', vendor_id=0x03EB, product_id=0x2175),
+            _port('/dev/ttyACM1', '0001234567'),
+            _port('/dev/ttyACM2', None),
+        ]
+
+    def test_find_port_by_serial_number(self):
+        index = SerialPortIndex(self.ports)
+        self.assertEqual(index.find_port('MCHP3261021800001234'), '/dev/ttyACM0')
+        self.assertEqual(index.find_port('0001234567', vendor_id=0x04D8, product_id=0x00DD), '/dev/ttyACM1')
+        self.assertIsNone(index.find_port('0001234567', vendor_id=0x03EB))
+        self.assertIsNone(index.find_port('unknown'))
+
+    def test_find_ports_includes_ports_without_serial_number(self):
+        index = SerialPortIndex(self.ports)
+        self.assertEqual([p.device for p in index.find_ports(0x04D8, 0x00DD)], ['/dev/ttyACM1', '/dev/ttyACM2'])
+
+    @patch('serial.tools.list_ports.comports')
+    def test_ports_are_listed_once_per_scan(self, comports_mock):
+        comports_mock.return_value = self.ports
+        context = ScanContext()
+        context.serial_ports.find_port('0001234567')
+        context.serial_ports.find_port('MCHP3261021800001234')
+        comports_mock.assert_called_once_with()
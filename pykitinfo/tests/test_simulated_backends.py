@@ -0,0 +1,161 @@
+import unittest
+from mock import patch
+
+from pykitinfo import kitconfig
+from pykitinfo.pykitinfo import detect_all_kits, detect_kits_iter, find_kit
+from pykitinfo.scan import ScanContext, scan_kits
+from pykitinfo.cache import ExtensionCache
+from pykitinfo.tests.simulated_backends import SimulatedBus, SimulatedKit, make_kits, KIT_TYPES, KIT_EDBG, KIT_PICKIT5
+from pykitinfo.tests.simulated_backends import KIT_NEDBG, KIT_PKOB4
+from pykitinfo.tests.benchmark_scaling import run_benchmark
+
+
+class TestSimulatedBackends(unittest.TestCase):
+    """Tests for detection against the simulated USB backends"""
+
+    def test_all_kit_types_are_detected(self):
+        bus = SimulatedBus(make_kits(2 * len(KIT_TYPES)))
+        with bus.patch():
+            kits = detect_all_kits()
+        self.assertEqual(sorted(kit['usb']['serial_number'] for kit in kits),
+                         sorted(kit.serial_number for kit in bus.kits))
+        edbg = next(kit for kit in kits if kit['debugger'].get('product') == 'EDBG')
+        self.assertEqual(edbg['debugger']['kitname'], "Simulated edbg kit 0")
+        self.assertEqual(edbg['extensions'][0]['name'], "OLED1 Xplained Pro")
+
+    def test_config_area_kits_are_detected(self):
+        bus = SimulatedBus([SimulatedKit(KIT_NEDBG, "MCHP3261", 0), SimulatedKit(KIT_PKOB4, "BUR1", 1),
+                            SimulatedKit(KIT_NEDBG, "MCHP3262", 2), SimulatedKit(KIT_PKOB4, "BUR2", 3)])
+        kitconfig._layouts.clear()
+        with bus.patch(), patch('pykitinfo.kitconfig.RegisterLayout', wraps=kitconfig.RegisterLayout) as layout_mock:
+            kits = {kit['usb']['serial_number']: kit for kit in detect_all_kits()}
+            self.assertEqual(detect_all_kits(), list(kits.values()))
+        for kit in bus.kits:
+            self.assertEqual(kits[kit.serial_number]['debugger']['kitname'], kit.kitname)
+            self.assertEqual(kits[kit.serial_number]['debugger']['device'], kit.device_name)
+        self.assertEqual(kits["MCHP3261"]['extensions'][0]['name'], "OLED1 Xplained Pro")
+        # The configuration specification is parsed once, not once per kit or scan
+        self.assertEqual(layout_mock.call_count, 1)
+
+    def test_unresponsive_config_area_kit_is_reported_with_na(self):
+        bus = SimulatedBus([SimulatedKit(KIT_PKOB4, "BUR1", 0, responsive=False)])
+        with bus.patch():
+            kits = detect_all_kits(transaction_timeout=50)
+        self.assertEqual(len(kits), 1)
+        self.assertEqual(kits[0]['debugger']['kitname'], "N/A")
+        self.assertEqual(kits[0]['debugger']['device'], "N/A")
+        self.assertEqual(kits[0]['debugger']['serial_port'], "/dev/ttyACM0")
+        self.assertEqual(bus.counts['usb_timeout'], 1)
+
+    def test_bus_is_enumerated_once_per_scan(self):
+        bus = SimulatedBus(make_kits(12))
+        with bus.patch():
+            detect_all_kits()
+        self.assertEqual(bus.counts['hid_enumerate'], 1)
+        self.assertEqual(bus.counts['usb_enumerate'], 1)
+        self.assertEqual(bus.counts['list_serial_ports'], 1)
+
+    def test_extensions_are_cached_until_reconnect(self):
+        bus = SimulatedBus(make_kits(len(KIT_TYPES)))
+        extension_cache = ExtensionCache()
+
+        def scan():
+            return scan_kits(ScanContext(extension_cache=extension_cache))
+
+        with bus.patch():
+            first = scan()
+            cold = bus.counts['hid_transfer']
+            second = scan()
+            warm = bus.counts['hid_transfer'] - cold
+            for kit in bus.kits:
+                kit.index += len(bus.kits)
+            scan()
+            reconnected = bus.counts['hid_transfer'] - cold - warm
+        self.assertEqual(first, second)
+        self.assertLess(warm, cold)
+        self.assertEqual(reconnected, cold)
+
+    def test_extensions_are_not_cached_by_default(self):
+        bus = SimulatedBus(make_kits(len(KIT_TYPES)))
+        with bus.patch():
+            detect_all_kits()
+            cold = bus.counts['hid_transfer']
+            detect_all_kits()
+        self.assertEqual(bus.counts['hid_transfer'], 2 * cold)
+
+    def test_extensions_can_be_left_out(self):
+        bus = SimulatedBus(make_kits(len(KIT_TYPES)))
+        with bus.patch():
+            detect_all_kits()
+            with_extensions = bus.counts['hid_transfer']
+            kits = detect_all_kits(extensions=False)
+            without_extensions = bus.counts['hid_transfer'] - with_extensions
+        self.assertFalse(any('extensions' in kit for kit in kits))
+        self.assertLess(without_extensions, with_extensions)
+
+    def test_find_one_probes_only_the_matching_kit(self):
+        bus = SimulatedBus(make_kits(4 * len(KIT_TYPES)))
+        with bus.patch():
+            full_scan = {kit['usb']['serial_number']: kit for kit in detect_all_kits()}
+            counts = dict(bus.counts)
+            kit = find_kit(bus.kits[len(KIT_TYPES)].serial_number)
+        self.assertEqual(kit, full_scan[bus.kits[len(KIT_TYPES)].serial_number])
+        self.assertEqual(bus.counts['hid_enumerate'] - counts['hid_enumerate'], 1)
+        self.assertEqual(bus.counts['usb_enumerate'] - counts['usb_enumerate'], 1)
+        self.assertEqual(bus.counts['hid_open'] - counts['hid_open'], 1)
+
+    def test_find_one_libusb_kit(self):
+        bus = SimulatedBus(make_kits(len(KIT_TYPES)))
+        pickit5 = next(kit for kit in bus.kits if kit.kit_type == KIT_PICKIT5)
+        with bus.patch():
+            kit = find_kit(pickit5.serial_number)
+            self.assertEqual(kit['usb']['serial_number'], pickit5.serial_number)
+            self.assertIsNone(find_kit("NOSUCHKIT"))
+
+    def test_find_one_ambiguous_serial_number(self):
+        bus = SimulatedBus(make_kits(2 * len(KIT_TYPES)))
+        with bus.patch():
+            # SIM0000000 and SIM0000010
+            with self.assertRaises(ValueError):
+                find_kit("0")
+
+    def test_find_one_serial_number_matching_hid_and_libusb_kits(self):
+        bus = SimulatedBus([SimulatedKit(KIT_EDBG, "ATML000042", 0), SimulatedKit(KIT_PICKIT5, "BUR000042", 1)])
+        with bus.patch():
+            with self.assertRaises(ValueError):
+                find_kit("000042")
+            self.assertEqual(find_kit("L000042")['usb']['serial_number'], "ATML000042")
+
+    def test_stream_reports_the_same_kits(self):
+        bus = SimulatedBus(make_kits(4 * len(KIT_TYPES)))
+        with bus.patch():
+            kits = detect_all_kits()
+            counts = dict(bus.counts)
+            streamed = list(detect_kits_iter())
+            in_order = list(detect_kits_iter(max_workers=1))
+        key = lambda kit: kit['usb']['serial_number']
+        self.assertEqual(sorted(streamed, key=key), sorted(kits, key=key))
+        self.assertEqual(in_order, kits)
+        # The bus is enumerated once per scan, not per kit
+        self.assertEqual(bus.counts['hid_enumerate'] - counts['hid_enumerate'], 2)
+        self.assertEqual(bus.counts['usb_enumerate'] - counts['usb_enumerate'], 2)
+        self.assertEqual(bus.counts['list_serial_ports'] - counts['list_serial_ports'], 2)
+
+    def test_stream_yields_before_the_scan_is_done(self):
+        bus = SimulatedBus(make_kits(4 * len(KIT_TYPES)))
+        with bus.patch():
+            detect_all_kits(extensions=False)
+            full_scan = bus.counts['hid_transfer']
+            kits = detect_kits_iter(max_workers=1, extensions=False)
+            next(kits)
+            first_kit = bus.counts['hid_transfer'] - full_scan
+            kits.close()
+            closed = bus.counts['hid_transfer'] - full_scan
+        self.assertLess(first_kit, full_scan)
+        self.assertEqual(closed, first_kit)
+
+    def test_benchmark(self):
+        result = run_benchmark(10, latency=0.0, enumeration_latency=0.0)
+        self.assertEqual(result['found'], 10)
+        self.assertGreater(result['transactions'], 0)
+        self.assertGreater(result['peak_memory'], 0)
@@ -0,0 +1,69 @@
+import tempfile
+import threading
+import unittest
+from mock import patch
+
+from pykitinfo.singleflight import SingleFlight
+from pykitinfo.pykitinfo import detect_all_kits
+from pykitinfo.tests.simulated_backends import SimulatedBus, make_kits, KIT_TYPES
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Tests for scans shared between concurrent callers"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_waiting_caller_takes_the_result_of_the_scan_in_flight(self):
+        in_flight = threading.Event()
+        waiting = threading.Event()
+        results = {}
+
+        def slow_scan():
+            in_flight.set()
+            waiting.wait(5)
+            return ["first"]
+
+        def first_caller():
+            results['first'] = SingleFlight(self.directory.name).run({'serialnumber': None}, slow_scan)
+
+        thread = threading.Thread(target=first_caller)
+        thread.start()
+        in_flight.wait(5)
+        # Let the first scan complete once this caller is about to wait for the lock
+        threading.Timer(0.1, waiting.set).start()
+        second = SingleFlight(self.directory.name).run({'serialnumber': None}, lambda: ["second"])
+        thread.join()
+        self.assertEqual(results['first'], ["first"])
+        self.assertEqual(second, ["first"])
+
+    def test_completed_scans_are_not_reused(self):
+        flight = SingleFlight(self.directory.name)
+        self.assertEqual(flight.run({'serialnumber': None}, lambda: []), [])
+        self.assertEqual(flight.run({'serialnumber': None}, lambda: ["again"]), ["again"])
+
+    def test_scans_with_other_parameters_are_not_shared(self):
+        in_flight = threading.Event()
+        waiting = threading.Event()
+
+        def slow_scan():
+            in_flight.set()
+            waiting.wait(5)
+            return ["all kits"]
+
+        thread = threading.Thread(target=SingleFlight(self.directory.name).run, args=({'serialnumber': None},
+                                                                                      slow_scan))
+        thread.start()
+        in_flight.wait(5)
+        threading.Timer(0.1, waiting.set).start()
+        result = SingleFlight(self.directory.name).run({'serialnumber': "1234"}, lambda: ["kit 1234"])
+        thread.join()
+        self.assertEqual(result, ["kit 1234"])
+
+    def test_detect_all_kits(self):
+        bus = SimulatedBus(make_kits(len(KIT_TYPES)))
+        with bus.patch(), patch('appdirs.user_cache_dir', return_value=self.directory.name):
+            self.assertEqual(detect_all_kits(single_flight=True), detect_all_kits())
@@ -0,0 +1,38 @@
+import unittest
+import usb
+from mock import MagicMock, patch
+
+from pykitinfo.genx import GenxContoller, GenxError
+from pykitinfo.scan import ScanContext
+from pykitinfo import detect_microchip_tools
+
+
+def _usb_device(address):
+    return MagicMock(idVendor=0x04D8, idProduct=0x8109, bus=1, address=address,
+                     serial_number="BUR{}".format(address))
+
+
+class TestTransactionTimeout(unittest.TestCase):
+    """Tests for configurable transaction timeouts"""
+
+    def test_genx_timeout_raises_genx_error(self):
+        device = MagicMock()
+        device.write.side_effect = lambda endpoint, command, timeout: len(command)
+        device.read.side_effect = usb.core.USBTimeoutError("timeout")
+        genx = GenxContoller(device, timeout_ms=200)
+        with self.assertRaises(GenxError):
+            genx.read_config_block()
+        self.assertEqual(device.read.call_args[1]['timeout'], 200)
+
+    @patch('pykitinfo.detect_microchip_tools.usb.util.dispose_resources')
+    def test_timed_out_device_is_reported_with_na(self, _dispose_mock):
+        device = _usb_device(1)
+        device.write.side_effect = lambda endpoint, command, timeout: len(command)
+        device.read.side_effect = usb.core.USBTimeoutError("timeout")
+        context = ScanContext(hid_devices=[], usb_devices=[device], serial_ports=[], transaction_timeout=300)
+        kits = detect_microchip_tools.detect_microchip_tools(context=context)
+        self.assertEqual(len(kits), 1)
+        self.assertEqual(kits[0]['debugger']['kitname'], "N/A")
+        self.assertEqual(kits[0]['debugger']['device'], "N/A")
+        self.assertEqual(device.read.call_args[1]['timeout'], 300)
+        self.assertEqual(device.default_timeout, 300)
@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from pykitinfo import tools
+from pykitinfo.tools import load_registry, INTERFACE_HID, INTERFACE_USB, MICROCHIP_VID, ATMEL_VID
+
+
+class TestToolRegistry(unittest.TestCase):
+    """Tests for the data-driven tool registry"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.user_path = os.path.join(self.tmpdir, "tools.json")
+        self.registry = load_registry(user_path=self.user_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup_by_product_id(self):
+        tool = self.registry.lookup(INTERFACE_USB, MICROCHIP_VID, 0x9036)
+        self.assertEqual(tool['backend'], 'genx')
+        self.assertTrue(tool['serial_port'])
+        self.assertFalse(tool['bootloader'])
+        self.assertTrue(self.registry.lookup(INTERFACE_USB, MICROCHIP_VID, 0x9035)['bootloader'])
+        self.assertIsNone(self.registry.lookup(INTERFACE_HID, MICROCHIP_VID, 0x9036))
+
+    def test_lookup_by_product_string(self):
+        self.assertEqual(self.registry.lookup(INTERFACE_HID, MICROCHIP_VID, 0x900A, "PICkit 3")['backend'], 'pk3')
+        self.assertEqual(self.registry.lookup(INTERFACE_HID, ATMEL_VID, 0x2175, "nEDBG CMSIS-DAP")['backend'],
+                         'edbg')
+        self.assertEqual(self.registry.lookup(INTERFACE_HID, MICROCHIP_VID, 0x00DD, "MCP2221")['backend'],
+                         'mcp2221a')
+        self.assertIsNone(self.registry.lookup(INTERFACE_HID, ATMEL_VID, 0x2104, "AVRISP mkII"))
+
+    def test_edbg_product_capabilities(self):
+        self.assertEqual(self.registry.edbg_product("nEDBG CMSIS-DAP")['kitname'], 'config_area')
+        self.assertEqual(self.registry.edbg_product("EDBG")['id_channels'], 8)
+        self.assertEqual(self.registry.edbg_product("Atmel-ICE"),
+                         {'kitname': 'product', 'id_channels': 0, 'serial_port': False})
+
+    def test_serial_number_hints(self):
+        self.assertEqual(self.registry.backends_for_serial("MCHP3261021800001234"), ['edbg'])
+        self.assertEqual(self.registry.backends_for_serial("bur123456789"), ['genx', 'pk3'])
+        self.assertEqual(self.registry.backends_for_serial("1234"), [])
+
+    def test_user_tools_extend_the_registry(self):
+        with open(self.user_path, "w", encoding="utf-8") as user_file:
+            json.dump({"tools": [
+                {"interface": "usb", "vid": "0x04D8", "pid": "0x9999", "name": "New tool", "backend": "genx"},
+                {"interface": "usb", "vid": "0x04D8", "pid": "0x9036", "name": "Renamed tool", "backend": "genx"}
+            ]}, user_file)
+        registry = load_registry(user_path=self.user_path)
+        self.assertEqual(registry.lookup(INTERFACE_USB, MICROCHIP_VID, 0x9999)['name'], "New tool")
+        self.assertEqual(registry.lookup(INTERFACE_USB, MICROCHIP_VID, 0x9036)['name'], "Renamed tool")
+
+    def test_invalid_user_tools_are_ignored(self):
+        with open(self.user_path, "w", encoding="utf-8") as user_file:
+            user_file.write("{")
+        registry = load_registry(user_path=self.user_path)
+        self.assertIsNotNone(registry.lookup(INTERFACE_USB, MICROCHIP_VID, 0x9036))
+
+    def test_user_tools_with_invalid_entries_are_ignored(self):
+        invalid = [
+            {"tools": [{"interface": "usb", "vid": 0x04D8, "pid": "0x9999", "name": "Int VID", "backend": "genx"}]},
+            {"tools": [{"interface": "usb", "vid": "0x04D8", "pid": "0x9999", "backend": "genx"}]},
+            {"tools": [{"interface": "usb", "vid": "0x04D8", "pid": "0xZZ", "name": "Bad PID", "backend": "genx"}]},
+            {"tools": [{"interface": "usb", "vid": "0x04D8", "name": "No PID", "backend": "genx"}]},
+            {"tools": {"interface": "usb"}},
+            {"edbg_products": {"edbg": {"id_channels": "8"}}},
+            {"serial_prefixes": {"BUR": "genx"}},
+            ["not", "an", "object"],
+        ]
+        for data in invalid:
+            with open(self.user_path, "w", encoding="utf-8") as user_file:
+                json.dump(data, user_file)
+            with self.assertLogs('pykitinfo.tools', level='WARNING'):
+                registry = load_registry(user_path=self.user_path)
+            self.assertIsNone(registry.lookup(INTERFACE_USB, MICROCHIP_VID, 0x9999))
+            self.assertEqual(registry.edbg_product("EDBG CMSIS-DAP")['id_channels'], 8)
+            self.assertEqual(registry.backends_for_serial("BUR1234"), ['genx', 'pk3'])
+
+    def test_legacy_lookup(self):
+        self.assertEqual(tools.lookup_tool(0x9036),
+                         {"VID": MICROCHIP_VID, "PID": 0x9036, "Name": "MPLAB® PICkit™ 5", "Serial port": True})
+        self.assertIsNone(tools.lookup_tool(0x0001))
+        self.assertIn(0x9036, [tool["PID"] for tool in tools.MICROCHIP_NON_HID_TOOLS])
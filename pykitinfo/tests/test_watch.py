@@ -0,0 +1,98 @@
+import time
+import unittest
+from mock import patch
+
+from pykitinfo.watch import KitWatcher, EVENT_ADDED, EVENT_REMOVED, RETRY_DELAY
+from pykitinfo.scan import BACKEND_EDBG
+
+
+def _hid_device(serial_number):
+    return {
+        'path': serial_number.encode(),
+        'vendor_id': 0x03EB,
+        'product_id': 0x2175,
+        'product_string': "nEDBG CMSIS-DAP",
+        'serial_number': serial_number,
+        'manufacturer_string': '',
+    }
+
+
+def _fake_scan_kits(context, serialnumber=None, max_workers=None):
+    return [{'usb': {'serial_number': device['serial_number']}} for device in context.hid_devices(BACKEND_EDBG)]
+
+
+@patch('serial.tools.list_ports.comports', return_value=[])
+@patch('libusb_package.find', side_effect=lambda **kwargs: iter([]))
+@patch('pykitinfo.watch.scan_kits', side_effect=_fake_scan_kits)
+class TestKitWatcher(unittest.TestCase):
+    """Tests for incremental updates of connected kits"""
+
+    def test_only_new_devices_are_probed(self, scan_kits_mock, _find_mock, _comports_mock):
+        watcher = KitWatcher()
+        with patch('hid.enumerate', return_value=[_hid_device('A'), _hid_device('B')]):
+            events = watcher.update()
+        self.assertEqual(sorted(kit['usb']['serial_number'] for event, kit in events if event == EVENT_ADDED),
+                         ['A', 'B'])
+
+        scan_kits_mock.reset_mock()
+        with patch('hid.enumerate', return_value=[_hid_device('B'), _hid_device('C')]):
+            events = watcher.update()
+        self.assertEqual(events, [(EVENT_REMOVED, {'usb': {'serial_number': 'A'}}),
+                                  (EVENT_ADDED, {'usb': {'serial_number': 'C'}})])
+        self.assertEqual(scan_kits_mock.call_count, 1)
+        self.assertEqual(sorted(kit['usb']['serial_number'] for kit in watcher.kits), ['B', 'C'])
+
+    def test_no_change_gives_no_events(self, scan_kits_mock, _find_mock, _comports_mock):
+        watcher = KitWatcher()
+        with patch('hid.enumerate', return_value=[_hid_device('A')]):
+            watcher.update()
+            scan_kits_mock.reset_mock()
+            self.assertEqual(watcher.update(), [])
+        scan_kits_mock.assert_not_called()
+
+    def test_device_without_kits_is_probed_again(self, scan_kits_mock, _find_mock, _comports_mock):
+        watcher = KitWatcher()
+        # The kit is busy in another application when attached
+        scan_kits_mock.side_effect = lambda context, **kwargs: []
+        with patch('hid.enumerate', return_value=[_hid_device('A')]):
+            self.assertEqual(watcher.update(), [])
+            # Not probed again before the retry delay has passed
+            self.assertEqual(watcher.update(), [])
+            self.assertEqual(scan_kits_mock.call_count, 1)
+            scan_kits_mock.side_effect = _fake_scan_kits
+            with patch('pykitinfo.watch.time.monotonic', return_value=time.monotonic() + RETRY_DELAY):
+                events = watcher.update()
+        self.assertEqual(events, [(EVENT_ADDED, {'usb': {'serial_number': 'A'}})])
+        self.assertEqual(scan_kits_mock.call_count, 2)
+
+    def test_extensions_of_detached_kits_are_dropped(self, scan_kits_mock, _find_mock, _comports_mock):
+        watcher = KitWatcher()
+        with patch('hid.enumerate', return_value=[_hid_device('A')]):
+            watcher.update()
+        self.assertIs(scan_kits_mock.call_args[0][0].extension_cache, watcher.extension_cache)
+        watcher.extension_cache.put('A', b'A', 1, None)
+        with patch('hid.enumerate', return_value=[]):
+            watcher.update()
+        self.assertEqual(watcher.extension_cache.get('A', b'A', [1]), {})
+
+    def test_devices_not_matching_the_serial_number_are_not_probed(self, scan_kits_mock, _find_mock, _comports_mock):
+        watcher = KitWatcher(serialnumber='A')
+        with patch('hid.enumerate', return_value=[_hid_device('A'), _hid_device('B')]):
+            events = watcher.update()
+            self.assertEqual(events, [(EVENT_ADDED, {'usb': {'serial_number': 'A'}})])
+            with patch('pykitinfo.watch.time.monotonic', return_value=time.monotonic() + RETRY_DELAY):
+                self.assertEqual(watcher.update(), [])
+        self.assertEqual(scan_kits_mock.call_count, 1)
+
+    def test_serial_ports_are_only_listed_when_probing(self, scan_kits_mock, _find_mock, comports_mock):
+        def scan_kits_listing_serial_ports(context, **kwargs):
+            context.serial_ports.find_port('A')
+            return _fake_scan_kits(context)
+
+        scan_kits_mock.side_effect = scan_kits_listing_serial_ports
+        watcher = KitWatcher()
+        with patch('hid.enumerate', return_value=[_hid_device('A'), _hid_device('B')]):
+            watcher.update()
+            self.assertEqual(comports_mock.call_count, 1)
+            watcher.update()
+        self.assertEqual(comports_mock.call_count, 1)
@@ -0,0 +1,6 @@
+"""
+USB transaction timeouts
+"""
+
+# Maximum time to wait for a single USB transaction with a GENx tool
+DEFAULT_TRANSACTION_TIMEOUT_MS = 1000
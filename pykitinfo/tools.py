@@ -1,194 +1,303 @@
 """
 Tools list and lookup.
+
+The supported tools are described in the tools.json data file in this package.  Each tool entry names the backend
+responsible for it and its capabilities:
+
+- interface: "usb" for tools found by libusb, "hid" for tools found by hidapi
+- vid, pid: USB vendor and product ID, as hex strings
+- product_string / product_substring: for HID tools matched by (part of) their USB product string instead of PID
+- name: tool name
+- backend: backend detector handling the tool
+- serial_port: the tool has a virtual serial port
+- config_area: kit information can be read from the tool's config area
+- bootloader: the tool is in bootloader mode
+
+The edbg_products section describes EDBG-based tools by the first word of their CMSIS-DAP product name: where the kit
+name is read from ("config_area", "get_config" or "product"), the number of extension ID channels and whether the
+tool has a virtual serial port.
+
+The serial_prefixes section maps the start of a USB serial number to the backends that tools with such serial numbers
+are usually handled by, so that a kit can be looked for where it is most likely to be found first.
+
+Tools can be added or changed without a new release by putting entries in the same format in a tools.json file in the
+user config directory, or in a file pointed to by the PYKITINFO_TOOLS environment variable.  These entries replace
+built-in entries with the same interface, VID and PID or product string.  A file with an invalid entry is ignored.
 """
+import os
+import json
+import threading
+from logging import getLogger
 
 MICROCHIP_VID = 0x04D8
+ATMEL_VID = 0x03EB
+
+MCP2221A_PID = 0x00DD
+
+TOOLS_FILENAME = "tools.json"
+TOOLS_ENVIRONMENT_VARIABLE = "PYKITINFO_TOOLS"
+
+INTERFACE_HID = 'hid'
+INTERFACE_USB = 'usb'
+
+# Capabilities of tools where not given in the data file
+TOOL_DEFAULTS = {
+    'serial_port': False,
+    'config_area': False,
+    'bootloader': False,
+    'id_channels': 0,
+}
+
+# Capabilities of EDBG-based tools not listed in the data file
+EDBG_PRODUCT_DEFAULTS = {
+    'kitname': 'product',
+    'id_channels': 0,
+    'serial_port': False,
+}
+
+# Types of the fields of tool and EDBG product entries, checked when loading the user's tools file
+TOOL_FIELD_TYPES = {
+    'interface': str,
+    'vid': str,
+    'pid': str,
+    'product_string': str,
+    'product_substring': str,
+    'name': str,
+    'backend': str,
+    'serial_port': bool,
+    'config_area': bool,
+    'bootloader': bool,
+    'id_channels': int,
+}
+EDBG_PRODUCT_FIELD_TYPES = {
+    'kitname': str,
+    'id_channels': int,
+    'serial_port': bool,
+}
+EDBG_KITNAME_SOURCES = ('config_area', 'get_config', 'product')
+
+
+class ToolRegistry():
+    """
+    Index of the supported tools
+
+    Tools are looked up by USB vendor and product ID, or by vendor ID and product string, in constant time.
+
+    :param data: tool descriptions in the tools.json format, later ones replacing entries of earlier ones
+    :type data: list of dict
+    """
+    def __init__(self, *data):
+        self._by_id = {}
+        self._by_product = {}
+        self._by_substring = {}
+        self._edbg_products = {}
+        self._serial_prefixes = {}
+        for tools in data:
+            self._add(tools)
+
+    @staticmethod
+    def _tool(entry):
+        tool = dict(TOOL_DEFAULTS)
+        tool.update(entry)
+        tool['vid'] = int(entry['vid'], 16)
+        if 'pid' in entry:
+            tool['pid'] = int(entry['pid'], 16)
+        return tool
+
+    def _add(self, data):
+        for entry in data.get('tools', []):
+            tool = self._tool(entry)
+            if 'pid' in tool:
+                self._by_id[(tool['interface'], tool['vid'], tool['pid'])] = tool
+            elif 'product_string' in tool:
+                self._by_product[(tool['interface'], tool['vid'], tool['product_string'])] = tool
+            elif 'product_substring' in tool:
+                self._by_substring.setdefault((tool['interface'], tool['vid']), {})[tool['product_substring']] = tool
+        for product, capabilities in data.get('edbg_products', {}).items():
+            edbg_product = dict(EDBG_PRODUCT_DEFAULTS)
+            edbg_product.update(capabilities)
+            self._edbg_products[product.lower()] = edbg_product
+        for prefix, backends in data.get('serial_prefixes', {}).items():
+            self._serial_prefixes[prefix.upper()] = list(backends)
+
+    def lookup(self, interface, vendor_id, product_id, product_string=None):
+        """
+        Find a tool
+
+        :param interface: INTERFACE_HID for devices enumerated by hidapi, INTERFACE_USB for devices found by libusb
+        :type interface: str
+        :param vendor_id: USB vendor ID
+        :type vendor_id: int
+        :param product_id: USB product ID
+        :type product_id: int
+        :param product_string: USB product string
+        :type product_string: str, optional
+        :return: tool entry, or None if the tool is not supported
+        :rtype: dict
+        """
+        tool = self._by_id.get((interface, vendor_id, product_id))
+        if tool is None and product_string:
+            tool = self._by_product.get((interface, vendor_id, product_string))
+            if tool is None:
+                substrings = self._by_substring.get((interface, vendor_id), {})
+                tool = next((tool for substring, tool in substrings.items() if substring in product_string), None)
+        return tool
+
+    def tools(self, interface=None):
+        """
+        Get all tools identified by USB product ID
+
+        :param interface: only get tools on this interface
+        :type interface: str, optional
+        :return: tool entries
+        :rtype: list of dict
+        """
+        return [tool for key, tool in self._by_id.items() if interface is None or key[0] == interface]
+
+    def edbg_product(self, product):
+        """
+        Find the capabilities of an EDBG-based tool
+
+        :param product: CMSIS-DAP product name of the tool, like "nEDBG CMSIS-DAP"
+        :type product: str
+        :return: kitname source, number of ID channels and serial port flag
+        :rtype: dict
+        """
+        words = product.lower().split()
+        return self._edbg_products.get(words[0] if words else '', EDBG_PRODUCT_DEFAULTS)
+
+    def backends_for_serial(self, serial_number):
+        """
+        Find the backends most likely to handle a tool, from the start of its serial number
+
+        :param serial_number: USB serial number, or the start of it
+        :type serial_number: str
+        :return: backend names, most likely first. Empty if the serial number gives no hint.
+        :rtype: list of str
+        """
+        serial_number = serial_number.upper()
+        for prefix in sorted(self._serial_prefixes, key=len, reverse=True):
+            if serial_number.startswith(prefix):
+                return list(self._serial_prefixes[prefix])
+        return []
+
+
+def _check_fields(where, entry, field_types):
+    if not isinstance(entry, dict):
+        raise ValueError("{} must be an object".format(where))
+    for name, value in entry.items():
+        expected = field_types.get(name)
+        # bool is a subclass of int, but not a valid count
+        if expected is not None and (not isinstance(value, expected) or (expected is int and isinstance(value, bool))):
+            raise ValueError("{}: '{}' must be of type {}".format(where, name, expected.__name__))
+
+
+def _check_tool(where, entry):
+    _check_fields(where, entry, TOOL_FIELD_TYPES)
+    for name in ('interface', 'vid', 'name', 'backend'):
+        if name not in entry:
+            raise ValueError("{}: '{}' is missing".format(where, name))
+    if entry['interface'] not in (INTERFACE_HID, INTERFACE_USB):
+        raise ValueError("{}: unknown interface '{}'".format(where, entry['interface']))
+    if not any(name in entry for name in ('pid', 'product_string', 'product_substring')):
+        raise ValueError("{}: one of 'pid', 'product_string' or 'product_substring' is needed".format(where))
+    for name in ('vid', 'pid'):
+        if name in entry:
+            try:
+                int(entry[name], 16)
+            except ValueError:
+                raise ValueError("{}: '{}' is not a hex number".format(where, name)) from None
+
+
+def _check_tools(data):
+    """
+    Check that tool descriptions are in the tools.json format, raising ValueError for the first invalid entry
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Tool descriptions must be an object")
+    tools = data.get('tools', [])
+    if not isinstance(tools, list):
+        raise ValueError("'tools' must be a list")
+    for index, entry in enumerate(tools):
+        _check_tool("tools[{}]".format(index), entry)
+    edbg_products = data.get('edbg_products', {})
+    _check_fields("edbg_products", edbg_products, {})
+    for product, capabilities in edbg_products.items():
+        where = "edbg_products['{}']".format(product)
+        _check_fields(where, capabilities, EDBG_PRODUCT_FIELD_TYPES)
+        if capabilities.get('kitname', 'product') not in EDBG_KITNAME_SOURCES:
+            raise ValueError("{}: unknown kitname source '{}'".format(where, capabilities['kitname']))
+    serial_prefixes = data.get('serial_prefixes', {})
+    _check_fields("serial_prefixes", serial_prefixes, {})
+    for prefix, backends in serial_prefixes.items():
+        if not isinstance(backends, list) or not all(isinstance(backend, str) for backend in backends):
+            raise ValueError("serial_prefixes['{}'] must be a list of backend names".format(prefix))
+
+
+def _user_tools_path():
+    path = os.environ.get(TOOLS_ENVIRONMENT_VARIABLE)
+    if path:
+        return path
+    # Imported here as it is only needed to locate the user file
+    from appdirs import user_config_dir # pylint: disable=import-outside-toplevel
+    return os.path.join(user_config_dir("pykitinfo", "Microchip"), TOOLS_FILENAME)
+
+
+def load_registry(user_path=None):
+    """
+    Load the tool registry from the built-in data file and the user's tools file
+
+    A user's tools file that can't be read or has an invalid entry is ignored with a warning, leaving the built-in
+    tools only.
+
+    :param user_path: path to the user's tools file, defaults to PYKITINFO_TOOLS or the user config directory
+    :type user_path: str, optional
+    :return: tool registry
+    :rtype: class:ToolRegistry
+    """
+    logger = getLogger(__name__)
+    with open(os.path.join(os.path.dirname(__file__), TOOLS_FILENAME), encoding="utf-8") as tools_file:
+        data = [json.load(tools_file)]
+    if user_path is None:
+        user_path = _user_tools_path()
+    if os.path.exists(user_path):
+        try:
+            with open(user_path, encoding="utf-8") as tools_file:
+                user_data = json.load(tools_file)
+            _check_tools(user_data)
+            data.append(user_data)
+            logger.debug("Loaded user tools from %s", user_path)
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring tools file %s: %s", user_path, exc)
+    return ToolRegistry(*data)
+
+
+_registry = None # pylint: disable=invalid-name
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Get the tool registry, loading it on first use
+
+    :return: tool registry
+    :rtype: class:ToolRegistry
+    """
+    global _registry # pylint: disable=global-statement
+    with _registry_lock:
+        if _registry is None:
+            _registry = load_registry()
+        return _registry
+
+
+def _legacy_tool(tool):
+    return {
+        "VID": tool['vid'],
+        "PID": tool['pid'],
+        "Name": tool['name'],
+        "Serial port": tool['serial_port']
+    }
 
-MICROCHIP_NON_HID_TOOLS = [
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x8109,
-                "Name": "MPLAB® PKoB4 In-Circuit Debugger",
-            },
-                        {
-                "VID": MICROCHIP_VID,
-                "PID": 0x810A,
-                "Name": "MPLAB® PKoB4 Bootloader",
-            },
-            {
-                # App FW Composite: Vendor + CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x810B,
-                "Name": "MPLAB® PKoB4 In-Circuit Debugger",
-                "Serial port": True
-            },
-            {
-                # App FW Composite: Vendor + MSC
-                "VID": MICROCHIP_VID,
-                "PID": 0x810C,
-                "Name": "MPLAB® PKoB4 In-Circuit Debugger",
-                "Serial port": False
-            },
-            {
-                # App FW Composite: Vendor + CDC + DGI
-                "VID": MICROCHIP_VID,
-                "PID": 0x810D,
-                "Name": "MPLAB® PKoB4 In-Circuit Debugger",
-                "Serial port": True
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9012,
-                "Name": "MPLAB® PICkit™4",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9013,
-                "Name": "MPLAB® PM4",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9015,
-                "Name": "MPLAB® ICD4",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9017,
-                "Name": "MPLAB® PICkit™4 Bootloader",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9018,
-                "Name": "MPLAB® Snap In-Circuit Debugger",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9019,
-                "Name": "MPLAB® Snap™ Bootloader",
-            },
-            {
-                #App FW Composite: Vendor_CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x901B,
-                "Name": "MPLAB® PICkit™4",
-                "Serial port": True
-            },
-            {
-                # Composite: Vendor + CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x901C,
-                "Name": "MPLAB® Snap In-Circuit Debugger",
-                "Serial port": True
-            },
-            {
-                #App FW Composite: Vendor_MSC
-                "VID": MICROCHIP_VID,
-                "PID": 0x901D,
-                "Name": "MPLAB® PICkit™4",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x901F,
-                "Name": "MPLAB® ICE4 Bootloader",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9020,
-                "Name": "MPLAB® ICE4",
-            },
-            {
-                # Composite: Vendor + CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x9021,
-                "Name": "MPLAB® ICE4",
-                "Serial port": True
-            },
-            {
-                # Composite: Vendor + MSC
-                "VID": MICROCHIP_VID,
-                "PID": 0x9022,
-                "Name": "MPLAB® ICE4",
-            },
-            {
-                # Composite: Vendor + CDC + DGI
-                "VID": MICROCHIP_VID,
-                "PID": 0x9023,
-                "Name": "MPLAB® ICE4",
-                "Serial port": True
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9024,
-                "Name": "MPLAB® ICE4 FX3 Trace Endpoint",
-            },
-            {
-                # Composite: Vendor + CDC + DGI
-                "VID": MICROCHIP_VID,
-                "PID": 0x9028,
-                "Name": "MPLAB® PICkit™4",
-                "Serial port": True
-            },
-            {
-                # Composite: Vendor + CDC + DGI
-                "VID": MICROCHIP_VID,
-                "PID": 0x9029,
-                "Name": "MPLAB® Snap In-Circuit Debugger",
-                "Serial port": True
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x902A,
-                "Name": "MPLAB® ICD4 Bootloader",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9035,
-                "Name": "MPLAB® PICkit™ 5 Bootloader",
-            },
-            {
-                "VID": MICROCHIP_VID,
-                "PID": 0x9036,
-                "Name": "MPLAB® PICkit™ 5",
-                "Serial port": True
-            },
-            {
-                # Vendor + CDC + DGI
-                "VID": MICROCHIP_VID,
-                "PID": 0x904C,
-                "Name": "MPLAB® PKoB4 CMSIS-DAP",
-                "Serial port": True
-            },
-            {# Vendor + CDC interfaces
-                "VID": MICROCHIP_VID,
-                "PID": 0x9055,
-                "Name": "MPLAB® PICkit™ Basic",
-                "Serial port": True
-            },
-            {#  Vendor + CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x90AC,
-                "Name": "MPLAB® PICkit Basic CMSIS-DAP",
-                "Serial port": True
-            },
-            {# Vendor + CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x90AF,
-                "Name": "MPLAB® PICkit™ 4 CMSIS-DAP",
-                "Serial port": True
-            },
-            {# Vendor + CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x90B0,
-                "Name": "MPLAB® PICkit™ 5 CMSIS-DAP",
-                "Serial port": True
-            },
-            {# Vendor + CDC
-                "VID": MICROCHIP_VID,
-                "PID": 0x90B1,
-                "Name": "MPLAB® Snap CMSIS-DAP",
-                "Serial port": True
-            },
-        ]
 
 def lookup_tool(product_id):
     """Lookup tool based on USB product ID
@@ -198,7 +307,12 @@ def lookup_tool(product_id):
     :return: If product was found, return dict with tool information.
     :rtype: dict if tool was found, otherwise None
     """
-    for tool in MICROCHIP_NON_HID_TOOLS:
-        if tool["PID"] == product_id:
-            return tool
-    return None
+    tool = get_registry().lookup(INTERFACE_USB, MICROCHIP_VID, product_id)
+    return _legacy_tool(tool) if tool else None
+
+
+def __getattr__(name):
+    # MICROCHIP_NON_HID_TOOLS is kept for compatibility, built from the registry
+    if name == "MICROCHIP_NON_HID_TOOLS":
+        return [_legacy_tool(tool) for tool in get_registry().tools(INTERFACE_USB) if tool['vid'] == MICROCHIP_VID]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
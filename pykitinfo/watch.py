@@ -0,0 +1,294 @@
+"""
+Hotplug watching of connected kits.
+
+The watcher keeps track of the devices on the USB bus and only probes devices that have been newly attached.  Attach
+and detach are detected through kernel uevents on Linux, with a polling fallback on other platforms.  Enumeration
+never opens a device, so kits in use by other applications are left alone between attach and detach.
+"""
+import sys
+import time
+import json
+import socket
+import select
+from collections.abc import Mapping
+from logging import getLogger
+from .scan import ScanContext, scan_kits, usb_serial_number
+from .tools import INTERFACE_HID, INTERFACE_USB
+from .cache import ExtensionCache
+
+# Netlink protocol for kernel uevents, not exported by the socket module
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast group of uevents sent by the kernel
+UEVENT_KERNEL_GROUP = 1
+# Subsystems that announce attach and detach of kits and their serial ports
+UEVENT_SUBSYSTEMS = [b'usb', b'hidraw', b'tty']
+
+DEFAULT_POLL_INTERVAL = 2.0
+# Time to let all interfaces and serial ports of a newly attached kit appear before probing it
+DEFAULT_SETTLE_TIME = 0.5
+# With hotplug events the bus is still rescanned this often, in case an event was missed
+RESCAN_INTERVAL = 60.0
+# Time before probing a device that gave no kits again, doubled on each failure up to RESCAN_INTERVAL
+RETRY_DELAY = 1.0
+
+EVENT_ADDED = 'added'
+EVENT_REMOVED = 'removed'
+
+
+def device_key(device):
+    """
+    Make a key identifying an attached device without talking to it
+
+    :param device: HID device as enumerated by hidapi or pyusb USB device
+    :return: key that is unique for each attached device
+    :rtype: tuple
+    """
+    if isinstance(device, Mapping):
+        return ('hid', device['path'])
+    return ('usb', device.bus, device.address)
+
+
+class PollingMonitor():
+    """
+    Hotplug monitor that reports a possible change at a fixed interval
+
+    :param interval: polling interval in seconds
+    :type interval: float
+    """
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+
+    def wait(self, timeout=None):
+        """
+        Wait until the USB bus may have changed
+
+        :param timeout: maximum time to wait in seconds, defaults to the polling interval
+        :type timeout: float, optional
+        :return: True if the USB bus may have changed
+        :rtype: bool
+        """
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        return True
+
+    def drain(self):
+        """Discard all pending events"""
+
+    def close(self):
+        """Release the monitor"""
+
+
+class UeventMonitor():
+    """
+    Hotplug monitor listening to kernel uevents over netlink (Linux only)
+
+    :raises OSError: if the netlink socket can't be opened
+    """
+    def __init__(self):
+        self.logger = getLogger(__name__)
+        # pylint: disable=no-member
+        self.socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        self.socket.bind((0, UEVENT_KERNEL_GROUP))
+
+    def _is_relevant(self, message):
+        fields = message.split(b'\0')
+        subsystem = next((field[len(b'SUBSYSTEM='):] for field in fields if field.startswith(b'SUBSYSTEM=')), None)
+        action = fields[0].split(b'@')[0]
+        return subsystem in UEVENT_SUBSYSTEMS and action in [b'add', b'remove']
+
+    def wait(self, timeout=None):
+        """
+        Wait for a USB attach or detach event
+
+        :param timeout: maximum time to wait in seconds, defaults to waiting forever
+        :type timeout: float, optional
+        :return: True if a USB device, HID device or serial port was attached or detached
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self.socket], [], [], remaining)
+            if not readable:
+                return False
+            if self._is_relevant(self.socket.recv(16384)):
+                return True
+
+    def drain(self):
+        """Discard all pending events"""
+        while select.select([self.socket], [], [], 0)[0]:
+            self.socket.recv(16384)
+
+    def close(self):
+        """Release the monitor"""
+        self.socket.close()
+
+
+def create_monitor(poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Create the best hotplug monitor available on this platform
+
+    :param poll_interval: polling interval in seconds, if polling has to be used
+    :type poll_interval: float
+    :return: uevent monitor on Linux, polling monitor elsewhere or if uevents are unavailable
+    """
+    logger = getLogger(__name__)
+    if sys.platform.startswith('linux'):
+        try:
+            return UeventMonitor()
+        except OSError as exc:
+            logger.info("Kernel uevents unavailable (%s), polling instead", exc)
+    return PollingMonitor(poll_interval)
+
+
+class KitWatcher():
+    """
+    Keeps track of connected kits, probing only devices that have been attached since the last update
+
+    :param serialnumber: (partial) serial number to use
+    :type serialnumber: str, optional
+    :param cache: cache of probed kit information, defaults to probing every new kit
+    :type cache: class:pykitinfo.cache.KitInfoCache, optional
+    :param probe: if False, kits are never opened and only USB properties and serial ports are reported
+    :type probe: bool, optional
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, serialnumber=None, cache=None, probe=True):
+        self.logger = getLogger(__name__)
+        self.serialnumber = serialnumber
+        self.cache = cache
+        self.probe = probe
+        # Extensions of the attached kits, dropped when they are detached
+        self.extension_cache = ExtensionCache()
+        # Kits found on each attached device, by device key
+        self._kits = {}
+        # Time of the next probe and the current delay of devices that gave no kits, for example because they were
+        # busy in another application, by device key
+        self._retries = {}
+        # Keys of the attached devices with a serial number not matching serialnumber, never probed
+        self._unmatched = set()
+
+    @property
+    def kits(self):
+        """
+        Currently connected kits
+
+        :return: kits and tools connected
+        :rtype: list of dictionaries
+        """
+        return [kit for kits in self._kits.values() for kit in kits]
+
+    def _matches(self, key, device):
+        """
+        Check if the serial number of a device ends in serialnumber
+
+        Devices with a serial number that can't be read are taken to match, so that they are probed and reported.
+        """
+        serial_number = device['serial_number'] if key[0] == 'hid' else usb_serial_number(device)
+        return serial_number is None or serial_number.endswith(self.serialnumber)
+
+    def update(self):
+        """
+        Enumerate the USB bus and probe newly attached devices
+
+        Devices that give no kits are probed again on later updates, waiting longer after each attempt.  Devices with
+        a serial number not matching serialnumber are left alone until they are detached.
+
+        :return: events, each a tuple of EVENT_ADDED or EVENT_REMOVED and the kit
+        :rtype: list of (str, dict) tuples
+        """
+        # Serial ports are only listed when a newly attached device needs them
+        context = ScanContext(cache=self.cache, probe=self.probe, extension_cache=self.extension_cache)
+        current = {device_key(device): (backend, device) for backend, device in context.routed_devices()}
+
+        events = []
+        for key in [key for key in self._kits if key not in current]:
+            for kit in self._kits.pop(key):
+                # Extensions are read again when the kit is reattached
+                self.extension_cache.invalidate(kit['usb']['serial_number'])
+                events.append((EVENT_REMOVED, kit))
+
+        for key in [key for key in self._retries if key not in current]:
+            del self._retries[key]
+        self._unmatched &= set(current)
+
+        now = time.monotonic()
+        for key, (_, device) in current.items():
+            if key in self._kits or key in self._unmatched or (key in self._retries and self._retries[key][0] > now):
+                continue
+            if self.serialnumber and not self._matches(key, device):
+                self._unmatched.add(key)
+                continue
+            # Probe each new device on its own, so that its kits can be removed when it is detached
+            device_context = context.device_context(INTERFACE_HID if key[0] == 'hid' else INTERFACE_USB, device)
+            kits = scan_kits(device_context, serialnumber=self.serialnumber, max_workers=1)
+            if not kits:
+                # Probe the device again later, in case it could not be connected to
+                delay = min(self._retries[key][1] * 2, RESCAN_INTERVAL) if key in self._retries else RETRY_DELAY
+                self._retries[key] = (time.monotonic() + delay, delay)
+                continue
+            self._retries.pop(key, None)
+            self._kits[key] = kits
+            events += [(EVENT_ADDED, kit) for kit in kits]
+
+        if self.cache is not None:
+            self.cache.save()
+        return events
+
+    def watch(self, monitor, settle_time=DEFAULT_SETTLE_TIME):
+        """
+        Watch for kits being attached and detached, forever
+
+        The currently connected kits are reported as added first.
+
+        :param monitor: hotplug monitor as made by create_monitor()
+        :param settle_time: time in seconds to wait after a hotplug event before probing
+        :type settle_time: float
+        :return: generator of events, each a tuple of EVENT_ADDED or EVENT_REMOVED and the kit
+        """
+        while True:
+            yield from self.update()
+            self.wait(monitor, settle_time)
+
+    def wait(self, monitor, settle_time=DEFAULT_SETTLE_TIME):
+        """
+        Wait until the USB bus may have changed, until a device that gave no kits is to be probed again, or until it
+        is time to rescan the bus in case an event was missed
+
+        :param monitor: hotplug monitor as made by create_monitor()
+        :param settle_time: time in seconds to wait after a hotplug event before returning
+        :type settle_time: float
+        """
+        timeout = RESCAN_INTERVAL
+        if self._retries:
+            timeout = max(0.0, min(timeout, min(retry_at for retry_at, _ in self._retries.values()) - time.monotonic()))
+        if monitor.wait(timeout):
+            # Let the kit finish enumerating, and coalesce the burst of events it causes
+            time.sleep(settle_time)
+            monitor.drain()
+
+
+def watch_kits(serialnumber=None, cache=None, probe=True, poll_interval=DEFAULT_POLL_INTERVAL, output=None):
+    """
+    Print attach and detach of kits as newline-delimited JSON, until interrupted
+
+    :param serialnumber: (partial) serial number to use
+    :type serialnumber: str, optional
+    :param cache: cache of probed kit information, defaults to probing every new kit
+    :type cache: class:pykitinfo.cache.KitInfoCache, optional
+    :param probe: if False, kits are never opened and only USB properties and serial ports are reported
+    :type probe: bool, optional
+    :param poll_interval: polling interval in seconds, if hotplug events are unavailable
+    :type poll_interval: float
+    :param output: stream to write events to, defaults to stdout
+    """
+    if output is None:
+        output = sys.stdout
+    monitor = create_monitor(poll_interval)
+    try:
+        for event, kit in KitWatcher(serialnumber=serialnumber, cache=cache, probe=probe).watch(monitor):
+            output.write(json.dumps({'event': event, 'kit': kit}, sort_keys=True, ensure_ascii=False) + '\n')
+            output.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.close()